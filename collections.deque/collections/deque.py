@@ -5,33 +5,62 @@ class deque:
             self.q = []
         else:
             self.q = list(iterable)
+        # Index of the leftmost item in self.q. Slots before it were
+        # freed by popleft(), and are compacted away lazily, which makes
+        # popleft() amortised O(1).
+        self.h = 0
 
     def popleft(self):
-        return self.q.pop(0)
+        if self.h >= len(self.q):
+            raise IndexError("pop from an empty deque")
+        a = self.q[self.h]
+        self.q[self.h] = None
+        self.h += 1
+        if self.h == len(self.q):
+            del self.q[:]
+            self.h = 0
+        elif self.h > 16 and self.h * 2 > len(self.q):
+            del self.q[:self.h]
+            self.h = 0
+        return a
 
     def popright(self):
-        return self.q.pop()
+        return self.pop()
 
     def pop(self):
-        return self.q.pop()
+        if self.h >= len(self.q):
+            raise IndexError("pop from an empty deque")
+        a = self.q.pop()
+        if self.h == len(self.q):
+            del self.q[:]
+            self.h = 0
+        return a
 
     def append(self, a):
         self.q.append(a)
 
     def appendleft(self, a):
-        self.q.insert(0, a)
+        if self.h:
+            self.h -= 1
+            self.q[self.h] = a
+        else:
+            self.q.insert(0, a)
+
+    def remove(self, a):
+        del self.q[self.q.index(a, self.h)]
 
     def extend(self, a):
         self.q.extend(a)
 
     def __len__(self):
-        return len(self.q)
+        return len(self.q) - self.h
 
     def __bool__(self):
-        return bool(self.q)
+        return len(self.q) > self.h
 
     def __iter__(self):
-        yield from self.q
+        for i in range(self.h, len(self.q)):
+            yield self.q[i]
 
     def __str__(self):
-        return 'deque({})'.format(self.q)
+        return 'deque({})'.format(self.q[self.h:])
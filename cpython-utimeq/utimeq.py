@@ -22,6 +22,9 @@ class utimeq:
     def __bool__(self):
         return bool(self.heap)
 
+    def __len__(self):
+        return len(self.heap)
+
     def push(self, time, obj, userdata):
         e = Entry(time, obj, userdata)
         heapq.heappush(self.heap, e)
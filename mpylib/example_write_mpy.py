@@ -1,12 +1,13 @@
 import mpylib
 import opcode
 import ulogging
+from ubytecode import Bytecode, get_opcode_ns
 
 
 ulogging.basicConfig(level=ulogging.DEBUG)
 
 opcode.config.MICROPY_OPT_CACHE_MAP_LOOKUP_IN_BYTECODE = 1
-op = mpylib.get_opcode_ns()
+op = get_opcode_ns()
 
 
 with open("testout.mpy", "wb") as f:
@@ -28,7 +29,7 @@ with open("testout.mpy", "wb") as f:
     co.co_lnotab = b'\x00\x00'
     co.co_cellvars = ()
 
-    bc = mpylib.Bytecode()
+    bc = Bytecode()
     bc.add(op.LOAD_NAME, "print")
     bc.load_int(-65)
     bc.add(op.LOAD_CONST_OBJ, "string")
@@ -38,11 +39,9 @@ with open("testout.mpy", "wb") as f:
     bc.add(op.RETURN_VALUE)
     co.co_code = bc.get_bc()
     co.co_names = bc.co_names
-    co.mpy_consts = bc.co_consts
+    co.co_consts = bc.mpy_consts
 
     co.co_name = "<module>"
     co.co_filename = "testmpy.py"
 
-    co.mpy_codeobjs = ()
-
     mpy.write_code(co)
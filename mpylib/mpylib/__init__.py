@@ -337,6 +337,123 @@ class MPYReader:
         return prel_sz
 
 
+# Opcodes with const table index argument
+_const_opcodes = (
+    upyopcodes.opmap["LOAD_CONST_OBJ"],
+    upyopcodes.opmap["MAKE_FUNCTION"], upyopcodes.opmap["MAKE_FUNCTION_DEFARGS"],
+    upyopcodes.opmap["MAKE_CLOSURE"], upyopcodes.opmap["MAKE_CLOSURE_DEFARGS"],
+)
+
+
+def _encode_uint(v, size=0):
+    # var_uint, padded to size bytes with leading 0x80 bytes (which decode
+    # as leading zero digits).
+    b = [v & 0x7f]
+    v >>= 7
+    while v or len(b) < size:
+        b.append(0x80 | v & 0x7f)
+        v >>= 7
+    b.reverse()
+    return bytes(b)
+
+
+def _decode_lnotab(tab):
+    # Returns ([(bc_offset, line_delta), ...], rest of tab from terminator).
+    # Entries which only advance bc offset (or split a big line delta) are
+    # merged.
+    res = []
+    i = bc = 0
+    while i < len(tab) and tab[i]:
+        b = tab[i]
+        if b & 0x80:
+            bc += b & 0xf
+            l = (b & 0x70) << 4 | tab[i + 1]
+            i += 2
+        else:
+            bc += b & 0x1f
+            l = b >> 5
+            i += 1
+        if res and res[-1][0] == bc:
+            res[-1] = (bc, res[-1][1] + l)
+        elif l:
+            res.append((bc, l))
+    return res, tab[i:]
+
+
+def _encode_lnotab(entries, rest):
+    res = bytearray()
+    prev = 0
+    for bc, l in entries:
+        b = bc - prev
+        prev = bc
+        while b > 31 or l > 3 and b > 15:
+            n = min(b, 31 if l <= 3 else 15)
+            res.append(n)
+            b -= n
+        while True:
+            if l <= 3:
+                res.append(b | l << 5)
+                break
+            n = min(l, 2047)
+            res.append(0x80 | n >> 4 & 0x70 | b)
+            res.append(n & 0xff)
+            b = 0
+            l -= n
+            if not l:
+                break
+    return bytes(res) + rest
+
+
+def _remap_consts(code, const_map):
+    # Returns (co_code, co_lnotab) with const table indexes in bytecode
+    # mapped with const_map. An index is encoded in as many bytes as
+    # before if it fits, otherwise following code moves, and jump offsets
+    # and line number info are adjusted.
+    bc = code.co_code
+    insns = []
+    moved = False
+    ip = 0
+    while ip < len(bc):
+        typ, sz = upyopcodes.mp_opcode_format(bc, ip)
+        opcode = bc[ip]
+        if typ == upyopcodes.MP_OPCODE_VAR_UINT and opcode in _const_opcodes:
+            i2, idx = upyopcodes.decode_varint(bc, ip + 1)
+            arg = _encode_uint(const_map[idx], i2 - ip - 1)
+            if len(arg) != i2 - ip - 1:
+                moved = True
+            insn = bytes((opcode,)) + arg + bc[i2:ip + sz]
+        else:
+            insn = bc[ip:ip + sz]
+        insns.append((ip, insn))
+        ip += sz
+    if not moved:
+        return b"".join(i[1] for i in insns), code.co_lnotab
+
+    # Old offset -> new offset
+    newpos = {}
+    pos = 0
+    for ip, insn in insns:
+        newpos[ip] = pos
+        pos += len(insn)
+    newpos[len(bc)] = pos
+
+    res = bytearray()
+    for ip, insn in insns:
+        opcode = insn[0]
+        if upyopcodes.mp_opcode_type(opcode)[0] == upyopcodes.MP_OPCODE_OFFSET:
+            # Offset is relative to the end of its 2 bytes
+            bias = 0 if opcode in upyopcodes.has_forward_offset else 0x8000
+            rel = (insn[1] | insn[2] << 8) - bias
+            rel = newpos[ip + 3 + rel] - newpos[ip] - 3 + bias
+            assert 0 <= rel <= 0xffff
+            insn = bytes((opcode, rel & 0xff, rel >> 8)) + insn[3:]
+        res += insn
+
+    entries, rest = _decode_lnotab(code.co_lnotab)
+    entries = [(newpos.get(bc, bc), l) for bc, l in entries]
+    return bytes(res), _encode_lnotab(entries, rest)
+
+
 class MPYWriter:
 
     def __init__(self, f):
@@ -398,34 +515,33 @@ class MPYWriter:
     def write_obj(self, o):
         if o is ...:
             self.f.write(b"e")
-        elif isinstance(o, str):
-            self.f.write(b"s")
+            return
+        if isinstance(o, str):
+            typ = b"s"
             o = o.encode()
-            self.write_uint(len(o))
-            self.f.write(o)
+        elif isinstance(o, bytes):
+            typ = b"b"
+        elif isinstance(o, int):
+            typ = b"i"
+            o = str(o).encode()
+        elif isinstance(o, float):
+            typ = b"f"
+            o = repr(o).encode()
         else:
-            assert 0
+            assert 0, o
+        self.f.write(typ)
+        self.write_uint(len(o))
+        self.f.write(o)
+
+    def write_names(self, code, buf):
+        self.write_qstr(code.co_name, buf)
+        self.write_qstr(code.co_filename, buf)
 
     def pack_prelude(self, code):
+        # Same as in-memory prelude, except that co_name and co_filename
+        # are written as strings instead of qstr ids.
         buf = uio.BytesIO()
-        self.write_uint(code.mpy_stacksize, buf)
-        self.write_uint(code.mpy_excstacksize, buf)
-        buf.write(bytes([code.co_flags, code.co_argcount, code.co_kwonlyargcount, code.mpy_def_pos_args]))
-
-        # Apparently, uPy's code_info_size includes the size of the field itself, but it's varlen field!!
-        # reported as https://github.com/micropython/micropython/issues/4378
-        self.write_uint(1 + 4 + len(code.co_lnotab), buf)
-
-        # co_name qstr, will be filled in on load
-        buf.writebin("<H", 0)
-        # co_filename qstr, will be filled in on load
-        buf.writebin("<H", 0)
-
-        buf.write(code.co_lnotab)
-
-        buf.write(bytes(code.mpy_cellvars))
-        buf.writebin("B", 0xff)
-
+        code.pack_prelude(buf, self.write_names)
         return buf
 
     def pack_code(self, code):
@@ -472,26 +588,61 @@ class MPYWriter:
 
 
     def write_code(self, code):
-        buf = self.pack_prelude(code)
-        # Header stores original in-memory bytecode len, not packed len
-        bc_len = len(buf.getvalue()) + len(code.co_code)
-        self.pack_bytecode(code, buf)
+        # Const table (co_consts) starts with argument names, followed by
+        # constant objects and code objects (for nested functions and
+        # classes), in any order. In .mpy file, code objects come after
+        # all constant objects, so bytecode is patched accordingly.
+        num_args = code.co_argcount + code.co_kwonlyargcount
+        consts = code.co_consts
+        objs = []
+        codeobjs = []
+        for c in consts[num_args:]:
+            if isinstance(c, CodeType):
+                codeobjs.append(c)
+            else:
+                objs.append(c)
+        const_map = None
+        if codeobjs:
+            const_map = list(range(num_args))
+            n_obj = n_code = 0
+            for c in consts[num_args:]:
+                if isinstance(c, CodeType):
+                    const_map.append(num_args + len(objs) + n_code)
+                    n_code += 1
+                else:
+                    const_map.append(num_args + n_obj)
+                    n_obj += 1
+
+        saved = code.co_code, code.co_lnotab
+        if const_map:
+            code.co_code, code.co_lnotab = _remap_consts(code, const_map)
+        try:
+            # Header stores original in-memory bytecode len (where co_name
+            # and co_filename take 2 bytes each), not packed len
+            buf = uio.BytesIO()
+            code.pack_prelude(buf, lambda code, buf: buf.write(b"\0\0\0\0"))
+            bc_len = len(buf.getvalue()) + len(code.co_code)
+
+            buf = self.pack_prelude(code)
+            self.pack_bytecode(code, buf)
+        finally:
+            code.co_code, code.co_lnotab = saved
 
         bc = buf.getvalue()
         # len << 2 | kind
         self.write_uint(bc_len << 2)
         self.f.write(bc)
 
-        self.write_qstr(code.co_name)
-        self.write_qstr(code.co_filename)
-
-        assert code.mpy_codeobjs == ()
-
-        self.write_uint(len(code.mpy_consts))
-        self.write_uint(len(code.mpy_codeobjs))
+        self.write_uint(len(objs))
+        self.write_uint(len(codeobjs))
 
-        for c in code.mpy_consts:
+        # Argument names are stored as qstrs
+        for c in consts[:num_args]:
+            self.write_qstr(c)
+        for c in objs:
             self.write_obj(c)
+        for c in codeobjs:
+            self.write_code(c)
 
 
 # Similar to "marshal.load(f)" to load codeobj from .pyc in CPython
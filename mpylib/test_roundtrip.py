@@ -0,0 +1,169 @@
+# Write code objects (including nested ones) with MPYWriter, load them back
+# with mpylib.load() and compare.
+import uio
+import opcode
+from opcode import upyopcodes
+import mpylib
+from ucodetype import CodeType
+from ubytecode import Bytecode, get_opcode_ns
+
+
+opcode.config.MICROPY_OPT_CACHE_MAP_LOOKUP_IN_BYTECODE = 1
+op = get_opcode_ns()
+
+
+def make_code(bc, name, nargs=0):
+    co = bc.get_codeobj()
+    co.co_name = name
+    co.co_filename = "test.py"
+    co.co_argcount = nargs
+    co.mpy_stacksize += nargs
+    return co
+
+
+def const_refs(co):
+    # Const table entries referenced by bytecode, in order
+    res = []
+    bc = co.co_code
+    ip = 0
+    while ip < len(bc):
+        typ, sz = upyopcodes.mp_opcode_format(bc, ip)
+        if bc[ip] in (op.LOAD_CONST_OBJ, op.MAKE_FUNCTION):
+            res.append(co.co_consts[upyopcodes.decode_varint(bc, ip + 1)[1]])
+        ip += sz
+    return res
+
+
+# def f(a, b):
+#     return "s"
+bc = Bytecode()
+bc.add_const("a")
+bc.add_const("b")
+bc.add(op.LOAD_CONST_OBJ, "s")
+bc.add(op.RETURN_VALUE)
+f = make_code(bc, "f", 2)
+
+# def g():
+#     return 1
+bc = Bytecode()
+bc.load_int(1)
+bc.add(op.RETURN_VALUE)
+g = make_code(bc, "g")
+
+# X = "x"; def f(...); Y = b"y"; def g(); Z = 123456789012345678901234567890
+# Compiler puts code objects in const table in order of appearance, while
+# .mpy stores them after all other constants.
+bc = Bytecode()
+bc.add(op.LOAD_CONST_OBJ, "x")
+bc.add(op.STORE_NAME, "X")
+bc.add(op.MAKE_FUNCTION, f)
+bc.add(op.STORE_NAME, "f")
+bc.add(op.LOAD_CONST_OBJ, b"y")
+bc.add(op.STORE_NAME, "Y")
+bc.add(op.MAKE_FUNCTION, g)
+bc.add(op.STORE_NAME, "g")
+bc.add(op.LOAD_CONST_OBJ, 123456789012345678901234567890)
+bc.add(op.STORE_NAME, "Z")
+bc.add(op.LOAD_CONST_NONE)
+bc.add(op.RETURN_VALUE)
+co = make_code(bc, "<module>")
+
+buf = uio.BytesIO()
+mpy = mpylib.MPYWriter(buf)
+mpy.write_header(
+    mpylib.MPY_VERSION,
+    mpylib.MICROPY_PY_BUILTINS_STR_UNICODE | mpylib.MICROPY_OPT_CACHE_MAP_LOOKUP_IN_BYTECODE,
+    31
+)
+mpy.write_code(co)
+
+co2 = mpylib.load(uio.BytesIO(buf.getvalue()))
+
+assert co2.co_name == "<module>"
+assert co2.co_filename == "test.py"
+assert list(co2.co_names) == ["X", "f", "Y", "g", "Z"], co2.co_names
+assert len(co2.co_code) == len(co.co_code)
+assert co2.mpy_consts == ("x", b"y", 123456789012345678901234567890), co2.mpy_consts
+assert len(co2.mpy_codeobjs) == 2
+
+f2, g2 = co2.mpy_codeobjs
+assert f2.co_name == "f"
+assert f2.co_argcount == 2
+assert f2.mpy_argnames == ("a", "b")
+assert f2.mpy_consts == ("s",)
+assert len(f2.co_code) == len(f.co_code)
+assert g2.co_name == "g"
+assert g2.co_consts == ()
+assert g2.co_code == g.co_code
+
+# Bytecode refers to the same constants after reordering
+refs = const_refs(co2)
+assert refs == ["x", f2, b"y", g2, 123456789012345678901234567890], refs
+assert const_refs(f2) == ["s"]
+
+
+def insns(co):
+    # [(offset, opcode, jump target offset or None), ...]
+    res = []
+    bc = co.co_code
+    ip = 0
+    while ip < len(bc):
+        typ, sz = upyopcodes.mp_opcode_format(bc, ip)
+        target = None
+        if typ == upyopcodes.MP_OPCODE_OFFSET:
+            target = bc[ip + 1] | bc[ip + 2] << 8
+            if bc[ip] not in upyopcodes.has_forward_offset:
+                target -= 0x8000
+            target += ip + 3
+        res.append((ip, bc[ip], target))
+        ip += sz
+    return res
+
+
+# Code object index 0 becomes 130 in .mpy, which takes 2 bytes instead of
+# 1, so code after it moves. Jumps across it and line number info are
+# adjusted.
+bc = Bytecode()
+top = bc.get_label()
+end = bc.get_label()
+bc.put_label(top)
+bc.add(op.LOAD_CONST_NONE)
+bc.jump(op.POP_JUMP_IF_TRUE, end)
+bc.add(op.MAKE_FUNCTION, g)
+bc.add(op.STORE_NAME, "g")
+strs = ["c%d" % i for i in range(130)]
+for c in strs:
+    bc.add(op.LOAD_CONST_OBJ, c)
+    bc.add(op.POP_TOP)
+bc.jump(op.JUMP, top)
+bc.put_label(end)
+bc.add(op.LOAD_CONST_NONE)
+bc.add(op.RETURN_VALUE)
+co = make_code(bc, "<module>")
+ins = insns(co)
+# Line 2 starts at STORE_NAME, line 3 at last LOAD_CONST_NONE
+lines = [(ins[3][0], 1), (ins[-2][0], 1)]
+co.co_lnotab = mpylib._encode_lnotab(lines, b"\0")
+
+buf = uio.BytesIO()
+mpy = mpylib.MPYWriter(buf)
+mpy.write_header(
+    mpylib.MPY_VERSION,
+    mpylib.MICROPY_PY_BUILTINS_STR_UNICODE | mpylib.MICROPY_OPT_CACHE_MAP_LOOKUP_IN_BYTECODE,
+    31
+)
+mpy.write_code(co)
+co2 = mpylib.load(uio.BytesIO(buf.getvalue()))
+
+assert len(co2.co_code) == len(co.co_code) + 1
+g2, = co2.mpy_codeobjs
+assert const_refs(co2) == [g2] + strs
+ins2 = insns(co2)
+assert [i[1] for i in ins2] == [i[1] for i in ins]
+assert ins2[1][2] == ins2[-2][0], ins2[1]
+assert ins2[-3][2] == 0, ins2[-3]
+assert mpylib._decode_lnotab(co2.co_lnotab) == ([(ins2[3][0], 1), (ins2[-2][0], 1)], b"\0")
+# Code object passed in is left as is
+assert insns(co) == ins
+
+print("OK")
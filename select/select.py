@@ -40,24 +40,41 @@ POLLPRI = 0x002
 # TODO: Get rid of all this dirtiness, move it on C side
 if ffilib.bitness > 32:
     # On x86_64, epoll_event is packed struct
-    epoll_event = "<IO"
+    epoll_event_pfx = "<"
+    epoll_event_flds = "IO"
+    epoll_event_nvals = 2
 elif struct.calcsize("IQ") == 12:
-    epoll_event = "IO"
+    epoll_event_pfx = ""
+    epoll_event_flds = "IOI"
+    epoll_event_nvals = 3
 else:
-    epoll_event = "QO"
+    epoll_event_pfx = ""
+    epoll_event_flds = "QOI"
+    epoll_event_nvals = 3
+# On 32-bit platforms, trailing dummy field pads format to the full size
+# of struct epoll_event, so arrays of events have proper stride.
+epoll_event = epoll_event_pfx + epoll_event_flds
+epoll_event_pad = (0,) * (epoll_event_nvals - 2)
+
 
 class Epoll:
 
     def __init__(self, epfd):
         self.epfd = epfd
-        self.evbuf = struct.pack(epoll_event, 0, None)
+        self.evbuf = struct.pack(epoll_event, 0, None, *epoll_event_pad)
+        self.evsize = len(self.evbuf)
+        # Event array for epoll_wait(), reused across calls and grown
+        # as needed.
+        self.evarr = bytearray()
+        # Cache of struct formats for unpacking n events in one go.
+        self.evfmts = {}
         self.registry = {}
 
     def register(self, fd, eventmask=EPOLLIN|EPOLLPRI|EPOLLOUT, retval=None):
         "retval is extension to stdlib, value to use in results from .poll()."
         if retval is None:
             retval = fd
-        s = struct.pack(epoll_event, eventmask, retval)
+        s = struct.pack(epoll_event, eventmask, retval, *epoll_event_pad)
         r = epoll_ctl(self.epfd, EPOLL_CTL_ADD, fd, s)
         if r == -1 and os.errno_() == errno.EEXIST:
             r = epoll_ctl(self.epfd, EPOLL_CTL_MOD, fd, s)
@@ -67,31 +84,53 @@ class Epoll:
         # reference later.
         self.registry[fd] = retval
 
+    def modify(self, fd, eventmask, retval=None):
+        if retval is None:
+            retval = fd
+        s = struct.pack(epoll_event, eventmask, retval, *epoll_event_pad)
+        r = epoll_ctl(self.epfd, EPOLL_CTL_MOD, fd, s)
+        os.check_error(r)
+        self.registry[fd] = retval
+
     def unregister(self, fd):
         # Pass dummy event structure, to workaround kernel bug
         r = epoll_ctl(self.epfd, EPOLL_CTL_DEL, fd, self.evbuf)
         os.check_error(r)
         del self.registry[fd]
 
-    def poll_ms(self, timeout=-1):
-        s = bytearray(self.evbuf)
+    def _wait(self, timeout, maxevents):
+        sz = maxevents * self.evsize
+        if len(self.evarr) < sz:
+            self.evarr = bytearray(sz)
         if timeout >= 0:
             deadline = utime.ticks_add(utime.ticks_ms(), timeout)
         while True:
-            n = epoll_wait(self.epfd, s, 1, timeout)
-            if not os.check_error(n):
+            n = epoll_wait(self.epfd, self.evarr, maxevents, timeout)
+            if not os.check_error(n, True):
                 break
             if timeout >= 0:
                 timeout = utime.ticks_diff(deadline, utime.ticks_ms())
                 if timeout < 0:
-                    n = 0
-                    break
+                    return ()
+        if not n:
+            return ()
+        fmt = self.evfmts.get(n)
+        if fmt is None:
+            fmt = self.evfmts[n] = epoll_event_pfx + epoll_event_flds * n
+        # Flat tuple of (events, retval, [pad,] events, retval, [pad,] ...)
+        return struct.unpack_from(fmt, self.evarr)
+
+    def poll_ms(self, timeout=-1, maxevents=1):
+        vals = self._wait(timeout, maxevents)
         res = []
-        if n > 0:
-            vals = struct.unpack(epoll_event, s)
-            res.append((vals[1], vals[0]))
+        for i in range(0, len(vals), epoll_event_nvals):
+            res.append((vals[i + 1], vals[i]))
         return res
 
+    def ready_ms(self, timeout=-1, maxevents=1):
+        "Extension to stdlib: like poll_ms(), but return just retvals, w/o event masks."
+        return self._wait(timeout, maxevents)[1::epoll_event_nvals]
+
     def poll(self, timeout=-1):
         return self.poll_ms(-1 if timeout == -1 else math.ceil(timeout * 1000))
 
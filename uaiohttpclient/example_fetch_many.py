@@ -0,0 +1,23 @@
+#
+# uaiohttpclient - fetch all URLs passed as command line arguments,
+# several at once.
+#
+import sys
+import uasyncio as asyncio
+import uaiohttpclient as aiohttp
+
+
+def on_done(url, status, headers, body):
+    if status is None:
+        print(url, "failed:", repr(body))
+    else:
+        print(url, status, len(body))
+
+
+def run(urls):
+    yield from aiohttp.fetch_many(urls, concurrency=8, timeout_ms=5000, cb=on_done)
+
+
+loop = asyncio.get_event_loop()
+loop.run_until_complete(run(sys.argv[1:]))
+loop.close()
@@ -45,7 +45,7 @@ class ChunkedClientResponse(ClientResponse):
         return "<ChunkedClientResponse %d %s>" % (self.status, self.headers)
 
 
-def request_raw(method, url):
+def _parse_url(url):
     try:
         proto, dummy, host, path = url.split("/", 3)
     except ValueError:
@@ -57,6 +57,11 @@ def request_raw(method, url):
     if ":" in host:
         host, port = host.split(":", 1)
         port = int(port)
+    return host, port, path
+
+
+def request_raw(method, url):
+    host, port, path = _parse_url(url)
     reader, writer = yield from asyncio.open_connection(host, port)
     # Use protocol 1.0, because 1.1 always allows to use chunked transfer-encoding
     # But explicitly set Connection: close, even though this should be default for 1.0,
@@ -108,3 +113,144 @@ def request(method, url):
     resp.status = status
     resp.headers = headers
     return resp
+
+
+def _fetch(conns, url, bufsize, method="GET"):
+    # GET (or other method) url over HTTP/1.1, reusing a keep-alive
+    # connection from conns if there's one for the host, and putting it
+    # back there afterwards if the server allows.
+    host, port, path = _parse_url(url)
+    key = (host, port)
+    conn = conns.pop(key, None)
+    query = ("%s /%s HTTP/1.1\r\nHost: %s\r\nUser-Agent: compat\r\n\r\n" % (method, path, host)).encode("latin-1")
+    while True:
+        reused = conn is not None
+        if not reused:
+            conn = yield from asyncio.open_connection(host, port, bufsize=bufsize)
+        reader, writer = conn
+        try:
+            yield from writer.awrite(query)
+            sline = yield from reader.readline()
+        except OSError:
+            if not reused:
+                yield from reader.aclose()
+                raise
+            sline = b""
+        except:
+            yield from reader.aclose()
+            raise
+        if sline or not reused:
+            break
+        # Server closed idle connection meanwhile, retry with a new one
+        yield from reader.aclose()
+        conn = None
+
+    try:
+        sline = sline.split(None, 2)
+        status = int(sline[1])
+        keep = sline[0] == b"HTTP/1.1"
+        headers = []
+        length = None
+        chunked = False
+        while True:
+            line = yield from reader.readline()
+            if not line or line == b"\r\n":
+                break
+            headers.append(line)
+            l = line.lower()
+            if l.startswith(b"content-length:"):
+                length = int(line[15:])
+            elif l.startswith(b"transfer-encoding:"):
+                chunked = b"chunked" in l
+            elif l.startswith(b"connection:") and b"close" in l:
+                keep = False
+
+        if method == "HEAD" or status in (204, 304) or status < 200:
+            # No body, regardless of headers
+            resp = None
+            body = b""
+        elif chunked:
+            resp = ChunkedClientResponse(reader)
+        elif length is not None:
+            resp = None
+            body = yield from reader.readexactly(length)
+        else:
+            # Body is delimited by connection close
+            resp = ClientResponse(reader)
+            keep = False
+        if resp:
+            body = []
+            while True:
+                data = yield from resp.read(4096)
+                if not data:
+                    break
+                body.append(data)
+            body = b"".join(body)
+    except:
+        yield from reader.aclose()
+        raise
+
+    if keep:
+        conns[key] = conn
+    else:
+        yield from reader.aclose()
+    return status, headers, body
+
+
+def fetch_many(urls, concurrency=4, timeout_ms=10000, cb=None, bufsize=1024, method="GET"):
+    """GET (or HEAD, etc. per method) all urls, running up to concurrency requests in parallel. Each
+    request has timeout_ms to complete. As each request completes,
+    cb(url, status, headers, body) is called, or cb(url, None, None, exc)
+    if it failed. Without cb, list of such tuples is returned (in order
+    of completion). Each of the worker coroutines keeps connections
+    alive for reuse by subsequent requests to the same host. If this
+    coroutine is cancelled (or times out), workers stop after their
+    current requests."""
+    if concurrency < 1:
+        raise ValueError("concurrency must be >= 1")
+    loop = asyncio.get_event_loop()
+    urls = iter(urls)
+    res = []
+    if cb is None:
+        cb = lambda *r: res.append(r)
+    # Number of workers running, and whether to stop
+    state = [concurrency, False]
+    # Task waiting for workers
+    waiters = [loop.cur_task]
+
+    def worker():
+        conns = {}
+        try:
+            # Iterator is shared, so each url is fetched by one worker
+            for url in urls:
+                if state[1]:
+                    break
+                try:
+                    r = yield from asyncio.wait_for_ms(_fetch(conns, url, bufsize, method), timeout_ms)
+                except asyncio.TimeoutError as e:
+                    cb(url, None, None, e)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    cb(url, None, None, e)
+                else:
+                    cb(url, *r)
+        finally:
+            for reader, writer in conns.values():
+                yield from reader.aclose()
+            state[0] -= 1
+            if not state[0]:
+                while waiters:
+                    t = waiters.pop()
+                    t.pend_throw(None)
+                    loop.call_soon(t)
+
+    for i in range(concurrency):
+        loop.create_task(worker())
+    # Woken up by the last worker finishing
+    try:
+        yield asyncio.Park(waiters)
+    except:
+        state[1] = True
+        raise
+    return res
@@ -50,6 +50,23 @@ def run_to():
         print("Coro #3 timed out")
         assert False
 
+    print("=================")
+
+    # Coro raising an exception disarms timeout, so it isn't thrown
+    # into what the task does next
+    try:
+        yield from asyncio.wait_for(failer(), delay(1))
+        assert False
+    except ValueError:
+        print("Coro #4 failed")
+    yield from asyncio.sleep(delay(2))
+    print("Slept past timeout of #4")
+
+
+def failer():
+    yield from asyncio.sleep(0)
+    raise ValueError
+
 
 loop = asyncio.get_event_loop()
 loop.run_until_complete(run_to())
@@ -17,6 +17,16 @@ def set_debug(val):
         _log = ulogging.getLogger("uasyncio.core")
 
 
+# Optional event loop statistics collector (see uasyncio.stats), None
+# if disabled. Unlike debug logging, intended to be cheap enough to be
+# enabled in production.
+_stats = None
+
+def set_stats(stats):
+    global _stats
+    _stats = stats
+
+
 class CancelledError(Exception):
     pass
 
@@ -29,7 +39,12 @@ class EventLoop:
 
     def __init__(self, runq_len=16, waitq_len=16):
         self.runq = ucollections.deque((), runq_len, True)
-        self.waitq = utimeq.utimeq(waitq_len)
+        if isinstance(waitq_len, int):
+            self.waitq = utimeq.utimeq(waitq_len)
+        else:
+            # Ready-made object with utimeq interface, e.g. TimeWheel
+            # from uasyncio.timewheel.
+            self.waitq = waitq_len
         # Current task being run. Task is a top-level coroutine scheduled
         # in the event loop (sub-coroutines executed transparently by
         # yield from/await, event loop "doesn't see" them).
@@ -89,10 +104,15 @@ class EventLoop:
 
                 if __debug__ and _DEBUG:
                     _log.debug("Moving from waitq to runq: %s", cur_task[1])
+                if _stats:
+                    # How late we are to run it
+                    _stats.lag(-delay)
                 self.call_soon(cur_task[1], *cur_task[2])
 
             # Process runq
             l = len(self.runq)
+            if _stats:
+                _stats.depth(l, len(self.waitq))
             if __debug__ and _DEBUG:
                 _log.debug("Entries in runq: %d", l)
             while l:
@@ -104,18 +124,31 @@ class EventLoop:
                     l -= 1
                     if __debug__ and _DEBUG:
                         _log.info("Next callback to run: %s", (cb, args))
-                    cb(*args)
+                    # Task may enable/disable stats, so use the same
+                    # object before and after running it.
+                    st = _stats
+                    if st:
+                        t0 = time.ticks_us()
+                        cb(*args)
+                        st.ran(cb, time.ticks_diff(time.ticks_us(), t0))
+                    else:
+                        cb(*args)
                     continue
 
                 if __debug__ and _DEBUG:
                     _log.info("Next coroutine to run: %s", (cb, args))
                 self.cur_task = cb
                 delay = 0
+                st = _stats
+                if st:
+                    t0 = time.ticks_us()
                 try:
                     if args is ():
                         ret = next(cb)
                     else:
                         ret = cb.send(*args)
+                    if st:
+                        st.ran(cb, time.ticks_diff(time.ticks_us(), t0))
                     if __debug__ and _DEBUG:
                         _log.info("Coroutine %s yield result: %s", cb, ret)
                     if isinstance(ret, SysCall1):
@@ -132,6 +165,9 @@ class EventLoop:
                             cb.pend_throw(arg)
                             self.add_writer(arg, cb)
                             continue
+                        elif isinstance(ret, Park):
+                            cb.pend_throw(ret)
+                            continue
                         elif isinstance(ret, IOReadDone):
                             self.remove_reader(arg)
                         elif isinstance(ret, IOWriteDone):
@@ -154,10 +190,14 @@ class EventLoop:
                     else:
                         assert False, "Unsupported coroutine yield value: %r (of type %r)" % (ret, type(ret))
                 except StopIteration as e:
+                    if st:
+                        st.ran(cb, time.ticks_diff(time.ticks_us(), t0))
                     if __debug__ and _DEBUG:
                         _log.debug("Coroutine finished: %s", cb)
                     continue
                 except CancelledError as e:
+                    if st:
+                        st.ran(cb, time.ticks_diff(time.ticks_us(), t0))
                     if __debug__ and _DEBUG:
                         _log.debug("Coroutine cancelled: %s", cb)
                     continue
@@ -224,6 +264,13 @@ class IOReadDone(SysCall1):
 class IOWriteDone(SysCall1):
     pass
 
+class Park(SysCall1):
+    # Like "yield False", the task isn't rescheduled, and is expected to
+    # be woken up with .pend_throw(None) and .call_soon(). arg is a
+    # container (with .remove()) of waiting tasks the task has added
+    # itself to, from which cancel()/wait_for_ms() remove it.
+    pass
+
 
 _event_loop = None
 _event_loop_class = EventLoop
@@ -266,17 +313,27 @@ _stop_iter = StopIteration()
 sleep_ms = SleepMs()
 
 
+def _unpark(coro, park):
+    try:
+        park.arg.remove(coro)
+    except ValueError:
+        pass
+    _event_loop.call_soon(coro)
+
+
 def cancel(coro):
     prev = coro.pend_throw(CancelledError())
     if prev is None:
         pass
+    elif isinstance(prev, Park):
+        _unpark(coro, prev)
     elif isinstance(prev, int):
         # utimeq id
         _event_loop.waitq.remove(prev)
         _event_loop.call_soon(coro)
     else:
         # stream obj
-        _event_loop.cancel_io(prev)
+        _event_loop.cancel_io(prev, coro)
         _event_loop.call_soon(coro)
 
 
@@ -288,11 +345,14 @@ class TimeoutObj:
 def wait_for_ms(coro, timeout):
 
     def waiter(coro, timeout_obj):
-        res = yield from coro
-        if __debug__ and _DEBUG:
-            _log.debug("waiter: cancelling %s", timeout_obj)
-        timeout_obj.coro = None
-        return res
+        # Disarm timeout however coro finishes, or it would be thrown
+        # into whatever the task runs next.
+        try:
+            return (yield from coro)
+        finally:
+            if __debug__ and _DEBUG:
+                _log.debug("waiter: cancelling %s", timeout_obj)
+            timeout_obj.coro = None
 
     def timeout_func(timeout_obj):
         if timeout_obj.coro:
@@ -302,11 +362,13 @@ def wait_for_ms(coro, timeout):
             #print("prev pend", prev)
             if prev is None:
                 pass
+            elif isinstance(prev, Park):
+                _unpark(timeout_obj.coro, prev)
             elif isinstance(prev, int):
                 _event_loop.waitq.remove(prev)
                 _event_loop.call_soon(timeout_obj.coro)
             else:
-                _event_loop.cancel_io(prev)
+                _event_loop.cancel_io(prev, timeout_obj.coro)
                 _event_loop.call_soon(timeout_obj.coro)
 
     timeout_obj = TimeoutObj(_event_loop.cur_task)
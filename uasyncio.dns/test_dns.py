@@ -0,0 +1,167 @@
+import ustruct as struct
+import uos
+import usocket
+import uasyncio
+import uasyncio.udp
+from uasyncio.dns import Resolver
+
+
+ADDR = ("127.0.0.1", 5354)
+HOSTS = "/tmp/uasyncio-dns-test-hosts"
+
+# name -> (list of IPv4 addresses, TTL); names not here get NXDOMAIN
+RECORDS = {
+    "a.example": ([b"\x0a\x00\x00\x01", b"\x0a\x00\x00\x02"], 60),
+    "b.example": ([b"\x0a\x00\x00\x03"], 0),
+    "slow.example": ([b"\x0a\x00\x00\x04"], 60),
+    "flaky.example": ([b"\x0a\x00\x00\x05"], 60),
+    "db1": ([b"\x0a\x00\x00\x06"], 60),
+}
+
+queries = []
+
+
+def qname(req):
+    parts = []
+    i = 12
+    while req[i]:
+        parts.append(str(req[i + 1:i + 1 + req[i]], "ascii"))
+        i += 1 + req[i]
+    return ".".join(parts), i + 5
+
+
+def make_resp(req, id=None):
+    name, qend = qname(req)
+    if id is None:
+        id = req[:2]
+    typ = struct.unpack(">H", req[qend - 4:qend - 2])[0]
+    rec = RECORDS.get(name)
+    rcode = 3 if rec is None else 0
+    answers = []
+    if rec and typ == 1:
+        for a in rec[0]:
+            answers.append(b"\xc0\x0c" + struct.pack(">HHIH", 1, 1, rec[1], len(a)) + a)
+    resp = id + struct.pack(">HHHHH", 0x8180 | rcode, 1, len(answers), 0, 0)
+    return resp + req[12:qend] + b"".join(answers)
+
+
+flaky_seen = []
+
+
+def handle(s, req, addr):
+    name = qname(req)[0]
+    queries.append(name)
+    if name == "slow.example":
+        # Reply after other queries, preceded by a reply with wrong ID
+        yield from uasyncio.sleep_ms(50)
+        yield from uasyncio.udp.sendto(s, make_resp(req, b"\xff\xff"), addr)
+    elif name == "flaky.example" and not flaky_seen:
+        # Drop first query, to test retry
+        flaky_seen.append(1)
+        return
+    yield from uasyncio.udp.sendto(s, make_resp(req), addr)
+
+
+def server(s):
+    loop = uasyncio.get_event_loop()
+    while True:
+        req, addr = yield from uasyncio.udp.recvfrom(s, 512)
+        loop.create_task(handle(s, req, addr))
+
+
+def resolve(r, name, res):
+    res.append((name, (yield from r.query(name))))
+
+
+def main():
+    r = Resolver("127.0.0.1", ADDR[1], timeout_ms=200, retries=1)
+
+    addrs = yield from r.query("a.example")
+    assert addrs == RECORDS["a.example"][0], addrs
+    # Served from cache
+    addrs = yield from r.query("a.example")
+    assert addrs == RECORDS["a.example"][0]
+    assert queries == ["a.example"], queries
+
+    # Concurrent queries, answered out of order
+    res = []
+    loop = uasyncio.get_event_loop()
+    loop.create_task(resolve(r, "slow.example", res))
+    loop.create_task(resolve(r, "b.example", res))
+    yield from uasyncio.sleep_ms(150)
+    assert res == [
+        ("b.example", RECORDS["b.example"][0]),
+        ("slow.example", RECORDS["slow.example"][0]),
+    ], res
+
+    # TTL 0 isn't cached
+    yield from r.query("b.example")
+    assert queries.count("b.example") == 2
+
+    # Negative caching
+    assert (yield from r.query("none.example")) == []
+    assert (yield from r.query("none.example")) == []
+    assert queries.count("none.example") == 1
+
+    # First query times out, retry succeeds
+    addrs = yield from r.query("flaky.example")
+    assert addrs == RECORDS["flaky.example"][0]
+    assert queries.count("flaky.example") == 2
+
+    ai = yield from r.getaddrinfo("a.example", 80, 0, usocket.SOCK_STREAM)
+    assert len(ai) == 2
+    assert ai[0][0] == usocket.AF_INET
+
+    # Name ending with a digit isn't mistaken for an address
+    ai = yield from r.getaddrinfo("db1", 80, usocket.AF_INET, usocket.SOCK_STREAM)
+    assert "db1" in queries
+    assert len(ai) == 1
+    # Address literals don't go to DNS
+    n = len(queries)
+    ai = yield from r.getaddrinfo("10.1.2.3", 80, 0, usocket.SOCK_STREAM)
+    assert len(ai) == 1
+    assert len(queries) == n
+    # Nonexistent name is an error (no fallback to blocking resolver)
+    try:
+        yield from r.getaddrinfo("none.example", 80)
+        assert False
+    except OSError:
+        pass
+
+    # Hosts file is used before DNS
+    with open(HOSTS, "w") as f:
+        f.write("# comment\n10.9.9.9  Local.Example  alias  # comment\n")
+    r2 = Resolver("127.0.0.1", ADDR[1], timeout_ms=200, retries=1, hosts=HOSTS)
+    n = len(queries)
+    for name in ("local.example", "alias"):
+        ai = yield from r2.getaddrinfo(name, 80, 0, usocket.SOCK_STREAM)
+        assert len(ai) == 1
+        assert ai[0][0] == usocket.AF_INET
+    assert len(queries) == n
+    ai = yield from r2.getaddrinfo("a.example", 80, 0, usocket.SOCK_STREAM)
+    assert len(ai) == 2
+    uos.remove(HOSTS)
+
+    # Cache size is capped
+    r2 = Resolver("127.0.0.1", ADDR[1], timeout_ms=200, retries=1, cache_size=2)
+    for name in ("a.example", "none.example", "db1", "other.example"):
+        yield from r2.query(name)
+        assert len(r2.cache) <= 2
+
+    # No server
+    r = Resolver("127.0.0.1", ADDR[1] + 1, timeout_ms=50, retries=1)
+    try:
+        yield from r.query("a.example")
+        assert False
+    except OSError:
+        pass
+
+
+s = uasyncio.udp.socket()
+s.setsockopt(usocket.SOL_SOCKET, usocket.SO_REUSEADDR, 1)
+s.bind(usocket.getaddrinfo(*ADDR)[0][-1])
+
+loop = uasyncio.get_event_loop()
+loop.create_task(server(s))
+loop.run_until_complete(main())
+print("OK")
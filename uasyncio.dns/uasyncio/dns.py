@@ -0,0 +1,197 @@
+# Non-blocking DNS resolver for uasyncio
+# (c) 2026 pycopy-lib contributors, MIT license
+#
+# Queries are sent over UDP with uasyncio.udp, so resolving a name doesn't
+# block the event loop. Each query uses its own socket (i.e. a random
+# source port) and a random transaction ID, and responses which don't
+# match the ID are ignored. Any number of queries can be in flight
+# concurrently. Results are cached for the TTL of the DNS records. Names
+# in the hosts file are resolved from it, without DNS.
+import uio
+import uerrno
+import usocket
+import urandom
+from utime import ticks_ms, ticks_add, ticks_diff
+import udnspkt
+from uasyncio import core
+from uasyncio import udp
+
+
+# Error code of usocket.getaddrinfo() for a name which doesn't resolve
+# (EAI_NONAME)
+EAI_NONAME = -2
+
+
+def _is_literal(host):
+    if ":" in host:
+        # IPv6 (possibly with a scope suffix, which inet_pton() rejects)
+        return True
+    try:
+        usocket.inet_pton(usocket.AF_INET, host)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def _hosts_lookup(fname, host):
+    # Addresses (as strings) of host in hosts file, in file order
+    res = []
+    host = host.lower()
+    try:
+        with open(fname) as f:
+            for l in f:
+                l = l.split("#", 1)[0].split()
+                if len(l) > 1 and host in (n.lower() for n in l[1:]):
+                    res.append(l[0])
+    except OSError:
+        pass
+    return res
+
+
+def _nameserver():
+    try:
+        with open("/etc/resolv.conf") as f:
+            for l in f:
+                l = l.split()
+                if len(l) > 1 and l[0] == "nameserver":
+                    return l[1]
+    except OSError:
+        pass
+    return "8.8.8.8"
+
+
+class Resolver:
+
+    def __init__(self, server=None, port=53, timeout_ms=1000, retries=2, neg_ttl=30,
+                 hosts="/etc/hosts", cache_size=64):
+        if server is None:
+            server = _nameserver()
+        # Server is a numeric address, so this doesn't block
+        ai = usocket.getaddrinfo(server, port, 0, usocket.SOCK_DGRAM)[0]
+        self.af = ai[0]
+        self.addr = ai[-1]
+        self.timeout_ms = timeout_ms
+        self.retries = retries
+        self.neg_ttl = neg_ttl
+        self.hosts = hosts
+        # (name, is_ipv6) -> (expiry_ms, [addr, ...]), at most cache_size
+        # entries
+        self.cache = {}
+        self.cache_size = cache_size
+
+    def _exchange(self, s, req, id, is_ipv6):
+        yield from udp.sendto(s, req, self.addr)
+        deadline = ticks_add(ticks_ms(), self.timeout_ms)
+        while True:
+            tmo = ticks_diff(deadline, ticks_ms())
+            if tmo <= 0:
+                raise core.TimeoutError
+            resp = yield from core.wait_for_ms(udp.recv(s, 512), tmo)
+            try:
+                rid, rcode, answers = udnspkt.parse_answers(uio.BytesIO(resp), is_ipv6)
+            except Exception:
+                # Malformed packet
+                continue
+            if rid == id:
+                return rcode, answers
+
+    def query(self, name, is_ipv6=False):
+        # Returns list of addresses (in binary form) for the name, empty
+        # if it doesn't exist or has no records of requested type.
+        key = (name, is_ipv6)
+        e = self.cache.get(key)
+        if e is not None:
+            if ticks_diff(e[0], ticks_ms()) > 0:
+                return e[1]
+            del self.cache[key]
+
+        s = udp.socket(self.af)
+        try:
+            for i in range(self.retries + 1):
+                id = urandom.getrandbits(16)
+                buf = uio.BytesIO(64)
+                udnspkt.make_req(buf, name, is_ipv6, id=id)
+                try:
+                    rcode, answers = yield from self._exchange(s, buf.getvalue(), id, is_ipv6)
+                    break
+                except core.TimeoutError:
+                    pass
+            else:
+                raise OSError(uerrno.ETIMEDOUT)
+        finally:
+            yield from udp.close(s)
+
+        if rcode not in (0, 3):
+            # Server failure, refused, etc. - not cached
+            raise OSError(uerrno.EIO)
+        if answers:
+            ttl = min(a[1] for a in answers)
+        else:
+            # Name doesn't exist (rcode 3), or has no such records
+            ttl = self.neg_ttl
+        res = [a[0] for a in answers]
+        self._cache_put(key, ttl, res)
+        return res
+
+    def _cache_put(self, key, ttl, res):
+        now = ticks_ms()
+        cache = self.cache
+        if key not in cache and len(cache) >= self.cache_size:
+            # Drop expired entries (including negative ones), and if it's
+            # still full, the entry expiring first.
+            for k, e in list(cache.items()):
+                if ticks_diff(e[0], now) <= 0:
+                    del cache[k]
+            if len(cache) >= self.cache_size:
+                del cache[min(cache, key=lambda k: ticks_diff(cache[k][0], now))]
+        cache[key] = (ticks_add(now, ttl * 1000), res)
+
+    def getaddrinfo(self, host, port, af=0, type=0):
+        # Numeric addresses don't need DNS, and neither do names in hosts
+        # file and "localhost" (resolved locally by the system resolver,
+        # if not in hosts file).
+        if _is_literal(host):
+            return usocket.getaddrinfo(host, port, af, type)
+        if self.hosts:
+            res = []
+            for a in _hosts_lookup(self.hosts, host):
+                a_af = usocket.AF_INET6 if ":" in a else usocket.AF_INET
+                if not af or af == a_af:
+                    res.extend(usocket.getaddrinfo(a, port, a_af, type))
+            if res:
+                return res
+        if host == "localhost":
+            return usocket.getaddrinfo(host, port, af, type)
+        addrs = []
+        if af != usocket.AF_INET6:
+            for a in (yield from self.query(host, False)):
+                addrs.append((usocket.AF_INET, a))
+        if not addrs and af != usocket.AF_INET:
+            for a in (yield from self.query(host, True)):
+                addrs.append((usocket.AF_INET6, a))
+        if not addrs:
+            # Not falling back to (blocking) system resolver
+            raise OSError(EAI_NONAME)
+        res = []
+        for af, a in addrs:
+            res.extend(usocket.getaddrinfo(usocket.inet_ntop(af, a), port, af, type))
+        return res
+
+
+_resolver = None
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = Resolver()
+    return _resolver
+
+
+def set_resolver(r):
+    global _resolver
+    _resolver = r
+
+
+def getaddrinfo(host, port, af=0, type=0):
+    return (yield from get_resolver().getaddrinfo(host, port, af, type))
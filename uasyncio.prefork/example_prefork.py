@@ -0,0 +1,12 @@
+# Run with: pycopy example_prefork.py
+# Then e.g.: ab -n10000 -c100 http://127.0.0.1:8081/
+import uasyncio.prefork
+
+
+def serve(reader, writer):
+    yield from reader.read(512)
+    yield from writer.awrite(b"HTTP/1.0 200 OK\r\n\r\nHello.\r\n")
+    yield from writer.aclose()
+
+
+uasyncio.prefork.serve_forever(serve, "127.0.0.1", 8081, workers=4, backlog=100)
@@ -0,0 +1,130 @@
+# Multi-process (prefork) server mode for uasyncio.
+#
+# Supervisor process forks a number of workers, each running its own
+# event loop with a listening socket bound with SO_REUSEPORT, so kernel
+# distributes incoming connections among them (and thus among CPU cores).
+# Workers which die unexpectedly are respawned. On SIGTERM/SIGINT to the
+# supervisor, workers are asked to stop (with SIGTERM): each stops
+# accepting new connections, waits up to "grace" seconds for connections
+# being served to finish, and exits.
+#
+# Event loop must not be created in the supervisor process before calling
+# serve_forever(), each worker creates its own.
+import os
+import utime
+import uerrno
+import signal
+import uasyncio
+from uasyncio import core
+
+
+DEBUG = 0
+log = None
+
+def set_debug(val):
+    global DEBUG, log
+    DEBUG = val
+    if val:
+        import ulogging
+        log = ulogging.getLogger("uasyncio.prefork")
+
+
+_stop = False
+_pids = {}
+
+
+def _on_term_worker(sig):
+    global _stop
+    _stop = True
+
+
+def _on_term_super(sig):
+    global _stop
+    _stop = True
+    for pid in list(_pids):
+        os.kill(pid, signal.SIGTERM)
+
+
+def _watch(server, active, grace):
+    # Signal handler can't do much besides setting a flag, so check it
+    # periodically.
+    while not _stop:
+        yield from core.sleep_ms(200)
+    if DEBUG and __debug__:
+        log.info("Worker %d: stopping, %d active connections", os.getpid(), active[0])
+    # Stop accepting new connections
+    core.cancel(server)
+    deadline = utime.ticks_add(utime.ticks_ms(), int(grace * 1000))
+    while active[0] and utime.ticks_diff(deadline, utime.ticks_ms()) > 0:
+        yield from core.sleep_ms(100)
+    core.get_event_loop().stop()
+
+
+def _worker(client_coro, host, port, grace, server_kw, loop_kw):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _on_term_worker)
+    _pids.clear()
+    active = [0]
+
+    def handler(reader, writer):
+        active[0] += 1
+        try:
+            yield from client_coro(reader, writer)
+        finally:
+            active[0] -= 1
+
+    loop = uasyncio.get_event_loop(**loop_kw)
+    server = uasyncio.start_server(handler, host, port, reuse_port=True, **server_kw)
+    loop.create_task(server)
+    loop.create_task(_watch(server, active, grace))
+    while True:
+        try:
+            loop.run_forever()
+            break
+        except OSError as e:
+            # Wait for I/O was interrupted by signal
+            if e.args[0] != uerrno.EINTR:
+                raise
+    loop.close()
+
+
+def _spawn(client_coro, host, port, grace, server_kw, loop_kw):
+    pid = os.fork()
+    if pid == 0:
+        st = 0
+        try:
+            _worker(client_coro, host, port, grace, server_kw, loop_kw)
+        except BaseException as e:
+            import sys
+            sys.print_exception(e)
+            st = 1
+        os._exit(st)
+    if DEBUG and __debug__:
+        log.info("Started worker %d", pid)
+    _pids[pid] = utime.ticks_ms()
+
+
+def serve_forever(client_coro, host, port, workers=2, grace=5, loop_kw={}, **server_kw):
+    # server_kw are passed to start_server() (backlog, ssl, bufsize,
+    # accept_batch), loop_kw - to get_event_loop() in workers.
+    signal.signal(signal.SIGTERM, _on_term_super)
+    signal.signal(signal.SIGINT, _on_term_super)
+    for i in range(workers):
+        _spawn(client_coro, host, port, grace, server_kw, loop_kw)
+    while _pids:
+        try:
+            pid, status = os.waitpid(-1, 0)
+        except OSError as e:
+            if e.args[0] == uerrno.EINTR:
+                continue
+            raise
+        started = _pids.pop(pid, None)
+        if started is None or _stop:
+            continue
+        if DEBUG and __debug__:
+            log.warning("Worker %d exited unexpectedly (status %d), respawning", pid, status)
+        # Don't busy-loop forking if worker dies right on start
+        if utime.ticks_diff(utime.ticks_ms(), started) < 1000:
+            utime.sleep(1)
+        if not _stop:
+            _spawn(client_coro, host, port, grace, server_kw, loop_kw)
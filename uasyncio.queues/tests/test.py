@@ -53,6 +53,89 @@ class QueueTestCase(TestCase):
         q.put_nowait(10)
         self.assertTrue(q.full())
 
+    def test_lifo(self):
+        q = queues.LifoQueue()
+        for n in range(3):
+            q.put_nowait(n)
+        self.assertEqual([q.get_nowait() for n in range(3)], [2, 1, 0])
+
+    def test_priority(self):
+        q = queues.PriorityQueue()
+        for n in (5, 1, 3, 2, 4):
+            q.put_nowait((n, str(n)))
+        self.assertEqual([q.get_nowait()[0] for n in range(5)], [1, 2, 3, 4, 5])
+
+    def test_get_many(self):
+        q = queues.Queue()
+        for n in range(5):
+            q.put_nowait(n)
+        self.assertEqual(self._val(q.get_many(3)), [0, 1, 2])
+        self.assertEqual(self._val(q.get_many(10)), [3, 4])
+        self.assertTrue(q.empty())
+
+    def test_handoff(self):
+        from uasyncio import core
+        loop = core.get_event_loop()
+        q = queues.Queue(maxsize=1)
+        res = []
+
+        def consumer():
+            for i in range(3):
+                res.append((yield from q.get()))
+
+        def producer():
+            for i in range(3):
+                yield from q.put(i)
+
+        loop.create_task(consumer())
+        loop.run_until_complete(producer())
+        loop.run_until_complete(core.sleep(0))
+        self.assertEqual(res, [0, 1, 2])
+
+    def test_get_timeout(self):
+        from uasyncio import core
+        loop = core.get_event_loop()
+        q = queues.Queue()
+        res = []
+
+        def getter():
+            try:
+                yield from core.wait_for_ms(q.get(), 50)
+            except core.TimeoutError:
+                res.append("timeout")
+
+        loop.run_until_complete(getter())
+        self.assertEqual(res, ["timeout"])
+        self.assertFalse(q._getters)
+        # Queue still works after that
+        q.put_nowait(1)
+        self.assertEqual(self._val(q.get()), 1)
+
+    def test_put_cancel(self):
+        from uasyncio import core
+        loop = core.get_event_loop()
+        q = queues.Queue(maxsize=1)
+        q.put_nowait(0)
+        res = []
+
+        def putter():
+            try:
+                yield from q.put(1)
+            except core.CancelledError:
+                res.append("cancelled")
+                raise
+
+        t = putter()
+        loop.create_task(t)
+        loop.run_until_complete(core.sleep_ms(10))
+        self.assertEqual(len(q._putters), 1)
+        core.cancel(t)
+        loop.run_until_complete(core.sleep_ms(10))
+        self.assertEqual(res, ["cancelled"])
+        self.assertFalse(q._putters)
+        self.assertEqual(q.get_nowait(), 0)
+        self.assertTrue(q.empty())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,6 @@
 from collections.deque import deque
-from uasyncio.core import sleep
+import heapq
+from uasyncio import core
 
 
 class QueueEmpty(Exception):
@@ -20,16 +21,43 @@ class Queue:
     Unlike the standard library Queue, you can reliably know this Queue's size
     with qsize(), since your single-threaded uasyncio application won't be
     interrupted between calling qsize() and doing an operation on the Queue.
+
+    Coroutines waiting in get() (or put()) don't poll the queue, but are
+    parked in a waiter list, and rescheduled when an item (or a free slot)
+    becomes available.
     """
-    _attempt_delay = 0.1
 
     def __init__(self, maxsize=0):
         self.maxsize = maxsize
+        self._init()
+        self._getters = deque()
+        self._putters = deque()
+
+    def _init(self):
         self._queue = deque()
 
     def _get(self):
         return self._queue.popleft()
 
+    def _wakeup(self, waiters):
+        if waiters:
+            t = waiters.popleft()
+            # Clear pending Park syscall
+            t.pend_throw(None)
+            core.get_event_loop().call_soon(t)
+
+    def _wait(self, waiters):
+        waiters.append(core.get_event_loop().cur_task)
+        try:
+            # Don't reschedule, we'll be woken up by _wakeup(), or removed
+            # from waiters on cancellation/timeout.
+            yield core.Park(waiters)
+        except:
+            # If we were woken up, but got an exception (e.g. were
+            # cancelled), pass the wakeup to the next waiter.
+            self._wakeup(waiters)
+            raise
+
     def get(self):
         """Returns generator, which can be used for getting (and removing)
         an item from a queue.
@@ -39,8 +67,28 @@ class Queue:
             item = yield from queue.get()
         """
         while not self._queue:
-            yield from sleep(self._attempt_delay)
-        return self._get()
+            yield from self._wait(self._getters)
+        val = self._get()
+        self._wakeup(self._putters)
+        return val
+
+    def get_many(self, n):
+        """Returns generator, which can be used for getting (and removing)
+        up to n items from a queue at once, as a list. Waits only until
+        at least one item is available.
+
+        Usage::
+
+            items = yield from queue.get_many(16)
+        """
+        while not self._queue:
+            yield from self._wait(self._getters)
+        res = []
+        while self._queue and n:
+            res.append(self._get())
+            self._wakeup(self._putters)
+            n -= 1
+        return res
 
     def get_nowait(self):
         """Remove and return an item from the queue.
@@ -49,7 +97,9 @@ class Queue:
         """
         if not self._queue:
             raise QueueEmpty()
-        return self._get()
+        val = self._get()
+        self._wakeup(self._putters)
+        return val
 
     def _put(self, val):
         self._queue.append(val)
@@ -62,8 +112,9 @@ class Queue:
             yield from queue.put(item)
         """
         while self.qsize() >= self.maxsize and self.maxsize:
-            yield from sleep(self._attempt_delay)
+            yield from self._wait(self._putters)
         self._put(val)
+        self._wakeup(self._getters)
 
     def put_nowait(self, val):
         """Put an item into the queue without blocking.
@@ -73,6 +124,7 @@ class Queue:
         if self.qsize() >= self.maxsize and self.maxsize:
             raise QueueFull()
         self._put(val)
+        self._wakeup(self._getters)
 
     def qsize(self):
         """Number of items in the queue."""
@@ -92,3 +144,26 @@ class Queue:
             return False
         else:
             return self.qsize() >= self.maxsize
+
+
+class LifoQueue(Queue):
+    """A subclass of Queue; retrieves most recently added entries first."""
+
+    def _get(self):
+        return self._queue.pop()
+
+
+class PriorityQueue(Queue):
+    """A subclass of Queue; retrieves entries in priority order (lowest first).
+
+    Entries are typically tuples of the form: (priority number, data).
+    """
+
+    def _init(self):
+        self._queue = []
+
+    def _put(self, val):
+        heapq.heappush(self._queue, val)
+
+    def _get(self):
+        return heapq.heappop(self._queue)
@@ -0,0 +1,56 @@
+import uasyncio.core as asyncio
+import uasyncio.stats
+
+
+stats = uasyncio.stats.enable(slow_us=20000)
+loop = asyncio.get_event_loop()
+
+
+def sleeper():
+    for i in range(5):
+        yield from asyncio.sleep_ms(10)
+
+
+def hog():
+    import utime
+    # Block event loop for a while
+    utime.sleep_ms(30)
+    yield
+
+
+def cb():
+    pass
+
+
+def main():
+    yield from asyncio.sleep_ms(200)
+
+
+loop.call_soon(cb)
+loop.create_task(hog())
+loop.create_task(sleeper())
+loop.run_until_complete(main())
+uasyncio.stats.disable()
+
+d = stats.as_dict()
+print(stats.dumps())
+assert d["tasks"]["sleeper"]["runs"] == 6, d["tasks"]
+assert d["tasks"]["cb"]["runs"] == 1
+assert d["tasks"]["hog"]["max_us"] >= 30000
+assert d["slow_cnt"] >= 1
+assert d["slow"][0]["name"] == "hog"
+# 5 sleeps in sleeper() and one in main()
+assert sum(d["lag_ms"].values()) == 6
+assert d["lag_max_ms"] >= 0
+assert d["runq_max"] >= 2
+
+# Per-instance keys (like generators of short-lived tasks) are folded by
+# name, so stats don't grow unbounded
+stats = uasyncio.stats.LoopStats()
+for i in range(uasyncio.stats.MAX_KEYS * 3):
+    stats.ran(sleeper(), 10 + i)
+assert len(stats.tasks) <= uasyncio.stats.MAX_KEYS
+t = stats.as_dict()["tasks"]["sleeper"]
+assert t["runs"] == uasyncio.stats.MAX_KEYS * 3, t
+assert t["max_us"] == 10 + uasyncio.stats.MAX_KEYS * 3 - 1
+print("OK")
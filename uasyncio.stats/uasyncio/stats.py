@@ -0,0 +1,173 @@
+# Event loop statistics for uasyncio.
+#
+# Usage:
+#
+#     import uasyncio.stats
+#     stats = uasyncio.stats.enable(slow_us=20000)
+#     ...
+#     print(stats.dumps())
+#
+# Collected are:
+# - per coroutine/callback (by function name): number of runs and total
+#   and maximal time of a single run, in microseconds. Internally, these
+#   are keyed by callback or generator code object (or generator object,
+#   if code object isn't available), names are formatted only on report;
+# - loop lag: histogram of how late (in ms) entries from waitq (sleeps,
+#   call_later(), timeouts) were moved to runq vs their scheduled time;
+# - high-water marks of runq and waitq lengths;
+# - slow callbacks: runs which took longer than slow_us; their number
+#   and last few of them are recorded, and optionally logged.
+from uasyncio import core
+
+
+# Upper bounds of lag histogram buckets, ms. Last bucket is for anything
+# larger.
+LAG_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+# Max number of keys in LoopStats.tasks before they're folded by name
+# (keys may be e.g. per-connection generator objects).
+MAX_KEYS = 64
+
+
+def _key(cb):
+    try:
+        return cb.gi_code
+    except AttributeError:
+        return cb
+
+
+def _name(cb):
+    try:
+        return cb.__name__
+    except AttributeError:
+        pass
+    try:
+        return cb.co_name
+    except AttributeError:
+        pass
+    # Generator object: <generator object 'name' at 0x...>
+    r = repr(cb)
+    i = r.find("'")
+    if i >= 0:
+        j = r.find("'", i + 1)
+        return r[i + 1:j]
+    return r
+
+
+def _merge(d, name, st):
+    acc = d.get(name)
+    if acc is None:
+        d[name] = list(st)
+    else:
+        acc[0] += st[0]
+        acc[1] += st[1]
+        if st[2] > acc[2]:
+            acc[2] = st[2]
+
+
+class LoopStats:
+
+    def __init__(self, slow_us=0, log_slow=False, keep_slow=8):
+        self.slow_us = slow_us
+        self.log_slow = log_slow
+        self.keep_slow = keep_slow
+        self.reset()
+
+    def reset(self):
+        # key -> [runs, total_us, max_us]
+        self.tasks = {}
+        # Same, by name, for keys folded away
+        self.named = {}
+        self.lag_hist = [0] * (len(LAG_BUCKETS) + 1)
+        self.lag_max = 0
+        self.runq_max = 0
+        self.waitq_max = 0
+        self.slow_cnt = 0
+        self.slow = []
+
+    # Hooks called by event loop
+
+    def ran(self, cb, us):
+        key = _key(cb)
+        st = self.tasks.get(key)
+        if st is None:
+            if len(self.tasks) >= MAX_KEYS:
+                self._fold()
+            self.tasks[key] = [1, us, us]
+        else:
+            st[0] += 1
+            st[1] += us
+            if us > st[2]:
+                st[2] = us
+        if self.slow_us and us > self.slow_us:
+            self.slow_cnt += 1
+            if len(self.slow) >= self.keep_slow:
+                self.slow.pop(0)
+            self.slow.append((key, us))
+            if self.log_slow:
+                import ulogging
+                ulogging.getLogger("uasyncio.stats").warning("Slow callback %s: %dus", _name(key), us)
+
+    def _fold(self):
+        for key, st in self.tasks.items():
+            _merge(self.named, _name(key), st)
+        self.tasks = {}
+
+    def lag(self, ms):
+        i = 0
+        for b in LAG_BUCKETS:
+            if ms <= b:
+                break
+            i += 1
+        self.lag_hist[i] += 1
+        if ms > self.lag_max:
+            self.lag_max = ms
+
+    def depth(self, runq, waitq):
+        if runq > self.runq_max:
+            self.runq_max = runq
+        if waitq > self.waitq_max:
+            self.waitq_max = waitq
+
+    # Querying
+
+    def as_dict(self):
+        by_name = {}
+        for name, st in self.named.items():
+            _merge(by_name, name, st)
+        for key, st in self.tasks.items():
+            _merge(by_name, _name(key), st)
+        tasks = {}
+        for name, st in by_name.items():
+            tasks[name] = {"runs": st[0], "total_us": st[1], "max_us": st[2]}
+        lag = {}
+        for i in range(len(LAG_BUCKETS)):
+            lag["<=%d" % LAG_BUCKETS[i]] = self.lag_hist[i]
+        lag[">%d" % LAG_BUCKETS[-1]] = self.lag_hist[-1]
+        return {
+            "tasks": tasks,
+            "lag_ms": lag,
+            "lag_max_ms": self.lag_max,
+            "runq_max": self.runq_max,
+            "waitq_max": self.waitq_max,
+            "slow_cnt": self.slow_cnt,
+            "slow": [{"name": _name(k), "us": us} for k, us in self.slow],
+        }
+
+    def dumps(self):
+        import ujson
+        return ujson.dumps(self.as_dict())
+
+    def dump(self, f):
+        f.write(self.dumps())
+
+
+def enable(slow_us=0, log_slow=False):
+    stats = LoopStats(slow_us, log_slow)
+    core.set_stats(stats)
+    return stats
+
+
+def disable():
+    core.set_stats(None)
@@ -0,0 +1,32 @@
+# Bounded-concurrency fan-out: run many jobs, but no more than LIMIT
+# at the same time.
+try:
+    import uasyncio.core as asyncio
+    from uasyncio.synchro import Semaphore
+except ImportError:
+    import asyncio
+    from asyncio import Semaphore
+
+
+LIMIT = 4
+
+
+def job(i, sem):
+    yield from sem.acquire()
+    try:
+        print("Job", i, "started")
+        yield from asyncio.sleep(0.2)
+        print("Job", i, "done")
+    finally:
+        sem.release()
+
+
+def main():
+    sem = Semaphore(LIMIT)
+    for i in range(16):
+        loop.create_task(job(i, sem))
+    yield from asyncio.sleep(1)
+
+
+loop = asyncio.get_event_loop()
+loop.run_until_complete(main())
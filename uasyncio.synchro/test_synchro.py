@@ -0,0 +1,179 @@
+import uasyncio.core as asyncio
+from uasyncio.synchro import Lock, Event, Semaphore, BoundedSemaphore, Condition
+
+
+loop = asyncio.get_event_loop()
+log = []
+
+
+# Lock is handed off to waiters in FIFO order
+def locker(i, lock):
+    for n in range(2):
+        yield from lock.acquire()
+        log.append(i)
+        yield from asyncio.sleep_ms(10)
+        lock.release()
+
+def run_lock():
+    lock = Lock()
+    for i in range(3):
+        loop.create_task(locker(i, lock))
+    yield from asyncio.sleep_ms(100)
+    assert not lock.locked
+
+loop.run_until_complete(run_lock())
+assert log == [0, 1, 2, 0, 1, 2], log
+
+
+# Semaphore limits concurrency
+active = 0
+max_active = 0
+
+def worker(sem):
+    global active, max_active
+    yield from sem.acquire()
+    active += 1
+    max_active = max(max_active, active)
+    yield from asyncio.sleep_ms(10)
+    active -= 1
+    sem.release()
+    log.append("w")
+
+def run_sem():
+    sem = BoundedSemaphore(3)
+    for i in range(10):
+        loop.create_task(worker(sem))
+    while len(log) < 10:
+        yield from asyncio.sleep_ms(10)
+    assert sem.value == 3
+    try:
+        sem.release()
+        assert False
+    except ValueError:
+        pass
+
+log = []
+loop.run_until_complete(run_sem())
+assert max_active == 3, max_active
+
+
+# Event wakes up all waiters
+def waiter(ev):
+    yield from ev.wait()
+    log.append("woken")
+
+def run_event():
+    ev = Event()
+    for i in range(3):
+        loop.create_task(waiter(ev))
+    yield from asyncio.sleep_ms(10)
+    assert log == []
+    ev.set()
+    yield from asyncio.sleep_ms(10)
+    assert log == ["woken"] * 3
+
+log = []
+loop.run_until_complete(run_event())
+
+
+# Condition
+items = []
+
+def consumer(cond):
+    yield from cond.acquire()
+    try:
+        yield from cond.wait_for(lambda: items)
+        log.append(items.pop(0))
+    finally:
+        cond.release()
+
+def run_cond():
+    cond = Condition()
+    for i in range(2):
+        loop.create_task(consumer(cond))
+    yield from asyncio.sleep_ms(10)
+    for i in range(2):
+        yield from cond.acquire()
+        items.append(i)
+        cond.notify()
+        cond.release()
+    yield from asyncio.sleep_ms(10)
+    assert log == [0, 1], log
+
+log = []
+loop.run_until_complete(run_cond())
+
+
+# Waits time out and can be cancelled, without taking the resource
+def holder(lock):
+    yield from lock.acquire()
+    yield from asyncio.sleep_ms(50)
+    lock.release()
+
+def run_timeout():
+    lock = Lock()
+    loop.create_task(holder(lock))
+    yield from asyncio.sleep_ms(0)
+    try:
+        yield from asyncio.wait_for_ms(lock.acquire(), 10)
+        assert False
+    except asyncio.TimeoutError:
+        pass
+    assert not lock.wlist
+    t = locker("c", lock)
+    loop.create_task(t)
+    yield from asyncio.sleep_ms(10)
+    asyncio.cancel(t)
+    yield from asyncio.sleep_ms(10)
+    assert not lock.wlist
+    yield from asyncio.sleep_ms(50)
+    assert not lock.locked
+    ev = Event()
+    try:
+        yield from asyncio.wait_for_ms(ev.wait(), 10)
+        assert False
+    except asyncio.TimeoutError:
+        pass
+    assert not ev.wlist
+
+log = []
+loop.run_until_complete(run_timeout())
+assert log == [], log
+
+
+# Lock handed off to a waiter cancelled before it runs is passed on
+def run_handoff():
+    lock = Lock()
+    yield from lock.acquire()
+    t1 = locker(1, lock)
+    loop.create_task(t1)
+    loop.create_task(locker(2, lock))
+    yield from asyncio.sleep_ms(0)
+    lock.release()
+    asyncio.cancel(t1)
+    yield from asyncio.sleep_ms(100)
+    assert not lock.locked
+
+log = []
+loop.run_until_complete(run_handoff())
+assert log == [2, 2], log
+
+
+# Notify received by a waiter cancelled before it runs is passed on
+def run_cond_cancel():
+    cond = Condition()
+    t1 = consumer(cond)
+    loop.create_task(t1)
+    loop.create_task(consumer(cond))
+    yield from asyncio.sleep_ms(10)
+    yield from cond.acquire()
+    items.append("x")
+    cond.notify()
+    asyncio.cancel(t1)
+    cond.release()
+    yield from asyncio.sleep_ms(10)
+    assert log == ["x"], log
+
+log = []
+loop.run_until_complete(run_cond_cancel())
+print("OK")
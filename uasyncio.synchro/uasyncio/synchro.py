@@ -1,28 +1,160 @@
+from collections.deque import deque
 from uasyncio import core
 
+# All primitives below park waiting tasks in a FIFO wait list (without
+# rescheduling them), and wake them up with call_soon(). Where a resource
+# is released, it's handed off directly to the next waiter, so a task
+# woken up doesn't need to compete for it again. Waits can be cancelled
+# or time out (wait_for()), which removes the task from the wait list.
+
+
+def _park(wlist, handoff=None):
+    wlist.append(core.get_event_loop().cur_task)
+    park = core.Park(wlist)
+    try:
+        yield park
+    except:
+        # We were woken up (and e.g. handed the resource), but got an
+        # exception (cancelled or timed out) before running, so pass
+        # it on.
+        if park.arg is None and handoff:
+            handoff()
+        raise
+
+
+def _wakeup(wlist):
+    t = wlist.popleft()
+    # Clear pending Park syscall, and mark it as woken up
+    t.pend_throw(None).arg = None
+    core.get_event_loop().call_soon(t)
+
+
 class Lock:
 
     def __init__(self):
         self.locked = False
-        self.wlist = []
+        self.wlist = deque()
 
     def release(self):
         assert self.locked
-        self.locked = False
         if self.wlist:
-            #print(self.wlist)
-            coro = self.wlist.pop(0)
-            core.get_event_loop().call_soon(coro)
+            # Lock stays locked, ownership passes to the next waiter
+            _wakeup(self.wlist)
+        else:
+            self.locked = False
 
     def acquire(self):
-        # As release() is not coro, assume we just released and going to acquire again
-        # so, yield first to let someone else to acquire it first
-        yield
-        #print("acquire:", self.locked)
-        while 1:
-            if not self.locked:
-                self.locked = True
-                return True
-            #print("putting", core.get_event_loop().cur_task, "on waiting list")
-            self.wlist.append(core.get_event_loop().cur_task)
-            yield False
+        if not self.locked:
+            self.locked = True
+            return True
+        yield from _park(self.wlist, self.release)
+        return True
+
+
+class Event:
+
+    def __init__(self):
+        self.state = False
+        self.wlist = deque()
+
+    def is_set(self):
+        return self.state
+
+    def set(self):
+        self.state = True
+        while self.wlist:
+            _wakeup(self.wlist)
+
+    def clear(self):
+        self.state = False
+
+    def wait(self):
+        if not self.state:
+            yield from _park(self.wlist)
+        return True
+
+
+class Semaphore:
+
+    def __init__(self, value=1):
+        if value < 0:
+            raise ValueError("Semaphore initial value must be >= 0")
+        self.value = value
+        self.wlist = deque()
+
+    def locked(self):
+        return self.value == 0
+
+    def release(self):
+        if self.wlist:
+            # Pass acquired slot directly to the next waiter
+            _wakeup(self.wlist)
+        else:
+            self.value += 1
+
+    def acquire(self):
+        if self.value > 0:
+            self.value -= 1
+            return True
+        yield from _park(self.wlist, self.release)
+        return True
+
+
+class BoundedSemaphore(Semaphore):
+
+    def __init__(self, value=1):
+        super().__init__(value)
+        self.bound = value
+
+    def release(self):
+        if not self.wlist and self.value >= self.bound:
+            raise ValueError("BoundedSemaphore released too many times")
+        super().release()
+
+
+class Condition:
+
+    def __init__(self, lock=None):
+        if lock is None:
+            lock = Lock()
+        self.lock = lock
+        self.wlist = deque()
+
+    def locked(self):
+        return self.lock.locked
+
+    def acquire(self):
+        return (yield from self.lock.acquire())
+
+    def release(self):
+        self.lock.release()
+
+    def wait(self):
+        assert self.lock.locked
+        self.lock.release()
+        try:
+            yield from _park(self.wlist, self._notify_next)
+        finally:
+            # Lock is reacquired even if we were woken up with exception
+            yield from self.lock.acquire()
+        return True
+
+    def wait_for(self, predicate):
+        res = predicate()
+        while not res:
+            yield from self.wait()
+            res = predicate()
+        return res
+
+    def _notify_next(self):
+        if self.wlist:
+            _wakeup(self.wlist)
+
+    def notify(self, n=1):
+        assert self.lock.locked
+        while self.wlist and n:
+            _wakeup(self.wlist)
+            n -= 1
+
+    def notify_all(self):
+        self.notify(len(self.wlist))
@@ -0,0 +1,53 @@
+# Compare utimeq heap and TimeWheel on a workload typical for servers with
+# many connections: lots of timeouts, most of which are cancelled before
+# they expire.
+#
+# pycopy bench_waitq.py [N]
+import sys
+import random
+import utime
+import utimeq
+from uasyncio.timewheel import TimeWheel
+
+
+N = 20000
+if len(sys.argv) > 1:
+    N = int(sys.argv[1])
+
+
+def bench(name, q):
+    random.seed(42)
+    base = utime.ticks_ms()
+    arr = [0, 0, 0]
+
+    t0 = utime.ticks_ms()
+    ids = []
+    for i in range(N):
+        ids.append(q.push(utime.ticks_add(base, 1000 + random.randrange(30000)), i, ()))
+    t1 = utime.ticks_ms()
+
+    removed = 0
+    try:
+        # Most of timeouts are cancelled
+        for i in range(N):
+            if i % 10:
+                q.remove(ids[i])
+                removed += 1
+    except NotImplementedError:
+        print("%s: remove() not supported" % name)
+    t2 = utime.ticks_ms()
+
+    popped = 0
+    while q:
+        q.peektime()
+        q.pop(arr)
+        popped += 1
+    t3 = utime.ticks_ms()
+
+    print("%-10s push: %4dms  remove(%d): %4dms  pop(%d): %4dms  total: %4dms" % (
+        name, utime.ticks_diff(t1, t0), removed, utime.ticks_diff(t2, t1),
+        popped, utime.ticks_diff(t3, t2), utime.ticks_diff(t3, t0)))
+
+
+bench("utimeq", utimeq.utimeq(N))
+bench("TimeWheel", TimeWheel())
@@ -0,0 +1,106 @@
+# Check that TimeWheel pops entries in the same order as a sorted list,
+# including with removals and pushes interleaved with pops.
+import random
+from utime import ticks_add, ticks_diff
+from uasyncio.timewheel import TimeWheel
+
+
+def check(base, delays, remove_every=3):
+    q = TimeWheel()
+    ref = {}
+    for i, d in enumerate(delays):
+        t = ticks_add(base, d)
+        id = q.push(t, i, ())
+        ref[id] = (d, i)
+    for n, id in enumerate(list(ref)):
+        if n % remove_every == 0:
+            q.remove(id)
+            del ref[id]
+    exp = sorted(ref.values())
+    arr = [0, 0, 0]
+    res = []
+    while q:
+        q.pop(arr)
+        res.append((ticks_diff(arr[0], base), arr[1]))
+    assert [r[0] for r in res] == [e[0] for e in exp], (res, exp)
+    assert sorted(res) == exp
+
+
+random.seed(1)
+for base in (0, 1000, 2 ** 29 - 100, 2 ** 30 - 5):
+    check(base, [random.randrange(20000000) for i in range(500)])
+    check(base, [random.randrange(100) for i in range(500)])
+    check(base, [random.randrange(5000) for i in range(500)])
+    # First push is not the earliest, cursor needs rewinding
+    check(base, [3000, 10, 70000, 5] + [random.randrange(70000) for i in range(100)])
+
+
+# Interleaved push/pop, like an event loop does, with pushes relative
+# to the time of the last popped entry.
+q = TimeWheel()
+now = 12345
+q.push(now, 0, ())
+arr = [0, 0, 0]
+last = now
+cnt = 0
+while q and cnt < 5000:
+    t = q.peektime()
+    q.pop(arr)
+    assert arr[0] == t
+    assert ticks_diff(arr[0], last) >= 0
+    last = arr[0]
+    cnt += 1
+    for i in range(random.randrange(3)):
+        q.push(ticks_add(last, random.randrange(100000)), cnt, ())
+
+
+# Push/pop fuzz against heapq, with timeouts far beyond range of the wheel
+# (64**4ms).
+import heapq
+
+
+def fuzz(seed, base=1000, ops=300, maxdelay=20000000):
+    random.seed(seed)
+    q = TimeWheel()
+    ref = []
+    # Times in ref are relative to base, and not wrapped
+    now = 0
+    arr = [0, 0, 0]
+    for i in range(ops):
+        if ref and random.randrange(3) == 0:
+            exp = heapq.heappop(ref)
+            q.pop(arr)
+            assert arr[0] == ticks_add(base, exp), (seed, i, ticks_diff(arr[0], base), exp)
+            now = exp
+        else:
+            t = now + random.randrange(maxdelay)
+            heapq.heappush(ref, t)
+            q.push(ticks_add(base, t), i, ())
+    while ref:
+        exp = heapq.heappop(ref)
+        q.pop(arr)
+        assert arr[0] == ticks_add(base, exp), (seed, ticks_diff(arr[0], base), exp)
+    assert not q
+
+
+for seed in range(300):
+    fuzz(seed)
+fuzz(1, base=2 ** 30 - 1000)
+
+
+# Regression: entries beyond range of the wheel, pushed at different
+# cursor positions, were popped out of order.
+q = TimeWheel()
+now = 1000
+ref = []
+for op in (226904, 35, 17778336, 1813, 18386901, 252389, 20, None, None, None,
+           3162, 56, None, None, None, None, None, 9277772, None):
+    if op is None:
+        q.pop(arr)
+        now = heapq.heappop(ref)
+        assert arr[0] == now, (arr[0], now)
+    else:
+        heapq.heappush(ref, now + op)
+        q.push(now + op, op, ())
+
+print("OK")
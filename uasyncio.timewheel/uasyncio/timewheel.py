@@ -0,0 +1,221 @@
+# (c) 2026 pycopy-lib contributors. MIT license.
+#
+# Hierarchical timing wheel, usable as uasyncio waitq instead of utimeq
+# heap. It has the same interface as utimeq, but push() and remove() are
+# O(1), and pop() is amortised O(1) (each entry is moved between levels
+# ("cascaded") at most once per level). This pays off with many timers
+# which are cancelled before they expire (e.g. per-connection timeouts).
+#
+# Usage:
+#
+#     loop = uasyncio.get_event_loop(waitq_len=TimeWheel())
+#
+# Level 0 has 1ms resolution and covers 64ms ahead of the wheel's cursor,
+# each next level covers 64 times more. Timeouts beyond the range of the
+# top level (64**4ms, ~4.66h) are kept in a separate overflow list, which
+# is re-checked each time the cursor moves to the next top level slot (it's
+# expected to be short). The cursor is the time of the last popped entry, so it never
+# runs ahead of the event loop's time.
+from micropython import const
+from utime import ticks_add, ticks_diff
+
+
+BITS = const(6)
+SLOTS = const(64)
+MASK = const(63)
+
+
+class Entry:
+
+    def __init__(self, time=None, obj=None, userdata=None, id=0):
+        self.time = time
+        self.obj = obj
+        self.userdata = userdata
+        self.id = id
+        self.level = 0
+        # Entries in a slot form a circular doubly-linked list, with slot
+        # itself being a sentinel entry.
+        self.prev = self.next = self
+
+
+class TimeWheel:
+
+    def __init__(self, sz=0, levels=4):
+        # sz is accepted for compatibility with utimeq(), the wheel
+        # isn't limited in size.
+        self.levels = levels
+        self.wheel = [[Entry() for i in range(SLOTS)] for l in range(levels)]
+        # Number of entries on each level
+        self.cnt = [0] * levels
+        # Entries beyond range of the wheel (with level -1)
+        self.over = []
+        self.ids = {}
+        self.last_id = 0
+        self.cur = None
+        # Cached entry with the minimal time, None if not known
+        self.min = None
+
+    def __bool__(self):
+        return bool(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _link(self, e):
+        delta = ticks_diff(e.time, self.cur)
+        level = 0
+        lim = SLOTS
+        while delta >= lim:
+            if level == self.levels - 1:
+                e.level = -1
+                self.over.append(e)
+                return
+            level += 1
+            lim <<= BITS
+        s = self.wheel[level][(e.time >> (BITS * level)) & MASK]
+        e.level = level
+        e.prev = s.prev
+        e.next = s
+        s.prev.next = e
+        s.prev = e
+        self.cnt[level] += 1
+
+    def _unlink(self, e):
+        if e.level < 0:
+            self.over.remove(e)
+            return
+        e.prev.next = e.next
+        e.next.prev = e.prev
+        e.prev = e.next = e
+        self.cnt[e.level] -= 1
+
+    def _relink_all(self):
+        es = list(self.ids.values())
+        for e in es:
+            self._unlink(e)
+        for e in es:
+            self._link(e)
+
+    def push(self, time, obj, userdata):
+        self.last_id = (self.last_id + 1) & 0x3fffffff or 1
+        e = Entry(time, obj, userdata, self.last_id)
+        if self.cur is None:
+            self.cur = time
+        elif not self.ids:
+            # While empty, cursor can be moved freely. Keep it if it's
+            # within range, otherwise make sure it's not after new entry.
+            delta = ticks_diff(time, self.cur)
+            if delta < 0 or delta >= SLOTS << (BITS * (self.levels - 1)):
+                self.cur = time
+        elif ticks_diff(time, self.cur) < 0:
+            # Entry is before the cursor. This can happen only before
+            # the first pop(), when cursor was set from the time of the
+            # first pushed entry. Rewind cursor and redistribute entries.
+            self.cur = time
+            self._relink_all()
+        self._link(e)
+        self.ids[e.id] = e
+        m = self.min
+        if m is not None and ticks_diff(time, m.time) < 0:
+            self.min = e
+        return e.id
+
+    def _find_min(self):
+        cur = self.cur
+        best = None
+        if self.cnt[0]:
+            slots = self.wheel[0]
+            i = cur & MASK
+            for k in range(SLOTS):
+                s = slots[(i + k) & MASK]
+                if s.next is not s:
+                    # All entries in a level 0 slot have the same time
+                    best = s.next
+                    break
+        for level in range(1, self.levels):
+            if not self.cnt[level]:
+                continue
+            slots = self.wheel[level]
+            sh = BITS * level
+            blk = (cur >> sh) + 1
+            for k in range(SLOTS):
+                s = slots[(blk + k) & MASK]
+                if s.next is s:
+                    continue
+                # Time at which the slot starts, all its entries are
+                # at it or later.
+                start = ticks_add((blk + k) << sh, 0)
+                if best is not None and ticks_diff(best.time, start) < 0:
+                    break
+                e = s.next
+                while e is not s:
+                    if best is None or ticks_diff(e.time, best.time) < 0:
+                        best = e
+                    e = e.next
+                break
+        # Overflow entries are usually later than anything in the wheel,
+        # but not necessarily: they're re-linked only when the cursor
+        # moves to next top level slot.
+        for e in self.over:
+            if best is None or ticks_diff(e.time, best.time) < 0:
+                best = e
+        self.min = best
+        return best
+
+    def _advance(self, t):
+        cur = self.cur
+        if ticks_diff(t, cur) <= 0:
+            return
+        self.cur = t
+        sh = BITS * (self.levels - 1)
+        if self.over and (t >> sh) != (cur >> sh):
+            over = self.over
+            self.over = []
+            for e in over:
+                self._link(e)
+        # Entries on higher levels which belong to the block the cursor
+        # moved into are redistributed to lower levels. Blocks which the
+        # cursor skipped over are empty, as it moves to the minimal time.
+        for level in range(self.levels - 1, 0, -1):
+            sh = BITS * level
+            if (t >> sh) == (cur >> sh) or not self.cnt[level]:
+                continue
+            s = self.wheel[level][(t >> sh) & MASK]
+            e = s.next
+            if e is s:
+                continue
+            # Detach chain of entries from the slot
+            s.prev.next = e.prev = None
+            s.prev = s.next = s
+            while e is not None:
+                nxt = e.next
+                self.cnt[level] -= 1
+                self._link(e)
+                e = nxt
+
+    def peektime(self):
+        e = self.min
+        if e is None:
+            e = self._find_min()
+        return e.time
+
+    def pop(self, arr):
+        e = self.min
+        if e is None:
+            e = self._find_min()
+        self.min = None
+        self._unlink(e)
+        del self.ids[e.id]
+        self._advance(e.time)
+        arr[0] = e.time
+        arr[1] = e.obj
+        arr[2] = e.userdata
+
+    def remove(self, id):
+        e = self.ids.pop(id, None)
+        if e is None:
+            # Already expired
+            return
+        self._unlink(e)
+        if e is self.min:
+            self.min = None
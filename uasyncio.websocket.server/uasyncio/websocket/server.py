@@ -19,9 +19,8 @@ class WSWriter:
 
     async def awrite(self, data):
         assert len(data) < 126
-        await self.s.awrite(b"\x81")
-        await self.s.awrite(bytes([len(data)]))
-        await self.s.awrite(data)
+        # Send frame header and payload with one syscall
+        await self.s.awritev((bytes([0x81, len(data)]), data))
 
 
 def WSReader(reader, writer):
@@ -43,13 +42,14 @@ def WSReader(reader, writer):
 
         respkey = make_respkey(webkey)
 
-        await writer.awrite(b"""\
+        writer.write(b"""\
 HTTP/1.1 101 Switching Protocols\r
 Upgrade: websocket\r
 Connection: Upgrade\r
 Sec-WebSocket-Accept: """)
-        await writer.awrite(respkey)
-        await writer.awrite("\r\n\r\n")
+        writer.write(respkey)
+        writer.write(b"\r\n\r\n")
+        await writer.drain()
 
         print("Finished webrepl handshake")
 
@@ -0,0 +1,13 @@
+#!/bin/sh
+#
+# Compare serving a large file with Stream.asendfile() vs read()/awrite(),
+# using Apache Bench (ab).
+#
+
+for mode in sendfile copy; do
+    pycopy -O test_http_server_sendfile.py $mode &
+    sleep 2
+    ab -n200 -c10 http://127.0.0.1:8081/ | grep -E "Requests per second|Transfer rate|Time per request"
+    kill %1
+    wait
+done
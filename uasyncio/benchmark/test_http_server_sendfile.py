@@ -0,0 +1,51 @@
+# Serve a large static file, either with Stream.asendfile() (default), or
+# by reading it in chunks and writing with awrite() (if "copy" is passed
+# on the command line), to compare the two. See test-ab-sendfile.sh.
+import sys
+import uos
+import uasyncio as asyncio
+
+
+FNAME = "/tmp/uasyncio-sendfile.dat"
+SIZE = 16 * 1024 * 1024
+CHUNK = 4096
+
+copy = len(sys.argv) > 1 and sys.argv[1] == "copy"
+
+
+def make_file():
+    try:
+        if uos.stat(FNAME)[6] == SIZE:
+            return
+    except OSError:
+        pass
+    chunk = b"0123456789abcdef" * (CHUNK // 16)
+    with open(FNAME, "wb") as f:
+        for i in range(SIZE // CHUNK):
+            f.write(chunk)
+
+
+def serve(reader, writer):
+    yield from reader.read(512)
+    writer.write(b"HTTP/1.0 200 OK\r\nContent-Length: %d\r\n\r\n" % SIZE)
+    # Send headers before the body in both modes (awrite() and asendfile()
+    # would flush them too, but keep the loops below doing just the body).
+    yield from writer.drain()
+    with open(FNAME, "rb") as f:
+        if copy:
+            while True:
+                data = f.read(CHUNK)
+                if not data:
+                    break
+                yield from writer.awrite(data)
+        else:
+            yield from writer.asendfile(f)
+    yield from writer.aclose()
+
+
+make_file()
+print("Serving %s using %s" % (FNAME, "read/awrite" if copy else "sendfile"))
+loop = asyncio.get_event_loop(80)
+loop.create_task(asyncio.start_server(serve, "127.0.0.1", 8081, backlog=100))
+loop.run_forever()
+loop.close()
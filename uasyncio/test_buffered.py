@@ -0,0 +1,45 @@
+from uasyncio import BufferedStream
+
+class MockSock:
+
+    def __init__(self, data_list):
+        self.data = data_list
+
+    def readinto(self, buf):
+        try:
+            data = self.data.pop(0)
+        except IndexError:
+            return 0
+        n = min(len(buf), len(data))
+        buf[:n] = data[:n]
+        if n < len(data):
+            self.data.insert(0, data[n:])
+        return n
+
+
+mock = MockSock([
+    b"line1\r\n12",
+    b"34", b"5", b"lon",
+    b"g line", b" over\r", b"\nbuf",
+    b"abcdefgh",
+    b"tail",
+])
+
+
+def func():
+    sr = BufferedStream(mock, bufsize=8)
+    assert await sr.readuntil(b"\r\n") == b"line1\r\n"
+    assert await sr.readexactly(5) == b"12345"
+    assert await sr.readline() == b"long line over\r\n"
+    buf = bytearray(8)
+    mv = memoryview(buf)
+    assert await sr.areadexactly(mv[:5]) == 5
+    assert buf[:5] == b"bufab"
+    assert bytes(await sr.apeek(3)) == b"cdefgh"
+    sr.consume(2)
+    assert await sr.read() == b"efgh"
+    assert await sr.readuntil(b"\r\n") == b"tail"
+    assert await sr.read() == b""
+
+for i in func():
+    pass
@@ -0,0 +1,42 @@
+import uasyncio.core
+from uasyncio import EpollEventLoop
+uasyncio.core._event_loop_class = EpollEventLoop
+from uasyncio import get_event_loop, open_connection, start_server, sleep_ms
+from unittest import main, TestCase
+
+class EpollEchoTestCase(TestCase):
+
+    def test_many_clients(self):
+        '''Several concurrent clients served by epoll-based loop'''
+        sockaddr = ('127.0.0.1', 8082)
+        l = get_event_loop()
+        self.assertIsInstance(l, EpollEventLoop)
+
+        async def echo_server(reader, writer):
+            data = await reader.readline()
+            await writer.awrite(data)
+            await writer.aclose()
+
+        async def echo_client(line, result):
+            reader, writer = await open_connection(*sockaddr)
+            await writer.awrite(line)
+            data = await reader.readline()
+            await writer.aclose()
+            result.append(data)
+
+        async def clients(result):
+            await sleep_ms(10)  # Allow server to get up
+            for i in range(10):
+                l.create_task(echo_client(b'Hello %d\r\n' % i, result))
+            while len(result) < 10:
+                await sleep_ms(10)
+
+        result = []
+        l.create_task(start_server(echo_server, *sockaddr))
+        l.run_until_complete(clients(result))
+
+        self.assertEqual(sorted(result), [b'Hello %d\r\n' % i for i in range(10)])
+
+
+if __name__ == '__main__':
+    main()
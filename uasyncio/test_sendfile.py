@@ -0,0 +1,30 @@
+from uasyncio import StreamWriter
+
+class MockSock:
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, buf, off=0, sz=-1):
+        if sz == -1:
+            sz = len(buf) - off
+        self.data += bytes(buf[off:off + sz])
+        return sz
+
+
+def func():
+    with open("test_sendfile.py", "rb") as f:
+        content = f.read()
+    mock = MockSock()
+    # Mock isn't a socket, so this tests fallback path of asendfile()
+    sw = StreamWriter(object(), mock)
+    with open("test_sendfile.py", "rb") as f:
+        assert await sw.asendfile(f, 10, 100, bufsize=16) == 100
+    assert mock.data == content[10:110]
+    mock.data = b""
+    with open("test_sendfile.py", "rb") as f:
+        assert await sw.asendfile(f, bufsize=64) == len(content)
+    assert mock.data == content
+
+for i in func():
+    pass
@@ -0,0 +1,70 @@
+from uasyncio import StreamWriter
+
+class MockSock:
+
+    def __init__(self, max_write=1000):
+        self.max_write = max_write
+        self.writes = []
+
+    def write(self, buf, off=0, sz=-1):
+        if sz == -1:
+            sz = len(buf) - off
+        sz = min(sz, self.max_write)
+        self.writes.append(bytes(buf[off:off + sz]))
+        return sz
+
+
+def func():
+    mock = MockSock()
+    # Pass different polls object, so awritev() doesn't try to use writev()
+    # on mock.
+    sw = StreamWriter(object(), mock)
+    assert not sw.write(b"HTTP/1.0 200 OK\r\n")
+    assert not sw.write(b"Content-Type: text/plain\r\n\r\n")
+    assert mock.writes == []
+    await sw.drain()
+    assert mock.writes == [b"HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\n\r\n"]
+    assert sw.get_write_buffer_size() == 0
+
+    await sw.awritev([b"ab", b"cd", b"ef"])
+    assert mock.writes[-1] == b"abcdef"
+
+    # Going over high watermark sends data right away, down to low watermark
+    mock.writes = []
+    sw.set_write_buffer_limits(200, 50)
+    assert not sw.write(b"x" * 150)
+    assert mock.writes == []
+    mock.max_write = 40
+    assert not sw.write(b"y" * 100)
+    assert sw.get_write_buffer_size() <= 50
+    assert len(mock.writes) == 5
+    await sw.drain()
+    assert b"".join(mock.writes) == b"x" * 150 + b"y" * 100
+
+    # awrite() sends data buffered by write() first
+    mock.writes = []
+    sw.write(b"head")
+    await sw.awrite(b"body")
+    assert b"".join(mock.writes) == b"headbody"
+
+for i in func():
+    pass
+
+
+def concurrent():
+    # Another task writes over high watermark while drain() is in the
+    # middle of sending a buffer: that data must go after the buffer.
+    mock = MockSock(3)
+    sw = StreamWriter(object(), mock)
+    sw.set_write_buffer_limits(4, 0)
+    sw.write(b"AAAA")
+    d = sw.drain()
+    # Partial write, yields to let other tasks run
+    next(d)
+    assert sw.write(b"BBBBBB")
+    for i in d:
+        pass
+    assert b"".join(mock.writes) == b"AAAABBBBBB"
+    assert sw.get_write_buffer_size() == 0
+
+concurrent()
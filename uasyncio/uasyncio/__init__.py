@@ -4,6 +4,10 @@ import uerrno
 import uselect as select
 import usocket as _socket
 import uio
+try:
+    from udnscache import getaddrinfo as _getaddrinfo
+except ImportError:
+    _getaddrinfo = _socket.getaddrinfo
 from uasyncio.core import *
 
 
@@ -54,7 +58,7 @@ class PollEventLoop(EventLoop):
         # ignore such error.
         self.poller.unregister(sock, False)
 
-    def cancel_io(self, sock):
+    def cancel_io(self, sock, coro=None):
         if DEBUG and __debug__:
             log.debug("cancel_io(%s)", sock)
         # Cancel both reader and writer
@@ -89,8 +93,169 @@ class PollEventLoop(EventLoop):
                 self.call_soon(cb)
 
 
+class EpollEventLoop(PollEventLoop):
+    # Event loop using Linux epoll (via ffi-based "select" module). Unlike
+    # PollEventLoop, which (re)registers an fd on each I/O wait, fds stay
+    # registered in the kernel across waits. Each registration is one-shot
+    # (EPOLLONESHOT), so after an event is delivered, fd is disarmed until
+    # next IORead/IOWrite, and re-arming it is a single EPOLL_CTL_MOD.
+    # Cost of .wait() is thus proportional to the number of ready fds, not
+    # the number of registered ones, and a single .wait() may schedule
+    # many coroutines at once (up to "maxevents").
+    # To use, set uasyncio.core._event_loop_class = EpollEventLoop before
+    # first call to get_event_loop().
+
+    def __init__(self, runq_len=16, waitq_len=16, maxevents=64):
+        EventLoop.__init__(self, runq_len, waitq_len)
+        import select as epoll_select
+        self.ep = epoll_select
+        self.poller = epoll_select.epoll(maxevents)
+        self.maxevents = maxevents
+
+    # Per fd, there's a single epoll registration, but a reader and a
+    # writer (e.g. a task draining output while another one reads from
+    # the same socket) may wait on it at the same time. So, registration
+    # value is [reader_cb, writer_cb, fd] entry, and event mask is
+    # derived from callbacks which are set.
+
+    def _mask(self, ent):
+        mask = self.ep.EPOLLONESHOT
+        if ent[0] is not None:
+            mask |= self.ep.EPOLLIN
+        if ent[1] is not None:
+            mask |= self.ep.EPOLLOUT
+        return mask
+
+    def _arm(self, sock, i, cb):
+        fd = sock.fileno()
+        ent = self.poller.registry.get(fd)
+        if ent is not None:
+            ent[i] = cb
+            try:
+                self.poller.modify(fd, self._mask(ent), ent)
+                return
+            except OSError as e:
+                # fd was closed (and thus auto-removed from epoll set)
+                # without IOReadDone/IOWriteDone, and then its number
+                # was reused. Other callback in entry is stale then too.
+                if e.args[0] != uerrno.ENOENT:
+                    raise
+                del self.poller.registry[fd]
+        ent = [None, None, fd]
+        ent[i] = cb
+        self.poller.register(fd, self._mask(ent), ent)
+
+    def _disarm(self, sock, i, cb=None):
+        # Remove reader (i=0) or writer (i=1) callback (only if it's cb,
+        # if given), keeping the other one armed.
+        fd = sock.fileno()
+        ent = self.poller.registry.get(fd)
+        if ent is None or cb is not None and ent[i] is not cb:
+            return
+        ent[i] = None
+        if ent[1 - i] is None:
+            self.poller.unregister(fd)
+        else:
+            self.poller.modify(fd, self._mask(ent), ent)
+
+    def add_reader(self, sock, cb, *args):
+        if DEBUG and __debug__:
+            log.debug("add_reader%s", (sock, cb, args))
+        if args:
+            cb = (cb, args)
+        self._arm(sock, 0, cb)
+
+    def remove_reader(self, sock):
+        if DEBUG and __debug__:
+            log.debug("remove_reader(%s)", sock)
+        self._disarm(sock, 0)
+
+    def add_writer(self, sock, cb, *args):
+        if DEBUG and __debug__:
+            log.debug("add_writer%s", (sock, cb, args))
+        if args:
+            cb = (cb, args)
+        self._arm(sock, 1, cb)
+
+    def remove_writer(self, sock):
+        if DEBUG and __debug__:
+            log.debug("remove_writer(%s)", sock)
+        self._disarm(sock, 1)
+
+    def cancel_io(self, sock, coro=None):
+        if DEBUG and __debug__:
+            log.debug("cancel_io(%s)", sock)
+        # Remove callback(s) of the cancelled coro only, other direction
+        # may be waited for by another task. Emptied fd is unregistered:
+        # modifying it to an empty mask would still leave EPOLLHUP/EPOLLERR
+        # (which can't be masked) armed, without EPOLLONESHOT and with
+        # stale callback.
+        self._disarm(sock, 0, coro)
+        self._disarm(sock, 1, coro)
+
+    def wait(self, delay):
+        if DEBUG and __debug__:
+            log.debug("epoll.wait(%d)", delay)
+        res = self.poller.poll_ms(delay, self.maxevents)
+        # Due to EPOLLONESHOT, fd which got an event (including sticky
+        # EPOLLHUP/EPOLLERR) is disarmed, so we won't busy-loop on it.
+        # Callback which didn't get its event is re-armed.
+        for ent, ev in res:
+            if ev & (self.ep.EPOLLHUP | self.ep.EPOLLERR):
+                # Let both reader and writer see the error
+                ev |= self.ep.EPOLLIN | self.ep.EPOLLOUT
+            cbs = []
+            if ev & self.ep.EPOLLIN and ent[0] is not None:
+                cbs.append(ent[0])
+                ent[0] = None
+            if ev & self.ep.EPOLLOUT and ent[1] is not None:
+                cbs.append(ent[1])
+                ent[1] = None
+            if ent[0] is not None or ent[1] is not None:
+                self.poller.modify(ent[2], self._mask(ent), ent)
+            for cb in cbs:
+                if DEBUG and __debug__:
+                    log.debug("Calling IO callback: %r", cb)
+                if isinstance(cb, tuple):
+                    cb[0](*cb[1])
+                else:
+                    cb.pend_throw(None)
+                    self.call_soon(cb)
+
+    def close(self):
+        self.poller.close()
+
+
+# Optional syscalls accessed via ffi, initialized on first use. False
+# means not initialized yet, None - not available.
+_writev = False
+_sendfile = False
+
+def _libc_func(ret, name, args):
+    try:
+        import ffilib
+        libc = ffilib.libc()
+        if libc:
+            return libc.func(ret, name, args)
+    except (ImportError, OSError):
+        pass
+    return None
+
+
 class Stream:
 
+    # Output buffer for write(), created on first use. It's flushed by
+    # drain(). If it grows beyond high watermark, write() tries to send
+    # data right away (without blocking), until it's at low watermark.
+    obuf = None
+    whigh = 64 * 1024
+    wlow = 16 * 1024
+    # Set while a task sends data (drain(), awrite() and friends). Then
+    # write() only buffers, and other senders wait in the dwait list,
+    # so data from different tasks isn't interleaved mid-buffer.
+    draining = False
+    dwait = None
+
     def __init__(self, polls, ios=None, extra=None):
         if ios is None:
             ios = polls
@@ -152,12 +317,36 @@ class Stream:
             log.debug("StreamReader.readline(): %s", buf)
         return buf
 
+    def areadinto(self, buf):
+        # Read available data into buf (bytearray or memoryview), return
+        # number of bytes read, 0 on EOF.
+        while True:
+            res = self.ios.readinto(buf)
+            if res is None:
+                yield IORead(self.polls)
+            elif res is uio.WANT_WRITE:
+                yield IOWrite(self.polls)
+            else:
+                break
+        if not res:
+            yield IOReadDone(self.polls)
+        return res
+
     def awrite(self, buf, off=0, sz=-1):
         # This method is called awrite (async write) to not proliferate
         # incompatibility with original asyncio. Unlike original asyncio
         # whose .write() method is both not a coroutine and guaranteed
         # to return immediately (which means it has to buffer all the
-        # data), this method is a coroutine.
+        # data), this method is a coroutine. Data previously buffered by
+        # write() is sent first.
+        yield from self._lock()
+        try:
+            yield from self._flush()
+            yield from self._awrite(buf, off, sz)
+        finally:
+            self._unlock()
+
+    def _awrite(self, buf, off=0, sz=-1):
         if sz == -1:
             sz = len(buf) - off
         if DEBUG and __debug__:
@@ -182,6 +371,201 @@ class Stream:
                 # Give other tasks a chance to run
                 yield
 
+    def set_write_buffer_limits(self, high=None, low=None):
+        if high is None:
+            high = 64 * 1024
+        if low is None:
+            low = high // 4
+        assert 0 <= low <= high
+        self.whigh = high
+        self.wlow = low
+
+    def get_write_buffer_size(self):
+        if self.obuf is None:
+            return 0
+        return len(self.obuf)
+
+    def _send_nowait(self, limit):
+        # Send buffered data while it's above limit and stream accepts it
+        # without blocking. Not done during drain, as the socket may
+        # still hold a tail of a previous buffer to be sent first.
+        if self.draining:
+            return
+        obuf = self.obuf
+        off = 0
+        sz = len(obuf)
+        while sz > limit:
+            res = self.ios.write(obuf, off, sz)
+            if res is None or res is uio.WANT_READ:
+                break
+            off += res
+            sz -= res
+        if off:
+            self.obuf = obuf[off:]
+
+    def write(self, buf):
+        # Unlike awrite(), this is not a coroutine: data is appended to the
+        # output buffer, and consecutive writes are coalesced, to be sent
+        # with a single syscall by drain(). Returns True if buffer is over
+        # high watermark (even after trying to send some data from it),
+        # i.e. if caller should drain() before writing more.
+        if self.obuf is None:
+            self.obuf = bytearray()
+        self.obuf += buf
+        if len(self.obuf) > self.whigh:
+            self._send_nowait(self.wlow)
+            return len(self.obuf) > self.whigh
+        return False
+
+    def _lock(self):
+        # Wait until no other task is sending, then become the sender.
+        # Parked tasks can be cancelled (see core.Park).
+        while self.draining:
+            if self.dwait is None:
+                self.dwait = []
+            self.dwait.append(get_event_loop().cur_task)
+            yield Park(self.dwait)
+        self.draining = True
+
+    def _unlock(self):
+        self.draining = False
+        w = self.dwait
+        if w:
+            # Wake up all, first one to run becomes next sender
+            loop = get_event_loop()
+            for t in w:
+                t.pend_throw(None)
+                loop.call_soon(t)
+            del w[:]
+
+    def _flush(self):
+        # Send all data accumulated by write(), including data written
+        # by other tasks meanwhile. To be called with _lock() held.
+        while self.obuf:
+            if DEBUG and __debug__:
+                log.debug("StreamWriter.drain(): %d bytes", len(self.obuf))
+            buf = self.obuf
+            self.obuf = bytearray()
+            yield from self._awrite(buf)
+
+    def drain(self):
+        # If another task is already draining, this waits for it (which
+        # sends our data too, as it's in the same buffer).
+        if not self.obuf and not self.draining:
+            return
+        yield from self._lock()
+        try:
+            yield from self._flush()
+        finally:
+            self._unlock()
+
+    def awritev(self, bufs):
+        # Write a sequence of buffers, using writev() syscall when
+        # possible (for streams without a wrapper, like SSL, on top of
+        # a socket), or otherwise coalescing them in the output buffer.
+        global _writev
+        if _writev is False:
+            _writev = _libc_func("i", "writev", "iPi")
+        if _writev is None or self.ios is not self.polls:
+            for b in bufs:
+                self.write(b)
+            yield from self.drain()
+            return
+        yield from self._lock()
+        try:
+            yield from self._flush()
+            yield from self._writev(bufs)
+        finally:
+            self._unlock()
+
+    def _writev(self, bufs):
+        import uos
+        import uctypes
+        import uarray
+        import ustruct
+        n = len(bufs)
+        iov = uarray.array("P", [0] * (2 * n))
+        for i in range(n):
+            iov[2 * i] = uctypes.addressof(bufs[i])
+            iov[2 * i + 1] = len(bufs[i])
+        ptrsz = ustruct.calcsize("P")
+        fd = self.polls.fileno()
+        i = 0
+        while i < n:
+            res = _writev(fd, uctypes.addressof(iov) + 2 * i * ptrsz, n - i)
+            if res == -1:
+                err = uos.errno()
+                if err != uerrno.EAGAIN:
+                    raise OSError(err)
+                yield IOWrite(self.polls)
+                continue
+            # Skip over what was written
+            while i < n:
+                l = iov[2 * i + 1]
+                if res < l:
+                    iov[2 * i] += res
+                    iov[2 * i + 1] = l - res
+                    break
+                res -= l
+                i += 1
+
+    def asendfile(self, f, offset=0, count=-1, bufsize=4096):
+        # Send count bytes (-1 - till EOF) of file f, starting at offset.
+        # Uses sendfile() syscall (zero-copy, data doesn't go thru Python
+        # heap) if possible, otherwise reads file via a buffer (allocated
+        # once per call). Returns number of bytes sent.
+        global _sendfile
+        if _sendfile is False:
+            _sendfile = _libc_func("l", "sendfile", "iipL")
+        yield from self._lock()
+        try:
+            yield from self._flush()
+            return (yield from self._sendfile(f, offset, count, bufsize))
+        finally:
+            self._unlock()
+
+    def _sendfile(self, f, offset, count, bufsize):
+        sent = 0
+        if _sendfile is not None and self.ios is self.polls:
+            import uos
+            import ffilib
+            off = ffilib.makeref("l", offset)
+            in_fd = f.fileno()
+            out_fd = self.polls.fileno()
+            while count:
+                chunk = 0x7ffff000 if count < 0 else count
+                res = _sendfile(out_fd, in_fd, off, chunk)
+                if res == -1:
+                    err = uos.errno()
+                    if err == uerrno.EAGAIN:
+                        yield IOWrite(self.polls)
+                        continue
+                    if sent == 0 and err == uerrno.EINVAL:
+                        # Not supported for this pair of file descriptors
+                        break
+                    raise OSError(err)
+                if res == 0:
+                    # EOF
+                    return sent
+                sent += res
+                if count > 0:
+                    count -= res
+            else:
+                return sent
+        f.seek(offset + sent)
+        buf = bytearray(bufsize)
+        mv = memoryview(buf)
+        while count:
+            sz = bufsize if count < 0 else min(bufsize, count)
+            n = f.readinto(mv[:sz])
+            if not n:
+                break
+            yield from self._awrite(buf, 0, n)
+            sent += n
+            if count > 0:
+                count -= n
+        return sent
+
     # This function is tentative, subject to change
     def awritestr(self, s):
         yield from self.awrite(s.encode())
@@ -192,9 +576,12 @@ class Stream:
             yield from self.awrite(buf)
 
     def aclose(self):
-        yield IOWriteDone(self.polls)
-        self.ios.close()
-        self.polls.close()
+        try:
+            yield from self.drain()
+        finally:
+            yield IOWriteDone(self.polls)
+            self.ios.close()
+            self.polls.close()
 
     def get_extra_info(self, name, default=None):
         return self.extra.get(name, default)
@@ -203,13 +590,176 @@ class Stream:
         return "<Stream %r %r>" % (self.polls, self.ios)
 
 
+if hasattr(bytearray, "find"):
+    def _find(buf, sep, start, end):
+        return buf.find(sep, start, end)
+else:
+    def _find(buf, sep, start, end):
+        i = bytes(memoryview(buf)[start:end]).find(sep)
+        if i >= 0:
+            i += start
+        return i
+
+
+class BufferedStream(Stream):
+    # Stream with a read buffer, which is allocated once and reused. Data
+    # is read from the underlying stream in as large chunks as fit in the
+    # buffer, and methods return as soon as enough data is buffered,
+    # without yielding to the event loop. Unread data is kept at
+    # rbuf[rstart:rend], and moved to the start of the buffer only when
+    # its free tail space runs out.
+
+    def __init__(self, polls, ios=None, extra=None, bufsize=4096):
+        Stream.__init__(self, polls, ios, extra)
+        self.rbuf = bytearray(bufsize)
+        self.rmv = memoryview(self.rbuf)
+        self.rstart = self.rend = 0
+
+    def _fill(self):
+        # Read more data into the buffer, return number of bytes read,
+        # 0 on EOF (or if buffer is full).
+        if self.rstart == self.rend:
+            self.rstart = self.rend = 0
+        elif self.rend == len(self.rbuf) and self.rstart:
+            n = self.rend - self.rstart
+            self.rbuf[:n] = self.rbuf[self.rstart:self.rend]
+            self.rstart = 0
+            self.rend = n
+        if self.rend == len(self.rbuf):
+            return 0
+        res = yield from Stream.areadinto(self, self.rmv[self.rend:])
+        self.rend += res
+        return res
+
+    def _take(self, n):
+        res = bytes(self.rmv[self.rstart:self.rstart + n])
+        self.rstart += n
+        return res
+
+    def buffered(self):
+        # Return memoryview of buffered unread data, without copying.
+        # It's valid only until the next read operation.
+        return self.rmv[self.rstart:self.rend]
+
+    def apeek(self, n=1):
+        # Make sure that at least n bytes are buffered (if n is not larger
+        # than the buffer size, and EOF wasn't reached), and return
+        # memoryview of the buffered data, like buffered() does. The data
+        # isn't consumed, use .consume() for that.
+        while self.rend - self.rstart < n:
+            if not (yield from self._fill()):
+                break
+        return self.buffered()
+
+    def consume(self, n):
+        assert n <= self.rend - self.rstart
+        self.rstart += n
+
+    def read(self, n=-1):
+        if self.rstart == self.rend:
+            yield from self._fill()
+        avail = self.rend - self.rstart
+        if n < 0 or n > avail:
+            n = avail
+        return self._take(n)
+
+    def areadinto(self, buf):
+        avail = self.rend - self.rstart
+        if not avail:
+            if len(buf) >= len(self.rbuf):
+                # Large read, bypass the buffer
+                return (yield from Stream.areadinto(self, buf))
+            avail = yield from self._fill()
+        n = min(len(buf), avail)
+        buf[:n] = self.rmv[self.rstart:self.rstart + n]
+        self.rstart += n
+        return n
+
+    def areadexactly(self, buf):
+        # Fill buf (bytearray or memoryview) completely, return number of
+        # bytes read, which is less than len(buf) only on EOF.
+        if not isinstance(buf, memoryview):
+            buf = memoryview(buf)
+        off = 0
+        sz = len(buf)
+        while off < sz:
+            n = yield from self.areadinto(buf[off:])
+            if not n:
+                break
+            off += n
+        return off
+
+    def readexactly(self, n):
+        avail = self.rend - self.rstart
+        if avail < n <= len(self.rbuf) - self.rstart:
+            # Will fit into the buffer without moving data around
+            while self.rend - self.rstart < n:
+                if not (yield from self._fill()):
+                    break
+            avail = self.rend - self.rstart
+        if avail >= n:
+            return self._take(n)
+        buf = bytearray(n)
+        n = yield from self.areadexactly(buf)
+        if n < len(buf):
+            buf = buf[:n]
+        return bytes(buf)
+
+    def readuntil(self, sep):
+        # Read data up to and including sep. If EOF is reached before sep,
+        # return all data read so far. If a line doesn't fit into the
+        # buffer, it's accumulated in chunks, and joined in the end.
+        parts = None
+        scanned = self.rstart
+        while True:
+            i = _find(self.rbuf, sep, scanned, self.rend)
+            if i >= 0:
+                res = self._take(i + len(sep) - self.rstart)
+                break
+            # Next time, search only newly read data (accounting for
+            # separator possibly split between reads). Offset is kept
+            # relative to rstart, as _fill() may move data around.
+            off = max(0, self.rend - self.rstart - len(sep) + 1)
+            if self.rstart == 0 and self.rend == len(self.rbuf):
+                if parts is None:
+                    parts = []
+                parts.append(self._take(off))
+                off = 0
+            n = yield from self._fill()
+            if not n:
+                res = self._take(self.rend - self.rstart)
+                break
+            scanned = self.rstart + off
+        if parts:
+            parts.append(res)
+            res = b"".join(parts)
+        if DEBUG and __debug__:
+            log.debug("BufferedStream.readuntil(): %s", res)
+        return res
+
+    def readline(self):
+        return (yield from self.readuntil(b"\n"))
+
+
 StreamReader = StreamWriter = const(Stream)
 
 
-def open_connection(host, port, ssl=False, server_hostname=None):
+def _reader(s, s2, bufsize):
+    if bufsize:
+        return BufferedStream(s, s2, None, bufsize)
+    return StreamReader(s, s2)
+
+
+def open_connection(host, port, ssl=False, server_hostname=None, bufsize=0):
     if DEBUG and __debug__:
         log.debug("open_connection(%s, %s)", host, port)
-    ai = _socket.getaddrinfo(host, port, 0, _socket.SOCK_STREAM)
+    try:
+        from uasyncio.dns import getaddrinfo
+    except ImportError:
+        ai = _getaddrinfo(host, port, 0, _socket.SOCK_STREAM)
+    else:
+        # Resolve without blocking the event loop
+        ai = yield from getaddrinfo(host, port, 0, _socket.SOCK_STREAM)
     ai = ai[0]
     s = _socket.socket(ai[0], ai[1], ai[2])
     s.setblocking(False)
@@ -231,19 +781,25 @@ def open_connection(host, port, ssl=False, server_hostname=None):
             ssl = ussl.SSLContext()
         s2 = ssl.wrap_socket(s, server_hostname=server_hostname, do_handshake=False)
         s2.setblocking(False)
-    return StreamReader(s, s2), StreamWriter(s, s2)
+    return _reader(s, s2, bufsize), StreamWriter(s, s2)
 
 
-def start_server(client_coro, host, port, backlog=10, ssl=None):
+def start_server(client_coro, host, port, backlog=10, ssl=None, bufsize=0,
+                 reuse_port=False, accept_batch=16):
     if DEBUG and __debug__:
         log.debug("start_server(%s, %s)", host, port)
     ai = _socket.getaddrinfo(host, port, 0, _socket.SOCK_STREAM)
     ai = ai[0]
     s = _socket.socket(ai[0], ai[1], ai[2])
     s2 = None
+    loop = get_event_loop()
     try:
         s.setblocking(False)
         s.setsockopt(_socket.SOL_SOCKET, _socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # Allows several processes to listen on the same port, with
+            # kernel distributing incoming connections among them.
+            s.setsockopt(_socket.SOL_SOCKET, getattr(_socket, "SO_REUSEPORT", 15), 1)
         s.bind(ai[-1])
         s.listen(backlog)
         while True:
@@ -252,19 +808,28 @@ def start_server(client_coro, host, port, backlog=10, ssl=None):
             yield IORead(s)
             if DEBUG and __debug__:
                 log.debug("start_server: After iowait")
-            s2, client_addr = s.accept()
-            s3 = s2
-            if ssl:
-                s3 = ssl.wrap_socket(s2, server_side=True, do_handshake=False)
-            s3.setblocking(False)
-            if DEBUG and __debug__:
-                log.debug("start_server: After accept: %s", s2)
-            extra = {"peername": client_addr}
-            yield client_coro(StreamReader(s2, s3), StreamWriter(s2, s3, extra))
-            s2 = s3 = None
+            # Accept all pending connections (up to accept_batch), not
+            # just one per wakeup.
+            for i in range(accept_batch):
+                try:
+                    s2, client_addr = s.accept()
+                except OSError as e:
+                    if e.args[0] == uerrno.EAGAIN:
+                        break
+                    raise
+                s3 = s2
+                if ssl:
+                    s3 = ssl.wrap_socket(s2, server_side=True, do_handshake=False)
+                s3.setblocking(False)
+                if DEBUG and __debug__:
+                    log.debug("start_server: After accept: %s", s2)
+                extra = {"peername": client_addr}
+                loop.call_soon(client_coro(_reader(s2, s3, bufsize), StreamWriter(s2, s3, extra)))
+                s2 = s3 = None
     finally:
         if s2:
             s2.close()
+        loop.remove_reader(s)
         s.close()
 
 
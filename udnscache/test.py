@@ -0,0 +1,54 @@
+import usocket
+import udnscache
+
+
+calls = []
+
+def fake_getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+    calls.append(host)
+    if host == "bad.example":
+        raise OSError(-2)
+    return [(2, type, 0, "", (host, port))]
+
+udnscache.usocket = type("fake", (), {"getaddrinfo": staticmethod(fake_getaddrinfo),
+                                      "SOCK_STREAM": usocket.SOCK_STREAM})
+
+r1 = udnscache.getaddrinfo("a.example", 80)
+r2 = udnscache.getaddrinfo("a.example", 80)
+assert r1 is r2
+assert calls == ["a.example"]
+assert udnscache.hits == 1 and udnscache.misses == 1
+
+# Negative caching
+for i in range(2):
+    try:
+        udnscache.getaddrinfo("bad.example", 80)
+        assert False
+    except OSError as e:
+        assert e.args[0] == -2
+assert calls == ["a.example", "bad.example"]
+
+# Expiry
+udnscache.ttl = 0
+udnscache.getaddrinfo("b.example", 80)
+udnscache.getaddrinfo("b.example", 80)
+assert calls.count("b.example") == 2
+udnscache.ttl = 300
+
+udnscache.prewarm([("c.example", 443), ("bad.example", 443)])
+udnscache.getaddrinfo("c.example", 443, 0, usocket.SOCK_STREAM)
+assert calls.count("c.example") == 1
+
+# Size bound
+udnscache.maxsize = 4
+for i in range(10):
+    udnscache.getaddrinfo("h%d.example" % i, 80)
+assert len(udnscache._cache) <= 4
+
+udnscache.invalidate("h9.example")
+udnscache.getaddrinfo("h9.example", 80)
+assert calls.count("h9.example") == 2
+
+udnscache.invalidate()
+print(udnscache.stats())
+assert udnscache.stats()["entries"] == 0
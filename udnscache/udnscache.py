@@ -0,0 +1,81 @@
+# Caching wrapper for usocket.getaddrinfo()
+# (c) 2026 pycopy-lib contributors, MIT license
+#
+# Networking modules resolve host names via getaddrinfo() below, so a
+# name resolved once is shared by all of them until its entry expires.
+# Failed lookups are cached too (for a shorter time), so an unreachable
+# DNS server doesn't stall every connection attempt. getaddrinfo()
+# doesn't report TTLs of DNS records, so entries live for the fixed
+# times below; set them as suitable for an application.
+import usocket
+import utime
+
+
+# Lifetime of successful/failed lookup results, in seconds
+ttl = 300
+neg_ttl = 30
+# Max number of cached entries
+maxsize = 32
+
+hits = 0
+misses = 0
+
+# (host, port, af, type) -> (expiry_ms, result or OSError args)
+_cache = {}
+
+
+def _put(key, val, tmo):
+    if len(_cache) >= maxsize:
+        _expire()
+        if len(_cache) >= maxsize:
+            del _cache[next(iter(_cache))]
+    _cache[key] = (utime.ticks_add(utime.ticks_ms(), tmo * 1000), val)
+
+
+def _expire():
+    now = utime.ticks_ms()
+    for k in [k for k, v in _cache.items() if utime.ticks_diff(v[0], now) <= 0]:
+        del _cache[k]
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+    global hits, misses
+    key = (host, port, af, type)
+    e = _cache.get(key)
+    if e is not None and utime.ticks_diff(e[0], utime.ticks_ms()) > 0:
+        hits += 1
+        if isinstance(e[1], tuple):
+            raise OSError(*e[1])
+        return e[1]
+    misses += 1
+    try:
+        res = usocket.getaddrinfo(host, port, af, type, proto, flags)
+    except OSError as e:
+        # Cache just the args, raising the same exception instance
+        # repeatedly would accumulate traceback in it.
+        _put(key, e.args, neg_ttl)
+        raise
+    _put(key, res, ttl)
+    return res
+
+
+def prewarm(hosts, type=usocket.SOCK_STREAM):
+    # Resolve (host, port) pairs in advance, e.g. at startup, ignoring
+    # errors (which get cached as negative entries).
+    for host, port in hosts:
+        try:
+            getaddrinfo(host, port, 0, type)
+        except OSError:
+            pass
+
+
+def invalidate(host=None):
+    if host is None:
+        _cache.clear()
+        return
+    for k in [k for k in _cache if k[0] == host]:
+        del _cache[k]
+
+
+def stats():
+    return {"hits": hits, "misses": misses, "entries": len(_cache)}
@@ -20,13 +20,14 @@ def skip_fqdn(buf):
         buf.read(sz)
 
 
-# unicast param is for mDNS queries.
-def make_req(buf, fqdn, is_ipv6, unicast=False):
+# unicast param is for mDNS queries. id is transaction ID, to match
+# responses with requests.
+def make_req(buf, fqdn, is_ipv6, unicast=False, id=0):
     typ = 1  # A
     if is_ipv6:
         typ = 28  # AAAA
 
-    buf.writebin(">H", 0)
+    buf.writebin(">H", id)
     buf.writebin(">H", 0x100)
     # q count
     buf.writebin(">H", 1)
@@ -78,3 +79,38 @@ def parse_resp(buf, is_ipv6):
 
         if t == typ:
             return rval
+
+
+# Unlike parse_resp(), returns all addresses of the requested type, as
+# (id, rcode, [(addr, ttl), ...]).
+def parse_answers(buf, is_ipv6):
+    typ = 1  # A
+    if is_ipv6:
+        typ = 28  # AAAA
+
+    id = buf.readbin(">H")
+    flags = buf.readbin(">H")
+    assert flags & 0x8000
+    qcnt = buf.readbin(">H")
+    acnt = buf.readbin(">H")
+    # nscnt, addcnt
+    buf.readbin(">I")
+
+    for i in range(qcnt):
+        skip_fqdn(buf)
+        # type, class
+        buf.readbin(">I")
+
+    res = []
+    for i in range(acnt):
+        skip_fqdn(buf)
+        t = buf.readbin(">H")
+        # class
+        buf.readbin(">H")
+        ttl = buf.readbin(">I")
+        rlen = buf.readbin(">H")
+        rval = buf.read(rlen)
+        if t == typ:
+            res.append((rval, ttl))
+
+    return id, flags & 0xf, res
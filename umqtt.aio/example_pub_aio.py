@@ -0,0 +1,19 @@
+import uasyncio as asyncio
+from umqtt.aio import MQTTClient
+
+# Test reception e.g. with:
+# mosquitto_sub -t foo_topic
+
+
+def main(server="localhost"):
+    c = MQTTClient("umqtt_client", server, keepalive=30, window=64)
+    yield from c.connect()
+    for i in range(1000):
+        # Doesn't wait for PUBACK, only for a free slot in the window
+        yield from c.publish(b"foo_topic", b"reading %d" % i, qos=1)
+    yield from c.wait_acked()
+    yield from c.disconnect()
+
+
+loop = asyncio.get_event_loop()
+loop.run_until_complete(main())
@@ -0,0 +1,246 @@
+import utime
+import uasyncio as asyncio
+from uasyncio.synchro import Lock, Semaphore, Event
+from .simple import MQTTException, _b, connect_pkt, publish_hdr, subscribe_pkt
+
+
+class MQTTClient:
+    """MQTT client for uasyncio. Unlike umqtt.simple, publish() with QoS 1
+    doesn't wait for PUBACK: up to window messages may be awaiting their
+    acknowledgements, which are processed (in any order) by a background
+    reader task. Subscribed messages are delivered to the callback by the
+    same task."""
+
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
+                 ssl=False, window=32, bufsize=1024):
+        if port == 0:
+            port = 8883 if ssl else 1883
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.ssl = ssl
+        self.user = user
+        self.pswd = password
+        self.keepalive = keepalive
+        self.window = window
+        self.bufsize = bufsize
+        self.cb = None
+        self.lw = (None, None, 0, False)
+        self.reader = self.writer = None
+        self.pid = 0
+        # pid -> packet, for QoS 1 messages awaiting PUBACK
+        self.inflight = {}
+        # pid -> [Event, SUBACK return code]
+        self.subacks = {}
+        self.slots = Semaphore(window)
+        self.acked = Event()
+        self.wlock = Lock()
+        self.tasks = []
+        self.err = None
+        self.last_tx = self.last_rx = 0
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def set_last_will(self, topic, msg, retain=False, qos=0):
+        assert 0 <= qos <= 2
+        assert topic
+        self.lw = (topic, msg, qos, retain)
+
+    def _next_pid(self):
+        while True:
+            self.pid = self.pid % 65535 + 1
+            if self.pid not in self.inflight and self.pid not in self.subacks:
+                return self.pid
+
+    def _send(self, pkt):
+        # Packets are appended to the stream's output buffer in whole, so
+        # packets from different tasks are never interleaved. If some
+        # task is already draining the buffer, it will send this packet
+        # too (unless the buffer is over high watermark).
+        if self.err:
+            raise self.err
+        over = self.writer.write(pkt)
+        self.last_tx = utime.ticks_ms()
+        if self.wlock.locked and not over:
+            return
+        yield from self.wlock.acquire()
+        try:
+            yield from self.writer.drain()
+        finally:
+            self.wlock.release()
+
+    def connect(self, clean_session=True):
+        self.reader, self.writer = yield from asyncio.open_connection(
+            self.server, self.port, ssl=self.ssl, bufsize=self.bufsize)
+        self.err = None
+        lw_topic, lw_msg, lw_qos, lw_retain = self.lw
+        yield from self._send(connect_pkt(self.client_id, clean_session, self.keepalive,
+                                          self.user, self.pswd, lw_topic, lw_msg,
+                                          lw_qos, lw_retain))
+        resp = yield from self.reader.readexactly(4)
+        assert resp[0] == 0x20 and resp[1] == 0x02
+        if resp[3] != 0:
+            raise MQTTException(resp[3])
+        self.last_rx = utime.ticks_ms()
+        # Resend messages not acknowledged on previous connection
+        for pid, pkt in self.inflight.items():
+            pkt[0] |= 0x08  # DUP
+            yield from self._send(pkt)
+        loop = asyncio.get_event_loop()
+        self.tasks = [self._reader_task()]
+        if self.keepalive:
+            self.tasks.append(self._ping_task())
+        for t in self.tasks:
+            loop.create_task(t)
+        return resp[2] & 1
+
+    def disconnect(self):
+        try:
+            yield from self._send(b"\xe0\0")
+        finally:
+            self._close(None)
+
+    def _close(self, err):
+        if self.reader is None:
+            return
+        cur = asyncio.get_event_loop().cur_task
+        for t in self.tasks:
+            # _close() may be called by one of the tasks itself
+            if t is not cur:
+                asyncio.cancel(t)
+        self.tasks = []
+        self.reader.ios.close()
+        self.reader.polls.close()
+        self.reader = self.writer = None
+        self.err = err or OSError(-1)
+        # Wake up everyone waiting for the server
+        self.acked.set()
+        # Slots are counted afresh, as messages in flight will be resent
+        # on reconnect. Publishers waiting on the old semaphore are woken
+        # up with slots of it, which they don't give back.
+        slots = self.slots
+        self.slots = Semaphore(self.window - len(self.inflight))
+        while slots.wlist:
+            slots.release()
+        for ev in self.subacks.values():
+            ev[0].set()
+
+    def ping(self):
+        yield from self._send(b"\xc0\0")
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        # Returns once the message is queued for sending. With qos=1, waits
+        # while window of unacknowledged messages is full.
+        assert qos < 2
+        topic = _b(topic)
+        msg = _b(msg)
+        hdr = bytearray(len(topic) + 9)
+        pid = 0
+        if qos:
+            slots = self.slots
+            yield from slots.acquire()
+            if self.err:
+                if slots is self.slots:
+                    slots.release()
+                raise self.err
+            pid = self._next_pid()
+        n = publish_hdr(hdr, topic, len(msg), qos, retain, pid)
+        pkt = hdr[:n] + msg
+        if qos:
+            self.inflight[pid] = pkt
+            self.acked.clear()
+        yield from self._send(pkt)
+
+    def wait_acked(self):
+        # Wait until all QoS 1 messages published so far are acknowledged
+        if self.inflight:
+            yield from self.acked.wait()
+        if self.err:
+            raise self.err
+
+    def subscribe(self, topic, qos=0):
+        assert self.cb is not None, "Subscribe callback is not set"
+        pid = self._next_pid()
+        ev = [Event(), None]
+        self.subacks[pid] = ev
+        try:
+            yield from self._send(subscribe_pkt(pid, topic, qos))
+            yield from ev[0].wait()
+        finally:
+            del self.subacks[pid]
+        if self.err:
+            raise self.err
+        if ev[1] == 0x80:
+            raise MQTTException(ev[1])
+
+    def _recv_pkt(self):
+        r = self.reader
+        op = (yield from r.readexactly(1))
+        if not op:
+            raise OSError(-1)
+        sz = 0
+        sh = 0
+        while True:
+            b = (yield from r.readexactly(1))
+            if not b:
+                raise OSError(-1)
+            b = b[0]
+            sz |= (b & 0x7f) << sh
+            if not b & 0x80:
+                break
+            sh += 7
+        data = b""
+        if sz:
+            data = yield from r.readexactly(sz)
+            if len(data) < sz:
+                raise OSError(-1)
+        self.last_rx = utime.ticks_ms()
+        return op[0], data
+
+    def _reader_task(self):
+        try:
+            while True:
+                op, data = yield from self._recv_pkt()
+                if op == 0x40:  # PUBACK
+                    pid = data[0] << 8 | data[1]
+                    if self.inflight.pop(pid, None) is not None:
+                        self.slots.release()
+                        if not self.inflight:
+                            self.acked.set()
+                elif op == 0x90:  # SUBACK
+                    ev = self.subacks.get(data[0] << 8 | data[1])
+                    if ev:
+                        ev[1] = data[2]
+                        ev[0].set()
+                elif op & 0xf0 == 0x30:  # PUBLISH
+                    tlen = data[0] << 8 | data[1]
+                    topic = data[2:2 + tlen]
+                    i = 2 + tlen
+                    if op & 6:
+                        pid = data[i] << 8 | data[i + 1]
+                        i += 2
+                    self.cb(topic, data[i:])
+                    if op & 6 == 2:
+                        yield from self._send(bytes((0x40, 2, pid >> 8, pid & 0xff)))
+                # PINGRESP and others only update last_rx
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._close(e)
+
+    def _ping_task(self):
+        period = self.keepalive * 1000 // 2
+        while True:
+            yield from asyncio.sleep_ms(period)
+            now = utime.ticks_ms()
+            if utime.ticks_diff(now, self.last_rx) > self.keepalive * 1500:
+                # Server didn't respond to pings
+                self._close(OSError(-1))
+                return
+            if utime.ticks_diff(now, self.last_tx) >= period:
+                try:
+                    yield from self.ping()
+                except OSError as e:
+                    self._close(e)
+                    return
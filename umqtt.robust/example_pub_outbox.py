@@ -0,0 +1,19 @@
+import time
+from umqtt.robust import MQTTClient
+
+
+c = MQTTClient("umqtt_client", "localhost")
+c.DEBUG = True
+c.connect()
+# Don't block on connection errors, but queue up to 32 messages in
+# memory, and the rest in a file.
+c.set_outbox(32, "outbox.dat")
+
+i = 0
+while 1:
+    # Returns immediately even if server is unreachable
+    c.publish(b"foo_topic", b"reading %d" % i, qos=1)
+    i += 1
+    time.sleep(1)
+    # Keep draining outbox (and reconnecting) between readings
+    c.flush()
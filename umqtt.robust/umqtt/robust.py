@@ -1,13 +1,132 @@
 import utime
+import urandom
+import ustruct as struct
 from . import simple
 
+
+class Outbox:
+    """Bounded FIFO of messages published while disconnected. It's a ring
+    of size entries; when it's full, further messages are appended to the
+    spill file (if given), otherwise the oldest message is dropped. Spill
+    file outlives the process, and messages left in it are sent after a
+    restart. The file starts with the offset of the next record to send,
+    updated as records are sent, so these aren't sent again."""
+
+    def __init__(self, size, spill=None):
+        self.ring = [None] * size
+        self.head = 0
+        self.cnt = 0
+        self.dropped = 0
+        self.spill = spill
+        # Records follow the offset header
+        self.spill_pos = 4
+        # Position after the record returned by peek(), if it's from file
+        self.spill_next = None
+        self.spilled = False
+        if spill:
+            try:
+                with open(spill, "rb") as f:
+                    hdr = f.read(4)
+                if len(hdr) == 4:
+                    self.spill_pos = struct.unpack("<I", hdr)[0]
+                    self.spilled = True
+            except OSError:
+                pass
+
+    def __bool__(self):
+        return bool(self.cnt) or self.spilled
+
+    def __len__(self):
+        # Number of messages in memory (spilled ones aren't counted)
+        return self.cnt
+
+    def put(self, rec):
+        size = len(self.ring)
+        # Once anything was spilled, new messages go to the file too, to
+        # keep them in order.
+        if self.spilled or self.cnt == size:
+            if self.spill:
+                self._spill(rec)
+                return
+            self.ring[self.head] = None
+            self.head = (self.head + 1) % size
+            self.cnt -= 1
+            self.dropped += 1
+        self.ring[(self.head + self.cnt) % size] = rec
+        self.cnt += 1
+
+    def _spill(self, rec):
+        topic, msg, retain, qos = rec
+        with open(self.spill, "ab" if self.spilled else "wb") as f:
+            if not self.spilled:
+                f.write(struct.pack("<I", self.spill_pos))
+            f.write(struct.pack("<BHI", qos << 1 | retain, len(topic), len(msg)))
+            f.write(topic)
+            f.write(msg)
+        self.spilled = True
+
+    def peek(self):
+        if self.cnt:
+            return self.ring[self.head]
+        if not self.spilled:
+            return None
+        with open(self.spill, "rb") as f:
+            f.seek(self.spill_pos)
+            hdr = f.read(7)
+            if len(hdr) == 7:
+                flags, tlen, mlen = struct.unpack("<BHI", hdr)
+                topic = f.read(tlen)
+                msg = f.read(mlen)
+                if len(msg) == mlen:
+                    self.spill_next = self.spill_pos + 7 + tlen + mlen
+                    return (topic, msg, flags & 1, flags >> 1)
+        # End of file (or truncated record)
+        self._reset_spill()
+        return None
+
+    def pop(self):
+        if self.cnt:
+            self.ring[self.head] = None
+            self.head = (self.head + 1) % len(self.ring)
+            self.cnt -= 1
+        elif self.spill_next is not None:
+            self.spill_pos = self.spill_next
+            self.spill_next = None
+            with open(self.spill, "r+b") as f:
+                f.write(struct.pack("<I", self.spill_pos))
+
+    def _reset_spill(self):
+        import uos
+        try:
+            uos.remove(self.spill)
+        except OSError:
+            pass
+        self.spill_pos = 4
+        self.spill_next = None
+        self.spilled = False
+
+
 class MQTTClient(simple.MQTTClient):
 
     DELAY = 2
+    MAX_DELAY = 60
     DEBUG = False
+    # Max number of messages sent from outbox per call
+    BURST = 16
+
+    outbox = None
+    # Set while sending a message in outbox mode, so wait_msg() (called
+    # by simple.MQTTClient.publish() for PUBACK) propagates errors.
+    _sending = False
+
+    def backoff(self, i):
+        # Exponential backoff with jitter, in ms: random time between half
+        # and full DELAY * 2**(i - 1), capped at MAX_DELAY.
+        d = min(self.DELAY * 1000 * (1 << min(i - 1, 16)), self.MAX_DELAY * 1000)
+        return d // 2 + urandom.getrandbits(24) % (d // 2 + 1)
 
     def delay(self, i):
-        utime.sleep(self.DELAY)
+        utime.sleep_ms(self.backoff(i))
 
     def log(self, in_reconnect, e):
         if self.DEBUG:
@@ -16,6 +135,16 @@ class MQTTClient(simple.MQTTClient):
             else:
                 print("mqtt: %r" % e)
 
+    def set_outbox(self, size=64, spill=None):
+        # Switch to non-blocking mode: publish() doesn't wait for the
+        # connection to be restored, but queues messages in an Outbox, and
+        # reconnect is attempted (with backoff) on further calls to
+        # publish()/wait_msg()/check_msg()/flush(). Note that reconnect
+        # attempt itself still blocks (DNS lookup, TCP/SSL handshake).
+        self.outbox = Outbox(size, spill)
+        self.fails = 0
+        self.next_try = utime.ticks_ms()
+
     def reconnect(self):
         i = 0
         while 1:
@@ -26,7 +155,70 @@ class MQTTClient(simple.MQTTClient):
                 i += 1
                 self.delay(i)
 
+    def _down(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        self.fails += 1
+        self.next_try = utime.ticks_add(utime.ticks_ms(), self.backoff(self.fails))
+
+    def _try_reconnect(self):
+        if utime.ticks_diff(utime.ticks_ms(), self.next_try) < 0:
+            return False
+        try:
+            super().connect(False)
+        except OSError as e:
+            self.log(True, e)
+            self._down()
+            return False
+        self.fails = 0
+        return True
+
+    def _send(self, topic, msg, retain, qos):
+        self._sending = True
+        try:
+            super().publish(topic, msg, retain, qos)
+        finally:
+            self._sending = False
+
+    def flush(self, n=0):
+        # Non-blocking mode: reconnect if needed and it's time to, and send
+        # up to n (default BURST) messages from outbox. Returns True if
+        # connected and outbox is empty.
+        if self.sock is None and not self._try_reconnect():
+            return False
+        ob = self.outbox
+        n = n or self.BURST
+        while ob and n:
+            rec = ob.peek()
+            if rec is None:
+                break
+            try:
+                self._send(*rec)
+            except OSError as e:
+                self.log(False, e)
+                self._down()
+                return False
+            ob.pop()
+            n -= 1
+        return not ob
+
     def publish(self, topic, msg, retain=False, qos=0):
+        ob = self.outbox
+        if ob is not None:
+            if not ob and self.sock is not None:
+                try:
+                    return self._send(topic, msg, retain, qos)
+                except OSError as e:
+                    self.log(False, e)
+                    self._down()
+            # Copy, as caller may reuse buffers
+            ob.put((bytes(simple._b(topic)), bytes(simple._b(msg)), retain, qos))
+            self.flush()
+            return
         while 1:
             try:
                 return super().publish(topic, msg, retain, qos)
@@ -34,10 +226,24 @@ class MQTTClient(simple.MQTTClient):
                 self.log(False, e)
             self.reconnect()
 
+    def check_msg(self):
+        # In outbox mode, there may be no socket to poll
+        if self.outbox is not None and not self.flush():
+            return None
+        return super().check_msg()
+
     def wait_msg(self):
+        if self._sending:
+            # Waiting for PUBACK from _send()
+            return super().wait_msg()
+        if self.outbox is not None and not self.flush():
+            return None
         while 1:
             try:
                 return super().wait_msg()
             except OSError as e:
                 self.log(False, e)
+            if self.outbox is not None:
+                self._down()
+                return None
             self.reconnect()
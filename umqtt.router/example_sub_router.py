@@ -0,0 +1,31 @@
+from umqtt.simple import MQTTClient
+from umqtt.router import Router
+
+# Publish test messages e.g. with:
+# mosquitto_pub -t sensors/kitchen/temp -m 21.5
+# mosquitto_pub -t cmd/led/on -m 1
+
+
+def on_temp(topic, msg):
+    print("Temperature:", topic, msg)
+
+
+def on_cmd(topic, msg):
+    print("Command:", topic, msg)
+
+
+def main(server="localhost"):
+    router = Router()
+    router.add("sensors/+/temp", on_temp)
+    router.add("cmd/#", on_cmd)
+    c = MQTTClient("umqtt_client", server)
+    c.set_callback(router)
+    c.connect()
+    c.subscribe(b"sensors/+/temp")
+    c.subscribe(b"cmd/#")
+    while True:
+        c.wait_msg()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+from umqtt.router import Router
+
+
+got = []
+
+def cb(name):
+    return lambda t, m: got.append((name, t, m))
+
+
+r = Router(default=cb("default"))
+r.add("a/b", cb("a/b"))
+r.add(b"a/+", cb("a/+"))
+r.add("a/#", cb("a/#"))
+r.add("+/+/c", cb("+/+/c"))
+r.add("#", cb("#"))
+r.add("$SYS/x", cb("$SYS/x"))
+
+
+def names(topic):
+    del got[:]
+    r(topic, b"msg")
+    return sorted(g[0] for g in got)
+
+
+assert names(b"a/b") == ["#", "a/#", "a/+", "a/b"]
+assert names(b"a") == ["#", "a/#"]
+assert names(b"a/b/c") == ["#", "+/+/c", "a/#"]
+assert names(b"x/y/c") == ["#", "+/+/c"]
+assert names(b"a/") == ["#", "a/#", "a/+"]
+# Wildcards at the first level don't match "$" topics
+assert names(b"$SYS/x") == ["$SYS/x"]
+assert names(b"$SYS/y") == ["default"]
+assert names(memoryview(b"a/b")) == ["#", "a/#", "a/+", "a/b"]
+
+r.remove("#")
+assert names(b"q") == ["default"]
+r.remove("a/b")
+assert names(b"a/b") == ["a/#", "a/+"]
+r.remove("+/+/c")
+assert "+" not in [k.decode() for k in r.root.kids]
+print("OK")
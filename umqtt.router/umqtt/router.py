@@ -0,0 +1,85 @@
+# Topic router for umqtt clients, dispatching subscribed messages to
+# callbacks registered for topic filters (which may use MQTT wildcards
+# "+" and "#"). Filters are stored in a trie keyed by topic levels, so
+# dispatching a message takes time proportional to the depth of its
+# topic, not to the number of filters.
+#
+# Router instance is a callable to be passed to client's set_callback().
+
+
+def _b(s):
+    if isinstance(s, str):
+        return s.encode()
+    return s
+
+
+class _Node:
+
+    def __init__(self):
+        self.kids = {}
+        self.cbs = []
+
+
+class Router:
+
+    def __init__(self, default=None):
+        self.root = _Node()
+        # Called for messages not matched by any filter
+        self.default = default
+
+    def add(self, filter, cb):
+        node = self.root
+        for l in _b(filter).split(b"/"):
+            n = node.kids.get(l)
+            if n is None:
+                n = node.kids[l] = _Node()
+            node = n
+        node.cbs.append(cb)
+
+    def remove(self, filter, cb=None):
+        # Remove cb (or all callbacks if None) for filter, prune empty nodes
+        path = []
+        node = self.root
+        for l in _b(filter).split(b"/"):
+            path.append((node, l))
+            node = node.kids.get(l)
+            if node is None:
+                return
+        if cb is None:
+            node.cbs = []
+        elif cb in node.cbs:
+            node.cbs.remove(cb)
+        while path and not node.cbs and not node.kids:
+            node, l = path.pop()
+            del node.kids[l]
+
+    def _dispatch(self, node, levels, i, topic, msg):
+        cnt = 0
+        kids = node.kids
+        # Topics starting with "$" aren't matched by wildcards at the
+        # first level.
+        wild = i or levels[0][:1] != b"$"
+        n = kids.get(b"#")
+        if n is not None and wild:
+            # Matches the parent level too, e.g. "a/#" matches "a"
+            for cb in n.cbs:
+                cb(topic, msg)
+                cnt += 1
+        if i == len(levels):
+            for cb in node.cbs:
+                cb(topic, msg)
+                cnt += 1
+            return cnt
+        n = kids.get(levels[i])
+        if n is not None:
+            cnt += self._dispatch(n, levels, i + 1, topic, msg)
+        n = kids.get(b"+")
+        if n is not None and wild:
+            cnt += self._dispatch(n, levels, i + 1, topic, msg)
+        return cnt
+
+    def __call__(self, topic, msg):
+        # Topic may be a memoryview (umqtt.simple with bufsize)
+        levels = bytes(topic).split(b"/")
+        if not self._dispatch(self.root, levels, 0, topic, msg) and self.default:
+            self.default(topic, msg)
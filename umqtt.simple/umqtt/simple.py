@@ -1,14 +1,114 @@
 import usocket as socket
+try:
+    from udnscache import getaddrinfo
+except ImportError:
+    from usocket import getaddrinfo
 import ustruct as struct
 from ubinascii import hexlify
 
 class MQTTException(Exception):
     pass
 
+
+# Packet encoding functions below are shared with other MQTT clients
+# (e.g. umqtt.aio).
+
+def _b(s):
+    if isinstance(s, str):
+        return s.encode()
+    return s
+
+
+def hdr_len(sz):
+    # Length of fixed header for packet with remaining length sz
+    n = 2
+    while sz > 0x7f:
+        sz >>= 7
+        n += 1
+    return n
+
+
+def put_len(buf, i, sz):
+    while sz > 0x7f:
+        buf[i] = (sz & 0x7f) | 0x80
+        sz >>= 7
+        i += 1
+    buf[i] = sz
+    return i + 1
+
+
+def put_str(buf, i, s):
+    n = len(s)
+    buf[i] = n >> 8
+    buf[i + 1] = n & 0xff
+    buf[i + 2:i + 2 + n] = s
+    return i + 2 + n
+
+
+def connect_pkt(client_id, clean_session=True, keepalive=0, user=None, password=None,
+                lw_topic=None, lw_msg=None, lw_qos=0, lw_retain=False):
+    flags = clean_session << 1
+    strs = [_b(client_id)]
+    if lw_topic:
+        strs.append(_b(lw_topic))
+        strs.append(_b(lw_msg))
+        flags |= 0x4 | (lw_qos & 0x1) << 3 | (lw_qos & 0x2) << 3
+        flags |= lw_retain << 5
+    if user is not None:
+        strs.append(_b(user))
+        strs.append(_b(password))
+        flags |= 0xC0
+    assert keepalive < 65536
+    sz = 10
+    for v in strs:
+        sz += 2 + len(v)
+    pkt = bytearray(hdr_len(sz) + sz)
+    pkt[0] = 0x10
+    i = put_len(pkt, 1, sz)
+    pkt[i:i + 10] = b"\0\x04MQTT\x04\0\0\0"
+    pkt[i + 7] = flags
+    pkt[i + 8] = keepalive >> 8
+    pkt[i + 9] = keepalive & 0xff
+    i += 10
+    for v in strs:
+        i = put_str(pkt, i, v)
+    return pkt
+
+
+def publish_hdr(buf, topic, msg_len, qos=0, retain=False, pid=0):
+    # Encode PUBLISH packet up to the payload into buf (which should have
+    # at least len(topic) + 9 bytes), return its length.
+    sz = 2 + len(topic) + msg_len
+    if qos > 0:
+        sz += 2
+    assert sz < 2097152
+    buf[0] = 0x30 | qos << 1 | retain
+    i = put_len(buf, 1, sz)
+    i = put_str(buf, i, topic)
+    if qos > 0:
+        buf[i] = pid >> 8
+        buf[i + 1] = pid & 0xff
+        i += 2
+    return i
+
+
+def subscribe_pkt(pid, topic, qos=0):
+    topic = _b(topic)
+    sz = 2 + 2 + len(topic) + 1
+    pkt = bytearray(hdr_len(sz) + sz)
+    pkt[0] = 0x82
+    i = put_len(pkt, 1, sz)
+    pkt[i] = pid >> 8
+    pkt[i + 1] = pid & 0xff
+    i = put_str(pkt, i + 2, topic)
+    pkt[i] = qos
+    return pkt
+
+
 class MQTTClient:
 
     def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
-                 ssl=False, ssl_params={}):
+                 ssl=False, ssl_params={}, bufsize=0):
         if port == 0:
             port = 8883 if ssl else 1883
         self.client_id = client_id
@@ -26,16 +126,59 @@ class MQTTClient:
         self.lw_msg = None
         self.lw_qos = 0
         self.lw_retain = False
+        # With bufsize, outgoing packets are assembled in one preallocated
+        # buffer, and incoming ones are read in bulk into another, with
+        # subscribed messages delivered as memoryviews into it.
+        self.obuf = self.rbuf = None
+        if bufsize:
+            self.obuf = bytearray(bufsize)
+            self.rbuf = bytearray(bufsize)
+            self.rmv = memoryview(self.rbuf)
+        self.rpos = self.rend = 0
 
     def _send_str(self, s):
         self.sock.write(struct.pack("!H", len(s)))
         self.sock.write(s)
 
+    def _read(self, n):
+        if self.rbuf is None:
+            return self.sock.read(n)
+        rmv = self.rmv
+        avail = self.rend - self.rpos
+        if n > len(self.rbuf):
+            # Doesn't fit into the buffer
+            res = bytearray(n)
+            res[:avail] = rmv[self.rpos:self.rend]
+            self.rpos = self.rend = 0
+            mv = memoryview(res)
+            while avail < n:
+                r = self.sock.readinto(mv[avail:])
+                if not r:
+                    raise OSError(-1)
+                avail += r
+            return mv
+        if avail < n:
+            if self.rpos + n > len(self.rbuf):
+                # Move partial packet to the start of the buffer
+                self.rbuf[:avail] = bytes(rmv[self.rpos:self.rend])
+                self.rpos = 0
+                self.rend = avail
+            while self.rend - self.rpos < n:
+                r = self.sock.readinto(rmv[self.rend:])
+                if r is None:
+                    # Non-blocking socket, no data
+                    return None
+                if not r:
+                    raise OSError(-1)
+                self.rend += r
+        self.rpos += n
+        return rmv[self.rpos - n:self.rpos]
+
     def _recv_len(self):
         n = 0
         sh = 0
         while 1:
-            b = self.sock.read(1)[0]
+            b = self._read(1)[0]
             n |= (b & 0x7f) << sh
             if not b & 0x80:
                 return n
@@ -54,47 +197,17 @@ class MQTTClient:
 
     def connect(self, clean_session=True):
         self.sock = socket.socket()
-        addr = socket.getaddrinfo(self.server, self.port)[0][-1]
+        addr = getaddrinfo(self.server, self.port)[0][-1]
         self.sock.connect(addr)
         if self.ssl:
             import ussl
             ctx = ussl.SSLContext()
             self.sock = ctx.wrap_socket(self.sock, **self.ssl_params)
-        premsg = bytearray(b"\x10\0\0\0\0\0")
-        msg = bytearray(b"\x04MQTT\x04\x02\0\0")
-
-        sz = 10 + 2 + len(self.client_id)
-        msg[6] = clean_session << 1
-        if self.user is not None:
-            sz += 2 + len(self.user) + 2 + len(self.pswd)
-            msg[6] |= 0xC0
-        if self.keepalive:
-            assert self.keepalive < 65536
-            msg[7] |= self.keepalive >> 8
-            msg[8] |= self.keepalive & 0x00FF
-        if self.lw_topic:
-            sz += 2 + len(self.lw_topic) + 2 + len(self.lw_msg)
-            msg[6] |= 0x4 | (self.lw_qos & 0x1) << 3 | (self.lw_qos & 0x2) << 3
-            msg[6] |= self.lw_retain << 5
-
-        i = 1
-        while sz > 0x7f:
-            premsg[i] = (sz & 0x7f) | 0x80
-            sz >>= 7
-            i += 1
-        premsg[i] = sz
-
-        self.sock.write(premsg, i + 2)
-        self.sock.write(msg)
-        #print(hex(len(msg)), hexlify(msg, ":"))
-        self._send_str(self.client_id)
-        if self.lw_topic:
-            self._send_str(self.lw_topic)
-            self._send_str(self.lw_msg)
-        if self.user is not None:
-            self._send_str(self.user)
-            self._send_str(self.pswd)
-        resp = self.sock.read(4)
+        self.rpos = self.rend = 0
+        self.sock.write(connect_pkt(self.client_id, clean_session, self.keepalive,
+                                    self.user, self.pswd, self.lw_topic, self.lw_msg,
+                                    self.lw_qos, self.lw_retain))
+        resp = self._read(4)
         assert resp[0] == 0x20 and resp[1] == 0x02
         if resp[3] != 0:
             raise MQTTException(resp[3])
@@ -108,34 +221,31 @@ class MQTTClient:
         self.sock.write(b"\xc0\0")
 
     def publish(self, topic, msg, retain=False, qos=0):
-        pkt = bytearray(b"\x30\0\0\0")
-        pkt[0] |= qos << 1 | retain
-        sz = 2 + len(topic) + len(msg)
-        if qos > 0:
-            sz += 2
-        assert sz < 2097152
-        i = 1
-        while sz > 0x7f:
-            pkt[i] = (sz & 0x7f) | 0x80
-            sz >>= 7
-            i += 1
-        pkt[i] = sz
-        #print(hex(len(pkt)), hexlify(pkt, ":"))
-        self.sock.write(pkt, i + 1)
-        self._send_str(topic)
+        topic = _b(topic)
+        msg = _b(msg)
+        pkt = self.obuf
+        if pkt is None or len(topic) + 9 > len(pkt):
+            pkt = bytearray(len(topic) + 9)
+        pid = 0
         if qos > 0:
             self.pid += 1
             pid = self.pid
-            struct.pack_into("!H", pkt, 0, pid)
-            self.sock.write(pkt, 2)
-        self.sock.write(msg)
+        n = publish_hdr(pkt, topic, len(msg), qos, retain, pid)
+        #print(hex(n), hexlify(pkt[:n], ":"))
+        if n + len(msg) <= len(pkt):
+            # Whole packet is sent with one write
+            pkt[n:n + len(msg)] = msg
+            self.sock.write(pkt, n + len(msg))
+        else:
+            self.sock.write(pkt, n)
+            self.sock.write(msg)
         if qos == 1:
             while 1:
                 op = self.wait_msg()
                 if op == 0x40:
-                    sz = self.sock.read(1)
-                    assert sz == b"\x02"
-                    rcv_pid = self.sock.read(2)
+                    sz = self._read(1)
+                    assert sz[0] == 2
+                    rcv_pid = self._read(2)
                     rcv_pid = rcv_pid[0] << 8 | rcv_pid[1]
                     if pid == rcv_pid:
                         return
@@ -144,19 +254,17 @@ class MQTTClient:
 
     def subscribe(self, topic, qos=0):
         assert self.cb is not None, "Subscribe callback is not set"
-        pkt = bytearray(b"\x82\0\0\0")
         self.pid += 1
-        struct.pack_into("!BH", pkt, 1, 2 + 2 + len(topic) + 1, self.pid)
+        pid = self.pid
+        pkt = subscribe_pkt(pid, topic, qos)
         #print(hex(len(pkt)), hexlify(pkt, ":"))
         self.sock.write(pkt)
-        self._send_str(topic)
-        self.sock.write(qos.to_bytes(1, "little"))
         while 1:
             op = self.wait_msg()
             if op == 0x90:
-                resp = self.sock.read(4)
+                resp = self._read(4)
                 #print(resp)
-                assert resp[1] == pkt[2] and resp[2] == pkt[3]
+                assert resp[1] == pid >> 8 and resp[2] == pid & 0xff
                 if resp[3] == 0x80:
                     raise MQTTException(resp[3])
                 return
@@ -166,34 +274,50 @@ class MQTTClient:
     # set by .set_callback() method. Other (internal) MQTT
     # messages processed internally.
     def wait_msg(self):
-        res = self.sock.read(1)
+        res = self._read(1)
         self.sock.setblocking(True)
         if res is None:
             return None
-        if res == b"":
+        if not res:
             raise OSError(-1)
-        if res == b"\xd0":  # PINGRESP
-            sz = self.sock.read(1)[0]
+        op = res[0]
+        if op == 0xd0:  # PINGRESP
+            sz = self._read(1)[0]
             assert sz == 0
             return None
-        op = res[0]
         if op & 0xf0 != 0x30:
             return op
         sz = self._recv_len()
-        topic_len = self.sock.read(2)
-        topic_len = (topic_len[0] << 8) | topic_len[1]
-        topic = self.sock.read(topic_len)
-        sz -= topic_len + 2
-        if op & 6:
-            pid = self.sock.read(2)
-            pid = pid[0] << 8 | pid[1]
-            sz -= 2
-        msg = self.sock.read(sz)
+        if self.rbuf is not None:
+            # Parse the whole packet from the receive buffer
+            pkt = self._read(sz)
+            topic_len = (pkt[0] << 8) | pkt[1]
+            topic = pkt[2:2 + topic_len]
+            i = 2 + topic_len
+            if op & 6:
+                pid = pkt[i] << 8 | pkt[i + 1]
+                i += 2
+            msg = pkt[i:]
+        else:
+            topic_len = self.sock.read(2)
+            topic_len = (topic_len[0] << 8) | topic_len[1]
+            topic = self.sock.read(topic_len)
+            sz -= topic_len + 2
+            if op & 6:
+                pid = self.sock.read(2)
+                pid = pid[0] << 8 | pid[1]
+                sz -= 2
+            msg = self.sock.read(sz)
         self.cb(topic, msg)
         if op & 6 == 2:
-            pkt = bytearray(b"\x40\x02\0\0")
-            struct.pack_into("!H", pkt, 2, pid)
-            self.sock.write(pkt)
+            pkt = self.obuf
+            if pkt is None:
+                pkt = bytearray(4)
+            pkt[0] = 0x40
+            pkt[1] = 2
+            pkt[2] = pid >> 8
+            pkt[3] = pid & 0xff
+            self.sock.write(pkt, 4)
         elif op & 6 == 4:
             assert 0
 
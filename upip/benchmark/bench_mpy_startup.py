@@ -0,0 +1,66 @@
+# Compare startup (import) time and heap usage of a module installed as
+# source and precompiled to .mpy, as done by "upip install --mpy".
+# Each import runs in a fresh interpreter process. Requires ast,
+# ucompiler, mpylib packages to be installed.
+#
+# pycopy bench_mpy_startup.py [N] [RUNS]
+import sys
+import uos
+import upip
+
+
+N = 300
+RUNS = 10
+if len(sys.argv) > 1:
+    N = int(sys.argv[1])
+if len(sys.argv) > 2:
+    RUNS = int(sys.argv[2])
+
+DIR = "/tmp/bench_mpy"
+
+# Child prints import time in us and heap allocated by import
+CHILD = """\
+import gc, utime, sys
+sys.path[0:0] = ["%s"]
+gc.collect()
+m = gc.mem_alloc()
+t = utime.ticks_us()
+import bench_mod
+print(utime.ticks_diff(utime.ticks_us(), t), gc.mem_alloc() - m)
+"""
+
+
+def make_module(fname):
+    with open(fname, "w") as f:
+        for i in range(N):
+            f.write("v%d = {'name': 'item%d', 'vals': [%d, %d, %d], 'tag': 'x' * %d}\n" % (i, i, i, i + 1, i + 2, i % 8))
+            f.write("if v%d['vals'][0] > %d:\n    v%d['big'] = True\n" % (i, N // 2, i))
+            f.write("def f%d(a, b=%d):\n    return a + b\n" % (i, i))
+
+
+def setup(d, mpy):
+    upip._makedirs(d + "/")
+    fname = d + "/bench_mod.py"
+    make_module(fname)
+    if mpy:
+        upip.compile_mpy(fname, "bench_mod.py")
+        uos.remove(fname)
+    with open(d + "/child.py", "w") as f:
+        f.write(CHILD % d)
+
+
+def bench(name, d):
+    tot_t = 0
+    mem = 0
+    for i in range(RUNS):
+        uos.system("%s %s/child.py > %s/out" % (sys.executable, d, d))
+        with open(d + "/out") as f:
+            t, mem = [int(x) for x in f.read().split()]
+        tot_t += t
+    print("%-6s import: %6dus  heap: %6d bytes" % (name, tot_t // RUNS, mem))
+
+
+setup(DIR + "/src", False)
+setup(DIR + "/mpy", True)
+bench("source", DIR + "/src")
+bench("mpy", DIR + "/mpy")
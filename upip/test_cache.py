@@ -0,0 +1,102 @@
+import uos
+import uio
+import uhashlib
+import ubinascii
+import urandom
+import upip
+
+
+DATA = b"package archive data"
+SHA = ubinascii.hexlify(uhashlib.sha256(DATA).digest()).decode()
+URL = "https://files.example/p/pkg-1.0.tar.gz"
+PAGE = b'<a href="%s#sha256=%s">pkg-1.0.tar.gz</a>\n' % (URL.encode(), SHA.encode())
+
+upip.cache_dir = "/tmp/upip-test-cache-%08x" % urandom.getrandbits(32)
+
+fetched = []
+
+
+def url_open(url):
+    fetched.append(url)
+    if url.endswith("/pkg/"):
+        return uio.BytesIO(PAGE)
+    if url == URL:
+        return uio.BytesIO(DATA)
+    raise upip.NotFoundError(url)
+
+upip.url_open = url_open
+
+
+# Index page is fetched once, then served from cache (name is normalized)
+assert upip.get_latest_simple("Pkg") == [URL, SHA]
+assert upip.get_latest_simple("pkg") == [URL, SHA]
+assert len(fetched) == 1, fetched
+
+# Expired index entry is refetched online, but still used offline
+upip.index_ttl = -1
+upip.cache_put_index("pkg", [URL, SHA])
+assert upip.get_latest_simple("pkg") == [URL, SHA]
+assert len(fetched) == 2, fetched
+upip.cache_put_index("pkg", [URL, SHA])
+upip.offline = True
+assert upip.get_latest_simple("pkg") == [URL, SHA]
+assert len(fetched) == 2, fetched
+upip.offline = False
+upip.index_ttl = 3600
+
+# Package archive
+assert upip.cache_get_pkg(URL, SHA) is None
+fname = upip.cache_fetch_pkg(URL, SHA)
+assert upip.cache_get_pkg(URL, SHA) == fname
+# sha from index is used only if it matches
+assert upip.cache_get_pkg(URL, "0" * 64) is None
+assert upip.cache_get_pkg(URL, None) == fname
+
+# Download not matching sha isn't cached
+try:
+    upip.cache_put_pkg_data(URL, b"corrupted", SHA)
+    assert False
+except ValueError:
+    pass
+assert upip.cache_get_pkg(URL, SHA) == fname
+
+# Archive corrupted in cache is detected and dropped
+with open(fname, "wb") as f:
+    f.write(DATA[:5])
+assert upip.cache_get_pkg(URL, SHA) is None
+try:
+    uos.stat(fname)
+    assert False
+except OSError:
+    pass
+assert upip.cache_put_pkg_data(URL, DATA, SHA) == fname
+assert upip.cache_get_pkg(URL, SHA) == fname
+
+# Temporary file names are unique
+assert upip.cache_tmp(fname) != upip.cache_tmp(fname)
+
+# Offline, anything not in cache is an error, not a network access
+upip.offline = True
+n = len(fetched)
+for f in (lambda: upip.get_latest_simple("other"),
+          lambda: upip.cache_get_pkg(URL + "2", None)):
+    try:
+        f()
+        assert False
+    except upip.NotFoundError:
+        pass
+assert len(fetched) == n
+assert upip.cache_get_pkg(URL, SHA) == fname
+
+
+def rmtree(d):
+    for e in uos.ilistdir(d):
+        p = d + "/" + e[0]
+        if e[1] == 0x4000:
+            rmtree(p)
+        else:
+            uos.remove(p)
+    uos.rmdir(d)
+
+rmtree(upip.cache_dir)
+print("OK")
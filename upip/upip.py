@@ -19,12 +19,25 @@ gc.collect()
 debug = False
 install_path = None
 cleanup_files = []
+# Local package cache directory (None - disabled), see cache_*() below
+cache_dir = None
+# Use only the cache, never network
+offline = False
+# Seconds for which cached index pages are considered up to date
+index_ttl = 3600
+# Precompile installed modules to .mpy: 0 - no, 1 - keep source too,
+# 2 - remove source
+precompile = 0
 gzdict_sz = 16 + 15
 gzdict_buf = None
 
+# Buffer for extracting and skipping files, reallocated by init_bufs()
+# according to available memory (or set file_buf_sz before that)
+file_buf_sz = None
 file_buf = bytearray(512)
 
 simple_lst_re = ure.compile('<a href="(.+?)#')
+simple_hash_re = ure.compile('#sha256=([0-9a-f]+)')
 
 
 class NotFoundError(Exception):
@@ -103,8 +116,72 @@ def install_tar(f, prefix):
                 _makedirs(outfname)
                 subf = f.extractfile(info)
                 save_file(outfname, subf)
+                if precompile and outfname.endswith(".py"):
+                    install_mpy(outfname, fname)
     return meta
 
+def same_code(co, co2):
+    # Compare names, bytecode size and nested code objects (which .mpy
+    # stores after other constants).
+    from ucodetype import CodeType
+    if list(co2.co_names) != list(co.co_names) or len(co2.co_code) != len(co.co_code):
+        return False
+    sub = [c for c in co.co_consts if isinstance(c, CodeType)]
+    sub2 = [c for c in co2.co_consts if isinstance(c, CodeType)]
+    if len(sub) != len(sub2):
+        return False
+    for i in range(len(sub)):
+        if not same_code(sub[i], sub2[i]):
+            return False
+    return True
+
+def compile_mpy(fname, src_name):
+    # Compile module to .mpy using ast, ucompiler and mpylib packages, and
+    # check that the result loads back. Returns .mpy file name.
+    import ast
+    import opcode
+    import mpylib
+    from ucompiler import ucompiler
+    opcode.config.MICROPY_OPT_CACHE_MAP_LOOKUP_IN_BYTECODE = 1
+
+    with open(fname) as f:
+        tree = ast.parse(f.read())
+    co = ucompiler.compile_ast(tree, src_name)
+    del tree
+
+    mpy_fname = fname[:-3] + ".mpy"
+    try:
+        with open(mpy_fname, "wb") as f:
+            mpy = mpylib.MPYWriter(f)
+            mpy.write_header(
+                mpylib.MPY_VERSION,
+                mpylib.MICROPY_PY_BUILTINS_STR_UNICODE | mpylib.MICROPY_OPT_CACHE_MAP_LOOKUP_IN_BYTECODE,
+                31
+            )
+            mpy.write_code(co)
+        with open(mpy_fname, "rb") as f:
+            co2 = mpylib.load(f)
+        if not same_code(co, co2):
+            raise ValueError("verification failed")
+    except:
+        os.remove(mpy_fname)
+        raise
+    return mpy_fname
+
+def install_mpy(fname, src_name):
+    try:
+        compile_mpy(fname, src_name)
+    except Exception as e:
+        # Module stays installed as source
+        print("Warning: Cannot precompile %s: %r" % (src_name, e))
+        return
+    finally:
+        gc.collect()
+    if debug:
+        print("Precompiled " + src_name)
+    if precompile > 1:
+        os.remove(fname)
+
 def expandhome(s):
     if "~/" in s:
         h = os.getenv("HOME")
@@ -114,7 +191,7 @@ def expandhome(s):
 
 def init_bufs():
     # Calculate gzip dictionary size to use
-    global gzdict_sz, gzdict_buf
+    global gzdict_sz, gzdict_buf, file_buf
     if gzdict_buf:
         return
     sz = gc.mem_free() + gc.mem_alloc()
@@ -123,10 +200,18 @@ def init_bufs():
         gzdict_buf = bytearray(4096)
     else:
         gzdict_buf = bytearray(32768)
+        if file_buf_sz is None:
+            file_buf = bytearray(16384)
+    if file_buf_sz:
+        file_buf = bytearray(file_buf_sz)
 
 
 import ussl
 import usocket
+try:
+    from udnscache import getaddrinfo
+except ImportError:
+    from usocket import getaddrinfo
 warn_ussl = True
 ssl_ctx = ussl.SSLContext()
 
@@ -138,7 +223,7 @@ def url_open(url):
 
     proto, _, host, urlpath = url.split('/', 3)
     try:
-        ai = usocket.getaddrinfo(host, 443, 0, usocket.SOCK_STREAM)
+        ai = getaddrinfo(host, 443, 0, usocket.SOCK_STREAM)
     except OSError as e:
         fatal("Unable to resolve %s (no Internet?)" % host, e)
     #print("Address infos:", ai)
@@ -191,21 +276,179 @@ def get_latest_url_json(name):
     assert len(packages) == 1
     return packages[0]["url"]
 
-def get_latest_url_simple(name):
+def normalize_name(name):
     # Stupid PEP 503 normalization
-    name = name.replace("_", "-").replace(".", "-").lower()
-    f = url_open("https://pypi.org/simple/%s/" % name)
+    return name.replace("_", "-").replace(".", "-").lower()
+
+def parse_simple_line(l, res):
+    m = simple_lst_re.search(l)
+    if m:
+        res[0] = m.group(1)
+        m = simple_hash_re.search(l)
+        res[1] = m.group(1) if m else None
+
+def get_latest_simple(name):
+    # Returns (url, sha256 hex digest or None) of the latest package
+    # version.
+    res = cache_get_index(name)
+    if res:
+        return res
+    f = url_open("https://pypi.org/simple/%s/" % normalize_name(name))
     try:
-        last_url = None
+        res = [None, None]
         while 1:
             l = f.readline().decode()
             if not l: break
-            m = simple_lst_re.search(l)
-            if m:
-                last_url = m.group(1)
-        return last_url
+            parse_simple_line(l, res)
+    finally:
+        f.close()
+    cache_put_index(name, res)
+    return res
+
+def get_latest_url_simple(name):
+    return get_latest_simple(name)[0]
+
+
+# Local package cache. It's shared by any number of upip processes,
+# so files in it are never modified, but written to a temporary file
+# first and then atomically renamed. Layout:
+#   index/<name> - "<expiry time> <url> <sha256>" from the index page
+#   url/<sha256 of url> - sha256 of the package archive from url
+#   pkg/<sha256>.tar.gz - package archive itself
+
+def cache_file(*parts):
+    return expandhome(cache_dir) + "/" + "/".join(parts)
+
+def hexdigest(h):
+    import ubinascii
+    return ubinascii.hexlify(h.digest()).decode()
+
+def url_key(url):
+    import uhashlib
+    return hexdigest(uhashlib.sha256(url.encode()))
+
+def cache_tmp(fname):
+    import urandom
+    _makedirs(fname)
+    # Random seed may be the same in concurrent processes, so process
+    # id (where available) is included too.
+    try:
+        pid = os.getpid()
+    except AttributeError:
+        pid = 0
+    return "%s.%d.%08x.tmp" % (fname, pid, urandom.getrandbits(32))
+
+def cache_write(fname, data):
+    tmp = cache_tmp(fname)
+    try:
+        with open(tmp, "w") as f:
+            f.write(data)
+        os.rename(tmp, fname)
+    except OSError:
+        # Cache is just an optimization
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def cache_read(fname):
+    try:
+        with open(fname) as f:
+            return f.read()
+    except OSError:
+        return None
+
+def cache_miss(what):
+    if offline:
+        raise NotFoundError("%s not in cache" % what)
+    return None
+
+def cache_get_index(name):
+    if not cache_dir:
+        return None
+    import utime
+    l = cache_read(cache_file("index", normalize_name(name)))
+    if l:
+        l = l.split()
+        if offline or int(l[0]) > utime.time():
+            return [l[1], l[2] if l[2] != "-" else None]
+    return cache_miss(name)
+
+def cache_put_index(name, res):
+    if not cache_dir or not res[0]:
+        return
+    import utime
+    cache_write(cache_file("index", normalize_name(name)),
+        "%d %s %s\n" % (utime.time() + index_ttl, res[0], res[1] or "-"))
+
+def file_sha256(fname):
+    import uhashlib
+    h = uhashlib.sha256()
+    with open(fname, "rb") as f:
+        while True:
+            sz = f.readinto(file_buf)
+            if not sz:
+                break
+            h.update(memoryview(file_buf)[:sz])
+    return hexdigest(h)
+
+def cache_get_pkg(url, sha):
+    # Returns file name of cached archive for url, if any. Cached entry
+    # is used only if it matches sha (if known), and archive contents
+    # still match its digest.
+    if not cache_dir:
+        return None
+    digest = cache_read(cache_file("url", url_key(url)))
+    if digest and (not sha or sha == digest):
+        fname = cache_file("pkg", digest + ".tar.gz")
+        try:
+            if file_sha256(fname) == digest:
+                return fname
+            # Corrupted (e.g. truncated on a full disk), drop it
+            os.remove(fname)
+        except OSError:
+            pass
+    return cache_miss(url)
+
+def cache_put_pkg(url, tmp, digest, sha):
+    # Moves downloaded archive from tmp file into cache, returns its
+    # file name.
+    if sha and sha != digest:
+        os.remove(tmp)
+        raise ValueError("sha256 mismatch for " + url)
+    fname = cache_file("pkg", digest + ".tar.gz")
+    os.rename(tmp, fname)
+    cache_write(cache_file("url", url_key(url)), digest)
+    return fname
+
+def cache_fetch_pkg(url, sha):
+    # Downloads url into the cache, returns file name
+    import uhashlib
+    h = uhashlib.sha256()
+    tmp = cache_tmp(cache_file("pkg", "_"))
+    f = url_open(url)
+    try:
+        with open(tmp, "wb") as outf:
+            try:
+                while True:
+                    sz = f.readinto(file_buf)
+                    if not sz:
+                        break
+                    h.update(memoryview(file_buf)[:sz])
+                    outf.write(file_buf, sz)
+            except:
+                os.remove(tmp)
+                raise
     finally:
         f.close()
+    return cache_put_pkg(url, tmp, hexdigest(h), sha)
+
+def cache_put_pkg_data(url, data, sha):
+    import uhashlib
+    tmp = cache_tmp(cache_file("pkg", "_"))
+    with open(tmp, "wb") as f:
+        f.write(data)
+    return cache_put_pkg(url, tmp, hexdigest(uhashlib.sha256(data)), sha)
 
 
 def fatal(msg, exc=None):
@@ -216,23 +459,36 @@ def fatal(msg, exc=None):
 
 def install_pkg(pkg_spec, install_path):
     #package_url = get_latest_url_json(pkg_spec)
-    package_url = get_latest_url_simple(pkg_spec)
+    package_url, sha = get_latest_simple(pkg_spec)
 
     print("Installing %s from %s" % (pkg_spec, package_url))
     package_fname = op_basename(package_url)
-    f1 = url_open(package_url)
+    if cache_dir:
+        fname = cache_get_pkg(package_url, sha)
+        if fname is None:
+            fname = cache_fetch_pkg(package_url, sha)
+        f1 = open(fname, "rb")
+    else:
+        f1 = url_open(package_url)
     try:
-        f2 = uzlib.DecompIO(f1, gzdict_sz, gzdict_buf)
-        f3 = tarfile.TarFile(fileobj=f2)
-        meta = install_tar(f3, install_path)
+        meta = install_targz(f1, install_path)
     finally:
         f1.close()
-    del f3
-    del f2
     gc.collect()
     return meta
 
-def install(to_install, install_path=None):
+def install_targz(f1, install_path):
+    f2 = uzlib.DecompIO(f1, gzdict_sz, gzdict_buf)
+    f3 = tarfile.TarFile(fileobj=f2, buf=file_buf)
+    return install_tar(f3, install_path)
+
+def get_deps(meta):
+    deps = meta.get("deps", "").rstrip()
+    if deps:
+        return deps.decode("utf-8").split("\n")
+    return []
+
+def prepare_install(to_install, install_path):
     # Called here, because install() is advertized as public UI function
     # (e.g. for baremetal ports).
     init_bufs()
@@ -243,6 +499,10 @@ def install(to_install, install_path=None):
     if not isinstance(to_install, list):
         to_install = [to_install]
     print("Installing to: " + install_path)
+    return to_install, install_path
+
+def install(to_install, install_path=None):
+    to_install, install_path = prepare_install(to_install, install_path)
     # sets would be perfect here, but don't depend on them
     installed = []
     try:
@@ -256,16 +516,139 @@ def install(to_install, install_path=None):
             installed.append(pkg_spec)
             if debug:
                 print(meta)
-            deps = meta.get("deps", "").rstrip()
-            if deps:
-                deps = deps.decode("utf-8").split("\n")
-                to_install.extend(deps)
+            to_install.extend(get_deps(meta))
     except Exception as e:
         print("Error installing '{}': {!r}, packages may be partially installed".format(
                 pkg_spec, e),
             file=sys.stderr)
         raise e
 
+
+# Concurrent installation, using uasyncio. Unlike the functions above,
+# which stream each package straight from network to filesystem, this
+# keeps whole downloaded archives in memory, so is not suitable for
+# small targets.
+
+def url_get_async(url):
+    import uasyncio as asyncio
+
+    if debug:
+        print(url)
+
+    proto, _, host, urlpath = url.split('/', 3)
+    ssl = proto == "https:"
+    try:
+        reader, writer = yield from asyncio.open_connection(
+            host, 443 if ssl else 80, ssl=ssl, server_hostname=host)
+    except OSError as e:
+        fatal("Unable to connect to %s (no Internet?)" % host, e)
+    try:
+        yield from writer.awritestr("GET /%s HTTP/1.0\r\nHost: %s\r\n\r\n" % (urlpath, host))
+        l = yield from reader.readline()
+        protover, status, msg = l.split(None, 2)
+        if status != b"200":
+            if status == b"404" or status == b"301":
+                raise NotFoundError("Package not found")
+            raise ValueError(status)
+        while 1:
+            l = yield from reader.readline()
+            if not l:
+                raise ValueError("Unexpected EOF in HTTP headers")
+            if l == b'\r\n':
+                break
+        body = []
+        while 1:
+            b = yield from reader.read(4096)
+            if not b:
+                break
+            body.append(b)
+        return b"".join(body)
+    finally:
+        yield from writer.aclose()
+
+def get_latest_simple_async(name):
+    res = cache_get_index(name)
+    if res:
+        return res
+    data = yield from url_get_async("https://pypi.org/simple/%s/" % normalize_name(name))
+    res = [None, None]
+    for l in data.decode().split("\n"):
+        parse_simple_line(l, res)
+    cache_put_index(name, res)
+    return res
+
+def install_concurrent(to_install, install_path=None, concurrency=4):
+    # Packages from the queue are fetched by up to concurrency tasks at
+    # once. Dependencies become known only once a package is downloaded
+    # (from its requires.txt), and are queued right away, so the graph is
+    # resolved and fetched in parallel. Extraction doesn't yield to the
+    # event loop, so it happens one package at a time, and can use
+    # the shared buffers.
+    import uio
+    import uasyncio as asyncio
+
+    to_install, install_path = prepare_install(to_install, install_path)
+    queue = []
+    for pkg_spec in to_install:
+        if pkg_spec not in queue:
+            queue.append(pkg_spec)
+    # Specs ever queued, to not install anything twice
+    seen = queue[:]
+    loop = asyncio.get_event_loop()
+    # Number of tasks running, task waiting for them, first error
+    state = [0, None, None]
+
+    def spawn():
+        while queue and state[0] < concurrency and not state[2]:
+            state[0] += 1
+            loop.create_task(worker(queue.pop(0)))
+
+    def worker(pkg_spec):
+        try:
+            package_url, sha = yield from get_latest_simple_async(pkg_spec)
+            print("Installing %s from %s" % (pkg_spec, package_url))
+            fname = cache_get_pkg(package_url, sha)
+            if fname is None:
+                data = yield from url_get_async(package_url)
+                if cache_dir:
+                    fname = cache_put_pkg_data(package_url, data, sha)
+                else:
+                    meta = install_targz(uio.BytesIO(data), install_path)
+                del data
+            if fname:
+                with open(fname, "rb") as f1:
+                    meta = install_targz(f1, install_path)
+            gc.collect()
+            if debug:
+                print(meta)
+            for dep in get_deps(meta):
+                if dep not in seen:
+                    seen.append(dep)
+                    queue.append(dep)
+        except Exception as e:
+            if not state[2]:
+                state[2] = (pkg_spec, e)
+        finally:
+            state[0] -= 1
+            spawn()
+            if not state[0]:
+                loop.call_soon(state[1])
+
+    def run():
+        state[1] = loop.cur_task
+        spawn()
+        if state[0]:
+            # Woken up by the last task finishing
+            yield False
+
+    loop.run_until_complete(run())
+    if state[2]:
+        pkg_spec, e = state[2]
+        print("Error installing '{}': {!r}, packages may be partially installed".format(
+                pkg_spec, e),
+            file=sys.stderr)
+        raise e
+
 def get_install_path():
     global install_path
     if install_path is None:
@@ -284,12 +667,26 @@ def cleanup():
 def help():
     print("""\
 upip - Simple PyPI package manager for Pycopy
-Usage: pycopy -m upip install [-p <path>] <package>... | -r <requirements.txt>
+Usage: pycopy -m upip install [-p <path>] [-j <N>] [--mpy | --mpy-keep-source]
+                             [--cache <dir> [--offline]]
+                             <package>... | -r <requirements.txt>
 import upip; upip.install(package_or_list, [<path>])
 
 If <path> is not given, packages will be installed into sys.path[1]
 (can be set from PYCOPYPATH environment variable, if current system
-supports that).""")
+supports that).
+
+With -j, up to <N> packages are downloaded concurrently (requires
+uasyncio and enough memory to hold downloaded packages).
+
+With --mpy, modules are precompiled to .mpy (with ast, ucompiler, mpylib
+packages installed), and source is removed (otherwise it would take
+precedence on import). --mpy-keep-source keeps it. Modules which can't
+be compiled are left as source.
+
+With --cache, downloaded packages and index pages are stored in <dir>
+(which can be shared by concurrent upip runs) and reused. With
+--offline, packages are installed only from the cache.""")
     print("Current value of sys.path[1]:", sys.path[1])
     print("""\
 
@@ -300,6 +697,7 @@ for installation, upip does not support arbitrary code in setup.py.
 def main():
     global debug
     global install_path
+    global cache_dir, offline, precompile
     install_path = None
 
     if len(sys.argv) < 2 or sys.argv[1] == "-h" or sys.argv[1] == "--help":
@@ -310,6 +708,7 @@ def main():
         fatal("Only 'install' command supported")
 
     to_install = []
+    jobs = 1
 
     i = 2
     while i < len(sys.argv) and sys.argv[i][0] == "-":
@@ -332,17 +731,34 @@ def main():
                     if l[0] == "#":
                         continue
                     to_install.append(l.rstrip())
+        elif opt == "-j":
+            jobs = int(sys.argv[i])
+            i += 1
+        elif opt == "--cache":
+            cache_dir = sys.argv[i]
+            i += 1
+        elif opt == "--offline":
+            offline = True
+        elif opt == "--mpy":
+            precompile = 2
+        elif opt == "--mpy-keep-source":
+            precompile = 1
         elif opt == "--debug":
             debug = True
         else:
             fatal("Unknown/unsupported option: " + opt)
 
     to_install.extend(sys.argv[i:])
+    if offline and not cache_dir:
+        fatal("--offline requires --cache")
     if not to_install:
         help()
         return
 
-    install(to_install)
+    if jobs > 1:
+        install_concurrent(to_install, concurrency=jobs)
+    else:
+        install(to_install)
 
     if not debug:
         cleanup()
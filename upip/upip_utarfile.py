@@ -13,18 +13,24 @@ import uctypes
 TAR_HEADER = {
     "name": (uctypes.ARRAY | 0, uctypes.UINT8 | 100),
     "size": (uctypes.ARRAY | 124, uctypes.UINT8 | 11),
+    "magic": (uctypes.ARRAY | 257, uctypes.UINT8 | 6),
+    "prefix": (uctypes.ARRAY | 345, uctypes.UINT8 | 155),
 }
 
 DIRTYPE = "dir"
 REGTYPE = "file"
 
+# Size of buffer used to skip entries in non-seekable streams
+BUFSIZE = 4096
+
 def roundup(val, align):
     return (val + align - 1) & ~(align - 1)
 
 class FileSection:
 
-    def __init__(self, f, content_len, aligned_len):
+    def __init__(self, f, content_len, aligned_len, tar=None):
         self.f = f
+        self.tar = tar
         self.content_len = content_len
         self.align = aligned_len - content_len
 
@@ -50,11 +56,11 @@ class FileSection:
     def skip(self):
         sz = self.content_len + self.align
         if sz:
-            buf = bytearray(16)
-            while sz:
-                s = min(sz, 16)
-                self.f.readinto(buf, s)
-                sz -= s
+            if self.tar:
+                self.tar._skip(sz)
+            else:
+                TarFile._skip_read(self.f, bytearray(min(sz, BUFSIZE)), sz)
+            self.content_len = self.align = 0
 
 class TarInfo:
 
@@ -63,12 +69,39 @@ class TarInfo:
 
 class TarFile:
 
-    def __init__(self, name=None, fileobj=None):
+    def __init__(self, name=None, fileobj=None, buf=None):
         if fileobj:
             self.f = fileobj
         else:
             self.f = open(name, "rb")
         self.subf = None
+        # Buffer for skipping (may be shared with the caller), allocated
+        # on first use if not given
+        self.buf = buf
+        # Whether f.seek() works, None until first tried
+        self.seekable = None
+
+    def _skip(self, sz):
+        if self.seekable is not False:
+            try:
+                self.f.seek(sz, 1)
+                self.seekable = True
+                return
+            except (AttributeError, OSError):
+                self.seekable = False
+        if self.buf is None:
+            self.buf = bytearray(BUFSIZE)
+        self._skip_read(self.f, self.buf, sz)
+
+    @staticmethod
+    def _skip_read(f, buf, sz):
+        bufsz = len(buf)
+        while sz:
+            s = min(sz, bufsz)
+            s = f.readinto(buf, s)
+            if not s:
+                break
+            sz -= s
 
     def next(self):
             if self.subf:
@@ -85,9 +118,12 @@ class TarFile:
 
             d = TarInfo()
             d.name = str(h.name, "utf-8").rstrip("\0")
+            # ustar format splits long names into prefix and name
+            if h.prefix[0] and bytes(h.magic) == b"ustar\0":
+                d.name = str(h.prefix, "utf-8").rstrip("\0") + "/" + d.name
             d.size = int(bytes(h.size), 8)
             d.type = [REGTYPE, DIRTYPE][d.name[-1] == "/"]
-            self.subf = d.subf = FileSection(self.f, d.size, roundup(d.size, 512))
+            self.subf = d.subf = FileSection(self.f, d.size, roundup(d.size, 512), self)
             return d
 
     def __iter__(self):
@@ -0,0 +1,17 @@
+import urequests
+
+# Session keeps connections alive, so consecutive requests to the same
+# host don't pay for TCP (and SSL) handshakes again.
+with urequests.Session(max_conns=2, idle_timeout=10) as s:
+    for i in range(3):
+        r = s.get("http://httpbin.org/get?i=%d" % i)
+        print(r.status_code, r.json()["args"])
+        # Reading the body completely (or via .content/.text/.json())
+        # returns connection to the pool.
+        r.close()
+
+# Large compressed responses can be processed in constant memory
+with urequests.Session() as s:
+    r = s.get("http://httpbin.org/gzip", headers={"Accept-Encoding": "gzip"})
+    for chunk in r.iter_content(256):
+        print(chunk)
@@ -1,5 +1,17 @@
 # (c) 2016-2021 Paul Sokolovsky, MIT license, https://github.com/pfalcon/pycopy-lib
 import usocket
+import utime
+import uio
+try:
+    from udnscache import getaddrinfo
+except ImportError:
+    from usocket import getaddrinfo
+
+
+# Window size (log2 of bytes) for decompressing gzip/deflate encoded
+# bodies, bounds the memory used for decompression. Servers generally
+# use the maximum of 15 (32KB).
+WBITS = 15
 
 
 class Request:
@@ -12,16 +24,37 @@ class Response:
         self.raw = f
         self.encoding = "utf-8"
         self._cached = None
+        # Decompressing stream on top of raw, if body is compressed
+        self._dec = None
+
+    def _decode(self, enc):
+        import uzlib
+        if enc == b"gzip":
+            self._dec = uzlib.DecompIO(self.raw, 16 + WBITS)
+        elif enc == b"deflate":
+            self._dec = uzlib.DecompIO(self.raw, WBITS)
+
+    def _drain(self):
+        # Compressed stream ends before the underlying one (e.g. gzip
+        # trailer follows it). Read it to the end, so the connection
+        # can be reused.
+        if self._dec is not None:
+            while self.raw.read(256):
+                pass
 
     def close(self):
         if self.raw:
             self.raw.close()
             self.raw = None
+        self._dec = None
         self._cached = None
 
     @property
     def content(self):
         if self._cached is None:
+            if self._dec is not None:
+                self._cached = b"".join(self.iter_content(1024))
+                return self._cached
             try:
                 self._cached = self.raw.read()
             finally:
@@ -29,6 +62,27 @@ class Response:
                 self.raw = None
         return self._cached
 
+    def iter_content(self, chunk_size=1024):
+        f = self._dec or self.raw
+        try:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    self._drain()
+                    break
+                yield data
+        finally:
+            self.close()
+
+    def readinto(self, buf):
+        if self.raw is None:
+            return 0
+        n = (self._dec or self.raw).readinto(buf)
+        if not n:
+            self._drain()
+            self.close()
+        return n
+
     @property
     def text(self):
         return str(self.content, self.encoding)
@@ -38,6 +92,137 @@ class Response:
         return ujson.loads(self.content)
 
 
+def _b(v):
+    if isinstance(v, str):
+        return v.encode()
+    return v
+
+
+def _close(s):
+    s.close()
+
+
+class _Body(uio.IOBase):
+    # Base for readers of a response body delimited within a connection.
+    # Once the body is read completely, the connection is passed to
+    # done() (e.g. to return it to the pool). Being a stream (IOBase
+    # subclass with readinto()), it can be wrapped by uzlib.DecompIO.
+
+    def _eof(self):
+        s = self.s
+        self.s = None
+        self.done(s)
+
+    def read(self, sz=-1):
+        if sz < 0:
+            res = []
+            while self.s is not None and self._avail():
+                res.append(self.read(self.left))
+            return b"".join(res)
+        if self.s is None or not self._avail():
+            return b""
+        if sz > self.left:
+            sz = self.left
+        data = self.s.read(sz)
+        if not data:
+            # Connection closed prematurely
+            self.close()
+            return b""
+        self._consumed(len(data))
+        return data
+
+    def readinto(self, buf):
+        if self.s is None or not self._avail():
+            return 0
+        if len(buf) > self.left:
+            buf = memoryview(buf)[:self.left]
+        n = self.s.readinto(buf)
+        if not n:
+            self.close()
+            return 0
+        self._consumed(n)
+        return n
+
+    def close(self):
+        # Body wasn't read completely, connection can't be reused
+        if self.s is not None:
+            self.s.close()
+            self.s = None
+
+
+class _LengthReader(_Body):
+    # Body of a known length.
+
+    def __init__(self, s, n, done):
+        self.s = s
+        self.left = n
+        self.done = done
+        if not n:
+            self._eof()
+
+    def _avail(self):
+        return self.left
+
+    def _consumed(self, n):
+        self.left -= n
+        if not self.left:
+            self._eof()
+
+
+class _ChunkedReader(_Body):
+    # Body with chunked transfer encoding, decoded on the fly. Reads
+    # return data from at most one chunk.
+
+    def __init__(self, s, done):
+        self.s = s
+        self.left = 0
+        self.done = done
+
+    def _avail(self):
+        if not self.left:
+            l = self.s.readline()
+            if not l:
+                self.close()
+                return 0
+            self.left = int(l.split(b";", 1)[0], 16)
+            if not self.left:
+                # Last chunk, skip trailer
+                while True:
+                    l = self.s.readline()
+                    if not l or l == b"\r\n":
+                        break
+                if l:
+                    self._eof()
+                else:
+                    self.close()
+        return self.left
+
+    def _consumed(self, n):
+        self.left -= n
+        if not self.left:
+            # CRLF after chunk data
+            self.s.read(2)
+
+
+def _parse_url(url):
+    try:
+        proto, dummy, host, path = url.split("/", 3)
+    except ValueError:
+        proto, dummy, host = url.split("/", 2)
+        path = ""
+    if proto == "http:":
+        port = 80
+    elif proto == "https:":
+        port = 443
+    else:
+        raise ValueError("Unsupported protocol: " + proto)
+
+    if ":" in host:
+        host, port = host.split(":", 1)
+        port = int(port)
+    return proto, host, port, path
+
+
 def request(method, url, data=None, json=None, headers={}, auth=None, stream=None, parse_headers=True):
     redir_cnt = 1
     if json is not None:
@@ -46,22 +231,9 @@ def request(method, url, data=None, json=None, headers={}, auth=None, stream=Non
         data = ujson.dumps(json)
 
     while True:
-        try:
-            proto, dummy, host, path = url.split("/", 3)
-        except ValueError:
-            proto, dummy, host = url.split("/", 2)
-            path = ""
-        if proto == "http:":
-            port = 80
-        elif proto == "https:":
+        proto, host, port, path = _parse_url(url)
+        if proto == "https:":
             import ussl
-            port = 443
-        else:
-            raise ValueError("Unsupported protocol: " + proto)
-
-        if ":" in host:
-            host, port = host.split(":", 1)
-            port = int(port)
 
         if auth is not None:
             req = Request()
@@ -74,12 +246,14 @@ def request(method, url, data=None, json=None, headers={}, auth=None, stream=Non
             req = auth(req)
             headers = req.headers
 
-        ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
+        ai = getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
         ai = ai[0]
 
         resp_d = None
         if parse_headers is not False:
             resp_d = {}
+        chunked = False
+        enc = None
 
         s = usocket.socket(ai[0], ai[1], ai[2])
         try:
@@ -118,8 +292,9 @@ def request(method, url, data=None, json=None, headers={}, auth=None, stream=Non
                 #print(l)
 
                 if l.startswith(b"Transfer-Encoding:"):
-                    if b"chunked" in l:
-                        raise ValueError("Unsupported " + l.decode())
+                    chunked = b"chunked" in l
+                elif l.startswith(b"Content-Encoding:"):
+                    enc = l[17:].strip()
                 elif l.startswith(b"Location:") and 300 <= status <= 399:
                     if not redir_cnt:
                         raise ValueError("Too many redirects")
@@ -144,7 +319,11 @@ def request(method, url, data=None, json=None, headers={}, auth=None, stream=Non
         if status != 300:
             break
 
+    if chunked:
+        s = _ChunkedReader(s, _close)
     resp = Response(s)
+    if enc:
+        resp._decode(enc)
     resp.status_code = status
     resp.reason = reason
     if resp_d is not None:
@@ -169,3 +348,248 @@ def patch(url, **kw):
 
 def delete(url, **kw):
     return request("DELETE", url, **kw)
+
+
+class Session:
+    """Keeps HTTP/1.1 connections alive between requests, and reuses them
+    for further requests to the same (scheme, host, port). A connection
+    is returned to the pool once the response body is read completely.
+    Up to max_conns idle connections are kept, and each is closed after
+    being idle for idle_timeout seconds. Note that max_conns limits only
+    the idle ones: connections of responses whose body wasn't read yet
+    aren't counted, so with several such responses outstanding, more
+    connections may be open at once."""
+
+    def __init__(self, max_conns=4, idle_timeout=30):
+        self.headers = {}
+        self.auth = None
+        self.max_conns = max_conns
+        self.idle_timeout = idle_timeout
+        self.ssl_ctx = None
+        # Idle connections as (key, sock, last_used_ms), most recently
+        # used last.
+        self.idle = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        while self.idle:
+            self.idle.pop()[1].close()
+
+    def _expire(self):
+        idle = self.idle
+        now = utime.ticks_ms()
+        tmo = self.idle_timeout * 1000
+        while idle and utime.ticks_diff(now, idle[0][2]) >= tmo:
+            idle.pop(0)[1].close()
+
+    def _get(self, key):
+        self._expire()
+        idle = self.idle
+        for i in range(len(idle) - 1, -1, -1):
+            if idle[i][0] == key:
+                return idle.pop(i)[1]
+        return None
+
+    def _put(self, key, s):
+        idle = self.idle
+        idle.append((key, s, utime.ticks_ms()))
+        self._expire()
+        if len(idle) > self.max_conns:
+            idle.pop(0)[1].close()
+
+    def _connect(self, proto, host, port):
+        ai = getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
+        ai = ai[0]
+        s = usocket.socket(ai[0], ai[1], ai[2])
+        try:
+            s.connect(ai[-1])
+            if proto == "https:":
+                if self.ssl_ctx is None:
+                    import ussl
+                    self.ssl_ctx = ussl.SSLContext()
+                s = self.ssl_ctx.wrap_socket(s, server_hostname=host)
+        except OSError:
+            s.close()
+            raise
+        return s
+
+    @staticmethod
+    def _send(s, req, data):
+        s.write(req)
+        if data:
+            s.write(data)
+        return s.readline()
+
+    def request(self, method, url, data=None, json=None, headers={}, auth=None, parse_headers=True):
+        redir_cnt = 1
+        if json is not None:
+            assert data is None
+            import ujson
+            data = ujson.dumps(json)
+        if auth is None:
+            auth = self.auth
+        if self.headers:
+            h = self.headers.copy()
+            h.update(headers)
+            headers = h
+
+        while True:
+            proto, host, port, path = _parse_url(url)
+            key = (proto, host, port)
+
+            if auth is not None:
+                req = Request()
+                req.method = method
+                req.url = url
+                req.headers = headers.copy()
+                req = auth(req)
+                headers = req.headers
+
+            # Whole request head is sent with one write, to avoid small
+            # packets (or SSL records).
+            req = [_b(method), b" /", _b(path), b" HTTP/1.1\r\n"]
+            if not "Host" in headers:
+                req.append(b"Host: %s\r\n" % _b(host))
+            for k in headers:
+                req += (_b(k), b": ", _b(headers[k]), b"\r\n")
+            if json is not None:
+                req.append(b"Content-Type: application/json\r\n")
+            if data:
+                req.append(b"Content-Length: %d\r\n" % len(data))
+            req.append(b"\r\n")
+            req = b"".join(req)
+
+            s = self._get(key)
+            l = None
+            if s is not None:
+                try:
+                    l = self._send(s, req, data)
+                except OSError:
+                    pass
+                if not l:
+                    # Server closed idle connection meanwhile, retry
+                    # with a new one.
+                    s.close()
+                    s = None
+            if s is None:
+                s = self._connect(proto, host, port)
+
+            resp_d = None
+            if parse_headers is not False:
+                resp_d = {}
+
+            try:
+                if l is None:
+                    l = self._send(s, req, data)
+                while True:
+                    l = l.split(None, 2)
+                    status = int(l[1])
+                    if status >= 200 or status == 101:
+                        break
+                    # Interim response (e.g. 100 Continue), skip it
+                    while True:
+                        l = s.readline()
+                        if not l or l == b"\r\n":
+                            break
+                    l = s.readline()
+                reason = ""
+                if len(l) > 2:
+                    reason = l[2].rstrip()
+                keep = l[0] != b"HTTP/1.0"
+                length = None
+                chunked = False
+                enc = None
+                location = None
+                while True:
+                    l = s.readline()
+                    if not l or l == b"\r\n":
+                        break
+                    lc = l.lower()
+                    if lc.startswith(b"content-length:"):
+                        length = int(l[15:])
+                    elif lc.startswith(b"transfer-encoding:"):
+                        chunked = b"chunked" in lc
+                    elif lc.startswith(b"content-encoding:"):
+                        enc = lc[17:].strip()
+                    elif lc.startswith(b"connection:"):
+                        if b"close" in lc:
+                            keep = False
+                        elif b"keep-alive" in lc:
+                            keep = True
+                    elif lc.startswith(b"location:") and 300 <= status <= 399:
+                        location = l[9:].decode().strip()
+
+                    if parse_headers is False:
+                        pass
+                    elif parse_headers is True:
+                        l = l.decode()
+                        k, v = l.split(":", 1)
+                        resp_d[k] = v.strip()
+                    else:
+                        parse_headers(l, resp_d)
+            except (OSError, ValueError, IndexError):
+                s.close()
+                raise
+
+            if keep:
+                done = lambda s: self._put(key, s)
+            else:
+                done = _close
+            if status == 101:
+                # Switching protocols: the connection now speaks another
+                # protocol, so it's handed over to the caller as is, and
+                # never goes back to the pool.
+                raw = s
+            elif method == "HEAD" or status in (204, 304) or status < 200:
+                raw = _LengthReader(s, 0, done)
+            elif chunked:
+                raw = _ChunkedReader(s, done)
+            elif length is not None:
+                raw = _LengthReader(s, length, done)
+            else:
+                # Body is delimited by connection close
+                raw = s
+
+            if location is None:
+                break
+            if not redir_cnt:
+                raw.close()
+                raise ValueError("Too many redirects")
+            redir_cnt -= 1
+            # Read away body of the redirect response, so the connection
+            # can be reused.
+            raw.read()
+            raw.close()
+            url = location
+
+        resp = Response(raw)
+        if enc:
+            resp._decode(enc)
+        resp.status_code = status
+        resp.reason = reason
+        if resp_d is not None:
+            resp.headers = resp_d
+        return resp
+
+    def head(self, url, **kw):
+        return self.request("HEAD", url, **kw)
+
+    def get(self, url, **kw):
+        return self.request("GET", url, **kw)
+
+    def post(self, url, **kw):
+        return self.request("POST", url, **kw)
+
+    def put(self, url, **kw):
+        return self.request("PUT", url, **kw)
+
+    def patch(self, url, **kw):
+        return self.request("PATCH", url, **kw)
+
+    def delete(self, url, **kw):
+        return self.request("DELETE", url, **kw)
@@ -1,4 +1,8 @@
 import usocket
+try:
+    from udnscache import getaddrinfo
+except ImportError:
+    from usocket import getaddrinfo
 
 def urlopen(url, data=None, method="GET"):
     if data is not None and method == "GET":
@@ -20,7 +24,7 @@ def urlopen(url, data=None, method="GET"):
         host, port = host.split(":", 1)
         port = int(port)
 
-    ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
+    ai = getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
     ai = ai[0]
 
     s = usocket.socket(ai[0], ai[1], ai[2])
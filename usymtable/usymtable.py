@@ -442,6 +442,9 @@ class SymbolTableBuilder(ast.NodeVisitor):
     def visit_ClassDef(self, node):
         self.symtab.add_assign(node.name)
         self.new_scope(node, "class")
+        # Set implicitly by class body code
+        self.symtab.add_assign("__module__")
+        self.symtab.add_assign("__qualname__")
         self._visit_suite(node.body)
         self.pop_scope()
 
@@ -0,0 +1,75 @@
+# Iterate over a large synthetic tarball, skipping or reading all entries,
+# from a seekable file and from a non-seekable stream (like uzlib.DecompIO
+# or a socket), with different buffer sizes.
+#
+# pycopy bench_skip.py [ENTRIES] [ENTRY_KB]
+import sys
+import utime
+import utarfile
+
+
+ENTRIES = 16
+ENTRY_KB = 1024
+if len(sys.argv) > 1:
+    ENTRIES = int(sys.argv[1])
+if len(sys.argv) > 2:
+    ENTRY_KB = int(sys.argv[2])
+
+FNAME = "/tmp/bench_skip.tar"
+
+
+class Stream:
+    # Non-seekable wrapper
+
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, sz):
+        return self.f.read(sz)
+
+    def readinto(self, *args):
+        return self.f.readinto(*args)
+
+
+def make_tar():
+    data = bytearray(1024)
+    with open(FNAME, "wb") as f:
+        for i in range(ENTRIES):
+            hdr = bytearray(512)
+            name = b"file%d" % i
+            hdr[0:len(name)] = name
+            size = b"%011o" % (ENTRY_KB * 1024)
+            hdr[124:124 + len(size)] = size
+            f.write(hdr)
+            for j in range(ENTRY_KB):
+                f.write(data)
+        f.write(bytearray(1024))
+
+
+def run(name, seekable, bufsz, extract):
+    raw = f = open(FNAME, "rb")
+    if not seekable:
+        f = Stream(raw)
+    t = utarfile.TarFile(fileobj=f, buf=bytearray(bufsz))
+    buf = bytearray(bufsz)
+    n = 0
+    t0 = utime.ticks_ms()
+    for i in t:
+        if extract:
+            subf = t.extractfile(i)
+            while subf.readinto(buf):
+                pass
+        n += 1
+    t1 = utime.ticks_ms()
+    raw.close()
+    assert n == ENTRIES
+    print("%-32s %6dms" % (name, utime.ticks_diff(t1, t0)))
+
+
+make_tar()
+print("%d entries of %dKB" % (ENTRIES, ENTRY_KB))
+run("skip, seek", True, 16, False)
+run("skip, readinto 16 bytes", False, 16, False)
+run("skip, readinto %d bytes" % utarfile.BUFSIZE, False, utarfile.BUFSIZE, False)
+run("extract, readinto 512 bytes", True, 512, True)
+run("extract, readinto 16384 bytes", True, 16384, True)
@@ -0,0 +1,10 @@
+import sys
+import utarfile
+
+# Archive files/directories given on command line to stdout, streaming
+# (try "pycopy example-create.py dir | tar tvf -"). To compress on the
+# fly, pass comp=zlib.compressobj(9, zlib.DEFLATED, 16 + 12) (where such
+# a compressor is available).
+with utarfile.TarWriter(fileobj=sys.stdout.buffer) as t:
+    for fname in sys.argv[1:]:
+        t.add(fname)
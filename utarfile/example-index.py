@@ -0,0 +1,13 @@
+import sys
+import utarfile
+
+# Extract a single member of a large archive without scanning it. On first
+# run, index of the archive is built and saved to <archive>.idx, further
+# runs seek to the member's data directly.
+t = utarfile.TarFile(sys.argv[1])
+f = t.extractfile(sys.argv[2])
+while True:
+    data = f.read(4096)
+    if not data:
+        break
+    sys.stdout.write(data)
@@ -0,0 +1,105 @@
+import uos
+import utarfile
+
+
+FNAME = "/tmp/utarfile-test-index.tar"
+IDX = FNAME + ".idx"
+
+
+def content(i):
+    return b"content %d " % i * (i * 100 + 1)
+
+
+def make(n, fmt="dir/f%d"):
+    with utarfile.TarWriter(FNAME) as w:
+        for i in range(n):
+            data = content(i)
+            w.addfile(fmt % i, len(data), [data], mtime=0)
+
+
+def remove(fname):
+    try:
+        uos.remove(fname)
+    except OSError:
+        pass
+
+
+names = ["dir/f%d" % i for i in range(10)]
+make(10)
+remove(IDX)
+
+# Index is built and saved on first getmember(), iteration still starts
+# from the beginning after that
+t = utarfile.TarFile(FNAME)
+m = t.getmember("dir/f7")
+assert m.size == len(content(7))
+assert uos.stat(IDX)[6] > 0
+assert [d.name for d in t] == names
+t.f.close()
+
+# getmember() in the middle of iteration doesn't end it, and the current
+# member can still be read
+remove(IDX)
+t = utarfile.TarFile(FNAME)
+seen = []
+for d in t:
+    seen.append(d.name)
+    if d.name == "dir/f2":
+        f = t.extractfile(d)
+        data = f.read(5)
+        m = t.getmember("dir/f8")
+        assert m.offset_data > d.offset_data
+        assert data + f.read() == content(2)
+assert seen == names, seen
+t.f.close()
+
+# Index side file is used by a new TarFile
+t = utarfile.TarFile(FNAME)
+assert t.load_index()
+assert t.extractfile("dir/f9").read() == content(9)
+assert t.extractfile(t.getmember("dir/f0")).read() == content(0)
+try:
+    t.getmember("dir/none")
+    assert False
+except KeyError:
+    pass
+t.f.close()
+
+# Index of an archive which changed since is stale and not used, but
+# rebuilt and saved again
+make(12)
+t = utarfile.TarFile(FNAME)
+assert not t.load_index()
+assert t.extractfile("dir/f11").read() == content(11)
+t.f.close()
+t = utarfile.TarFile(FNAME)
+assert t.load_index()
+assert "dir/f11" in t.index
+t.f.close()
+
+# Archive rewritten with the same size (likely within the same second,
+# so with the same mtime) isn't mistaken for the indexed one
+make(12, "dir/g%d")
+t = utarfile.TarFile(FNAME)
+assert not t.load_index()
+assert "dir/g11" in t.build_index()
+t.save_index()
+t.f.close()
+
+# Names up to 256 bytes long (with ustar prefix) are stored in index
+LONG = "p" * 155 + "/" + "n" * 98 + "f%d"
+make(3, LONG)
+t = utarfile.TarFile(FNAME)
+t.build_index()
+t.save_index()
+t.f.close()
+t = utarfile.TarFile(FNAME)
+assert t.load_index()
+assert sorted(t.index) == [LONG % i for i in range(3)]
+assert len(LONG % 2) == 256
+assert t.extractfile(LONG % 2).read() == content(2)
+t.f.close()
+
+remove(FNAME)
+remove(IDX)
+print("OK")
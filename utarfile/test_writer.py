@@ -0,0 +1,89 @@
+import uio
+import uos
+import utarfile
+
+
+# Name longer than 100 chars goes into ustar prefix field
+LONG = "pkg/" + "d" * 120 + "/module_with_long_name.py"
+DATA = b"0123456789" * 1000
+
+
+def members(buf):
+    t = utarfile.TarFile(fileobj=uio.BytesIO(buf))
+    res = []
+    for d in t:
+        res.append((d.name, d.type, d.size, t.extractfile(d).read()))
+    return res
+
+
+out = uio.BytesIO()
+with utarfile.TarWriter(fileobj=out) as w:
+    w.adddir("pkg", mtime=0)
+    w.addfile("pkg/a.py", len(DATA), uio.BytesIO(DATA), mtime=0)
+    w.addfile("pkg/b.txt", 11, [b"hello ", b"world"], mtime=0)
+    w.addfile("pkg/empty", 0, [], mtime=0)
+    w.addfile(LONG, 3, [b"abc"], mtime=0)
+buf = out.getvalue()
+assert len(buf) % 512 == 0
+
+assert members(buf) == [
+    ("pkg/", utarfile.DIRTYPE, 0, b""),
+    ("pkg/a.py", utarfile.REGTYPE, len(DATA), DATA),
+    ("pkg/b.txt", utarfile.REGTYPE, 11, b"hello world"),
+    ("pkg/empty", utarfile.REGTYPE, 0, b""),
+    (LONG, utarfile.REGTYPE, 3, b"abc"),
+], members(buf)
+
+# Name limits are in bytes: this one is under 100 chars, but not bytes
+UNAME = "\u00e9" * 40 + "/" + "\u00fc" * 45
+out = uio.BytesIO()
+with utarfile.TarWriter(fileobj=out) as w:
+    w.addfile(UNAME, 2, [b"ok"], mtime=0)
+assert members(out.getvalue()) == [(UNAME, utarfile.REGTYPE, 2, b"ok")]
+try:
+    utarfile.TarWriter(fileobj=uio.BytesIO()).addfile("\u00e9" * 51, 0, [])
+    assert False
+except ValueError:
+    pass
+
+# Directory from filesystem, arcname with trailing slash
+DIR = "/tmp/utarfile-test-writer"
+try:
+    uos.mkdir(DIR)
+except OSError:
+    pass
+with open(DIR + "/f", "wb") as f:
+    f.write(b"data")
+out = uio.BytesIO()
+with utarfile.TarWriter(fileobj=out) as w:
+    w.add(DIR + "/", "arc/")
+assert [m[0] for m in members(out.getvalue())] == ["arc/", "arc/f"]
+uos.remove(DIR + "/f")
+uos.rmdir(DIR)
+
+# Name which can't be split to fit
+try:
+    utarfile.TarWriter(fileobj=uio.BytesIO()).addfile("x" * 101, 0, [])
+    assert False
+except ValueError:
+    pass
+
+# On size mismatch, member is still written with declared size, so the
+# rest of archive is readable
+out = uio.BytesIO()
+w = utarfile.TarWriter(fileobj=out)
+for name, chunks in (("short", [b"ab"]), ("long", [b"abcd", b"efgh"])):
+    try:
+        w.addfile(name, 5, chunks, mtime=0)
+        assert False
+    except ValueError:
+        pass
+w.addfile("next", 2, [b"ok"], mtime=0)
+w.close()
+assert members(out.getvalue()) == [
+    ("short", utarfile.REGTYPE, 5, b"ab\0\0\0"),
+    ("long", utarfile.REGTYPE, 5, b"abcde"),
+    ("next", utarfile.REGTYPE, 2, b"ok"),
+]
+
+print("OK")
@@ -1,21 +1,35 @@
 import uctypes
+import ustruct
 
 # http://www.gnu.org/software/tar/manual/html_node/Standard.html
 TAR_HEADER = {
     "name": (uctypes.ARRAY | 0, uctypes.UINT8 | 100),
     "size": (uctypes.ARRAY | 124, uctypes.UINT8 | 11),
+    "magic": (uctypes.ARRAY | 257, uctypes.UINT8 | 6),
+    "prefix": (uctypes.ARRAY | 345, uctypes.UINT8 | 155),
 }
 
 DIRTYPE = "dir"
 REGTYPE = "file"
 
+# Size of buffer used to skip entries in non-seekable streams
+BUFSIZE = 4096
+
+# Index side file: header is magic, archive size and mtime, followed by
+# entries of header offset, data offset, size, name length and name.
+INDEX_MAGIC = b"UTX2"
+INDEX_HDR = "<4sIII"
+# Name length is 16-bit, as name with ustar prefix is up to 256 bytes
+INDEX_ENTRY = "<IIIH"
+
 def roundup(val, align):
     return (val + align - 1) & ~(align - 1)
 
 class FileSection:
 
-    def __init__(self, f, content_len, aligned_len):
+    def __init__(self, f, content_len, aligned_len, tar=None):
         self.f = f
+        self.tar = tar
         self.content_len = content_len
         self.align = aligned_len - content_len
 
@@ -41,11 +55,11 @@ class FileSection:
     def skip(self):
         sz = self.content_len + self.align
         if sz:
-            buf = bytearray(16)
-            while sz:
-                s = min(sz, 16)
-                self.f.readinto(buf, s)
-                sz -= s
+            if self.tar:
+                self.tar._skip(sz)
+            else:
+                TarFile._skip_read(self.f, bytearray(min(sz, BUFSIZE)), sz)
+            self.content_len = self.align = 0
 
 class TarInfo:
 
@@ -54,12 +68,44 @@ class TarInfo:
 
 class TarFile:
 
-    def __init__(self, name=None, fileobj=None):
+    def __init__(self, name=None, fileobj=None, buf=None):
         if fileobj:
             self.f = fileobj
         else:
             self.f = open(name, "rb")
+        self.name = name
         self.subf = None
+        # Offset of next header (relative to start of archive)
+        self.off = 0
+        # name -> (header offset, data offset, size), see build_index()
+        self.index = None
+        # Buffer for skipping (may be shared with the caller), allocated
+        # on first use if not given
+        self.buf = buf
+        # Whether f.seek() works, None until first tried
+        self.seekable = None
+
+    def _skip(self, sz):
+        if self.seekable is not False:
+            try:
+                self.f.seek(sz, 1)
+                self.seekable = True
+                return
+            except (AttributeError, OSError):
+                self.seekable = False
+        if self.buf is None:
+            self.buf = bytearray(BUFSIZE)
+        self._skip_read(self.f, self.buf, sz)
+
+    @staticmethod
+    def _skip_read(f, buf, sz):
+        bufsz = len(buf)
+        while sz:
+            s = min(sz, bufsz)
+            s = f.readinto(buf, s)
+            if not s:
+                break
+            sz -= s
 
     def next(self):
             if self.subf:
@@ -74,13 +120,27 @@ class TarFile:
             if h.name[0] == 0:
                 return None
 
-            d = TarInfo()
-            d.name = str(h.name, "utf-8").rstrip("\0")
-            d.size = int(bytes(h.size), 8)
-            d.type = [REGTYPE, DIRTYPE][d.name[-1] == "/"]
-            self.subf = d.subf = FileSection(self.f, d.size, roundup(d.size, 512))
+            name = str(h.name, "utf-8").rstrip("\0")
+            # ustar format splits long names into prefix and name
+            if h.prefix[0] and bytes(h.magic) == b"ustar\0":
+                name = str(h.prefix, "utf-8").rstrip("\0") + "/" + name
+            d = self._info(name, self.off, self.off + 512, int(bytes(h.size), 8))
+            aligned = roundup(d.size, 512)
+            self.off += 512 + aligned
+            self.subf = d.subf = FileSection(self.f, d.size, aligned, self)
             return d
 
+    @staticmethod
+    def _info(name, offset, offset_data, size):
+        d = TarInfo()
+        d.name = name
+        d.size = size
+        d.type = [REGTYPE, DIRTYPE][name[-1] == "/"]
+        d.offset = offset
+        d.offset_data = offset_data
+        d.subf = None
+        return d
+
     def __iter__(self):
         return self
 
@@ -91,4 +151,239 @@ class TarFile:
         return v
 
     def extractfile(self, tarinfo):
+        # tarinfo may be a member name or TarInfo from getmember(), then
+        # file is seeked to its data directly. Sequential iteration can't
+        # be continued after that.
+        if isinstance(tarinfo, str):
+            tarinfo = self.getmember(tarinfo)
+        if tarinfo.subf is None:
+            self.f.seek(tarinfo.offset_data)
+            self.subf = None
+            tarinfo.subf = FileSection(self.f, tarinfo.size, roundup(tarinfo.size, 512), self)
         return tarinfo.subf
+
+    def build_index(self):
+        # Scan the whole (seekable) archive, recording member offsets.
+        # Position of sequential iteration is preserved.
+        pos = self.f.tell()
+        off = self.off
+        subf = self.subf
+        self.f.seek(0)
+        self.off = 0
+        self.subf = None
+        index = {}
+        try:
+            for d in self:
+                index[d.name] = (d.offset, d.offset_data, d.size)
+        finally:
+            self.f.seek(pos)
+            self.off = off
+            self.subf = subf
+        self.index = index
+        return index
+
+    def _stat(self):
+        # Archive size, mtime and sum of the first header bytes, to detect
+        # stale index. mtime has 1s resolution, so an archive rewritten
+        # with the same size within a second is told apart only if its
+        # first header differs.
+        pos = self.f.tell()
+        self.f.seek(0)
+        hsum = sum(self.f.read(512))
+        if self.name:
+            import uos
+            st = uos.stat(self.name)
+            size, mtime = st[6], st[8]
+        else:
+            size = self.f.seek(0, 2)
+            mtime = 0
+        self.f.seek(pos)
+        return size, mtime, hsum
+
+    def save_index(self, fname=None):
+        if fname is None:
+            fname = self.name + ".idx"
+        if self.index is None:
+            self.build_index()
+        size, mtime, hsum = self._stat()
+        with open(fname, "wb") as f:
+            f.write(ustruct.pack(INDEX_HDR, INDEX_MAGIC, size, mtime, hsum))
+            for name, e in self.index.items():
+                name = name.encode()
+                f.write(ustruct.pack(INDEX_ENTRY, e[0], e[1], e[2], len(name)))
+                f.write(name)
+
+    def load_index(self, fname=None):
+        # Returns False if there's no index file, or it's stale
+        if fname is None:
+            fname = self.name + ".idx"
+        try:
+            with open(fname, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        hdr_sz = ustruct.calcsize(INDEX_HDR)
+        if len(data) < hdr_sz:
+            return False
+        magic, size, mtime, hsum = ustruct.unpack_from(INDEX_HDR, data)
+        if magic != INDEX_MAGIC or (size, mtime, hsum) != self._stat():
+            return False
+        entry_sz = ustruct.calcsize(INDEX_ENTRY)
+        index = {}
+        i = hdr_sz
+        while i < len(data):
+            hdr_off, data_off, size, n = ustruct.unpack_from(INDEX_ENTRY, data, i)
+            i += entry_sz
+            index[str(data[i:i + n], "utf-8")] = (hdr_off, data_off, size)
+            i += n
+        self.index = index
+        return True
+
+    def getmember(self, name):
+        # Uses index side file if it's up to date, otherwise builds index
+        # (and saves it if archive was opened by name).
+        if self.index is None:
+            if not self.name or not self.load_index():
+                self.build_index()
+                if self.name:
+                    try:
+                        self.save_index()
+                    except OSError:
+                        pass
+        e = self.index[name]
+        return self._info(name, e[0], e[1], e[2])
+
+
+class TarWriter:
+    """Write a ustar archive as a stream: each member's header and data are
+    written to fileobj (e.g. a socket) as they're produced, with nothing
+    buffered beyond one chunk. If comp is given, all output is passed
+    through it, comp being a compressor object with compress() and flush()
+    methods (like zlib.compressobj())."""
+
+    def __init__(self, name=None, fileobj=None, comp=None, buf=None):
+        if fileobj:
+            self.f = fileobj
+            self.own = False
+        else:
+            self.f = open(name, "wb")
+            self.own = True
+        self.comp = comp
+        self.buf = buf
+
+    def _write(self, data):
+        if self.comp:
+            data = self.comp.compress(data)
+            if not data:
+                return
+        self.f.write(data)
+
+    def _header(self, name, size, mode, mtime, typeflag):
+        # Field sizes are in bytes, not chars
+        bname = name.encode()
+        prefix = b""
+        if len(bname) > 100:
+            i = bname.rfind(b"/", 0, 156)
+            if i < 0 or len(bname) - i - 1 > 100:
+                raise ValueError("name too long: " + name)
+            prefix = bname[:i]
+            bname = bname[i + 1:]
+        if mtime is None:
+            import utime
+            mtime = int(utime.time())
+        hdr = bytearray(512)
+
+        def put(off, val):
+            if isinstance(val, str):
+                val = val.encode()
+            hdr[off:off + len(val)] = val
+
+        put(0, bname)
+        put(100, "%07o" % mode)
+        put(108, "%07o" % 0)
+        put(116, "%07o" % 0)
+        put(124, "%011o" % size)
+        put(136, "%011o" % mtime)
+        put(148, b"        ")
+        put(156, typeflag)
+        put(257, b"ustar\x0000")
+        put(345, prefix)
+        put(148, "%06o\0" % sum(hdr))
+        self._write(hdr)
+
+    def _pad(self, size):
+        pad = roundup(size, 512) - size
+        if pad:
+            self._write(bytes(pad))
+
+    def adddir(self, name, mode=0o755, mtime=None):
+        if name[-1] != "/":
+            name += "/"
+        self._header(name, 0, mode, mtime, b"5")
+
+    def addfile(self, name, size, data, mode=0o644, mtime=None):
+        # data is a file-like object, from which exactly size bytes are
+        # read, or an iterable of chunks of size bytes in total. If data
+        # has less or more than that, ValueError is raised, but only after
+        # member is written (truncated or padded with zeros) to the
+        # declared size, so the archive stays readable.
+        self._header(name, size, mode, mtime, b"0")
+        left = size
+        if hasattr(data, "readinto"):
+            if self.buf is None:
+                self.buf = bytearray(BUFSIZE)
+            buf = self.buf
+            mv = memoryview(buf)
+            while left:
+                n = data.readinto(buf, min(left, len(buf)))
+                if not n:
+                    break
+                self._write(mv[:n])
+                left -= n
+        else:
+            for chunk in data:
+                if len(chunk) > left:
+                    self._write(chunk[:left])
+                    self._pad(size)
+                    raise ValueError("more data than size for " + name)
+                self._write(chunk)
+                left -= len(chunk)
+        if left:
+            zeros = bytes(min(left, BUFSIZE))
+            while left:
+                n = min(left, len(zeros))
+                self._write(zeros[:n])
+                left -= n
+            self._pad(size)
+            raise ValueError("less data than size for " + name)
+        self._pad(size)
+
+    def add(self, fname, arcname=None):
+        # Add a file or (recursively) a directory from filesystem
+        import uos
+        if arcname is None:
+            arcname = fname
+        st = uos.stat(fname)
+        if st[0] & 0o170000 == 0o040000:
+            self.adddir(arcname, st[0] & 0o7777, st[8])
+            fname = fname.rstrip("/")
+            arcname = arcname.rstrip("/")
+            for e in uos.ilistdir(fname or "/"):
+                self.add(fname + "/" + e[0], arcname + "/" + e[0])
+        else:
+            with open(fname, "rb") as f:
+                self.addfile(arcname, st[6], f, st[0] & 0o7777, st[8])
+
+    def close(self):
+        # End of archive is two zero blocks
+        self._write(bytes(1024))
+        if self.comp:
+            self.f.write(self.comp.flush())
+        if self.own:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,4 +1,8 @@
 import usocket
+try:
+    from udnscache import getaddrinfo
+except ImportError:
+    from usocket import getaddrinfo
 
 class Response:
 
@@ -52,7 +56,7 @@ def request(method, url, data=None, json=None, headers={}, stream=None, parse_he
             host, port = host.split(":", 1)
             port = int(port)
 
-        ai = usocket.getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
+        ai = getaddrinfo(host, port, 0, usocket.SOCK_STREAM)
         ai = ai[0]
 
         resp_d = None